@@ -1,7 +1,17 @@
+import re
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.forms import UserChangeForm, UserCreationForm
 from .models import CustomUser
+from .validators import normalize_phone_number
+from quicksign.utils.pagination import EstimatedCountPaginator
+
+# Digits, optionally after a +: searched as a phone number prefix
+PHONE_SEARCH_RE = re.compile(r"\+?\d+")
+# Country code or trunk prefix typed before the national number
+PHONE_PREFIX_RE = re.compile(r"^(?:\+98|0098|98|0)")
+NATIONAL_NUMBER_LENGTH = 10
 
 
 class CustomUserChangeForm(UserChangeForm):
@@ -23,8 +33,13 @@ class CustomUserAdmin(UserAdmin):
 
     list_display = ('phone_number', 'email', 'first_name', 'last_name', 'is_staff')
     list_filter = ('is_staff', 'is_active', 'created_at')
-    search_fields = ('phone_number', 'email', 'first_name', 'last_name')
+    # icontains, served by the trigram indexes; phone numbers are searched
+    # by prefix in get_search_results
+    search_fields = ('email', 'first_name', 'last_name')
     ordering = ('-created_at',)
+    paginator = EstimatedCountPaginator
+    # Skip the second COUNT(*) of the whole table on filtered pages
+    show_full_result_count = False
 
     fieldsets = (
         (None, {'fields': ('phone_number', 'password')}),
@@ -40,4 +55,24 @@ class CustomUserAdmin(UserAdmin):
             'classes': ('wide',),
             'fields': ('phone_number', 'email', 'first_name', 'last_name', 'password1', 'password2'),
         }),
-    )
\ No newline at end of file
+    )
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not PHONE_SEARCH_RE.fullmatch(term):
+            return super().get_search_results(request, queryset, search_term)
+
+        phone_number = normalize_phone_number(term)
+        if phone_number is not None:
+            return queryset.filter(phone_number=phone_number), False
+
+        # Stored national numbers starting with the typed digits form one
+        # range of the unique index
+        national = PHONE_PREFIX_RE.sub("", term)
+        if not national.startswith("9") or len(national) > NATIONAL_NUMBER_LENGTH:
+            return queryset.none(), False
+        scale = 10 ** (NATIONAL_NUMBER_LENGTH - len(national))
+        return queryset.filter(
+            phone_number__gte=int(national) * scale,
+            phone_number__lt=(int(national) + 1) * scale
+        ), False
@@ -0,0 +1,242 @@
+import logging
+import math
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth import aauthenticate
+from django.db import IntegrityError
+from django.http import JsonResponse
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from rest_framework import serializers, status
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import FormParser, JSONParser, MultiPartParser
+from rest_framework.request import Request
+
+from .models import CustomUser
+from .serializers import (PhoneNumberCheckSerializer,
+                          UserLoginSerializer,
+                          UserRegisterSerializer,
+                          UserProfileSerializer)
+from .throttles import PhoneCheckThrottle, LoginThrottle, RegisterThrottle
+from quicksign.utils import hashing
+from quicksign.utils.hashing import HashingPoolSaturated
+from quicksign.utils.idempotency import AsyncIdempotencyMixin, issues_tokens
+from quicksign.utils.replicas import StickyReads, use_primary
+from quicksign.utils.services import BlockService, get_token_for_user, OTPService, PhoneRegistry
+
+logger = logging.getLogger(__name__)
+
+
+def service_busy_response(exc):
+    return JsonResponse(
+        {
+            "code": "service_busy",
+            "detail": "Server is busy, please retry shortly"
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
+class AsyncAPIView(View):
+    """
+    Async counterpart of APIView for the hot, unauthenticated users endpoints.
+
+    The body is parsed with DRF parsers and the same GCRA throttles apply,
+    but every Redis call, query and password hash is awaited, so a single
+    ASGI worker serves many requests concurrently. Responses are plain JSON
+    with the same payloads as the sync views.
+    """
+    throttle_classes = []
+    parser_classes = [JSONParser, FormParser, MultiPartParser]
+
+    @classmethod
+    def as_view(cls, **initkwargs):
+        return csrf_exempt(super().as_view(**initkwargs))
+
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request, parsers=[parser() for parser in self.parser_classes])
+        try:
+            for throttle in [throttle_class() for throttle_class in self.throttle_classes]:
+                if not await throttle.aallow_request(request, self):
+                    wait = math.ceil(throttle.wait())
+                    return JsonResponse(
+                        {"detail": f"Request was throttled. Expected available in {wait} seconds."},
+                        status=status.HTTP_429_TOO_MANY_REQUESTS,
+                        headers={"Retry-After": str(wait)}
+                    )
+            return await super().dispatch(request, *args, **kwargs)
+        except ParseError as e:
+            return JsonResponse({"detail": str(e.detail)}, status=status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncPhoneNumberCheckView(AsyncAPIView):
+    """
+    Async version of PhoneNumberCheckView.
+    """
+    throttle_classes = [PhoneCheckThrottle]
+
+    async def post(self, request, *args, **kwargs):
+        ip_address = request.META.get('REMOTE_ADDR')
+
+        serializer = PhoneNumberCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        phone_number = serializer.validated_data["phone_number"]
+
+        block_status = await BlockService.aget_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            remaining_minutes = block_status.block_time_left // 60
+            return JsonResponse(
+                {
+                    "code": "Account_temporarily_blocked.",
+                    "detail": "Account temporarily blocked due to too many attempts",
+                    "remaining_time": f"{remaining_minutes} minutes"
+                },
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        user_id = None
+        if await PhoneRegistry.amight_be_registered(phone_number) is not False:
+            with use_primary(await StickyReads.ais_sticky(phone_number)):
+                user_id = await CustomUser.objects.filter(phone_number=phone_number).values_list("id", flat=True).afirst()
+
+        if user_id is not None:
+            return JsonResponse(
+                {
+                    "status": "registered",
+                    "phone_number": phone_number,
+                    "message": f"User {phone_number} needs to login",
+                    "user_id": user_id
+                },
+                status=status.HTTP_200_OK
+            )
+
+        otp_response = await OTPService.asend_otp_code(phone_number)
+        return JsonResponse(
+            {
+                "status": "not_registered",
+                "phone_number": phone_number,
+                **otp_response
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+
+class AsyncUserLoginView(AsyncIdempotencyMixin, AsyncAPIView):
+    """
+    Async version of UserLoginView.
+    """
+    throttle_classes = [LoginThrottle]
+    idempotency_scope = "login"
+
+    async def post(self, request, *args, **kwargs):
+        ip_address = request.META.get('REMOTE_ADDR')
+
+        serializer = UserLoginSerializer(data=request.data)
+        if not serializer.is_valid():
+            return JsonResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        phone_number = serializer.validated_data["phone_number"]
+        password = serializer.validated_data["password"]
+
+        block_status = await BlockService.aget_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            remaining_minutes = block_status.block_time_left // 60
+            return JsonResponse(
+                {
+                    'detail': 'Account temporarily blocked due to too many attempts',
+                    'remaining_time': f'{remaining_minutes} minutes'
+                },
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            with use_primary(await StickyReads.ais_sticky(phone_number)):
+                user = await aauthenticate(phone_number=phone_number, password=password)
+        except HashingPoolSaturated as e:
+            return service_busy_response(e)
+
+        if not user:
+            attempt = await BlockService.arecord_failed_attempt(phone_number, ip_address)
+            remaining_attempts = max(0, BlockService.max_attempts - attempt.attempts)
+            return JsonResponse(
+                {
+                    'detail': 'Invalid credentials',
+                    'remaining_attempts': remaining_attempts,
+                    'message': f'Account will be blocked after {remaining_attempts} more failed attempts' if not attempt.is_blocked else 'Account blocked for 1 hour'
+                },
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+        await BlockService.areset_attempts(ip_address)
+
+        return issues_tokens(JsonResponse(get_token_for_user(user), status=status.HTTP_200_OK), user)
+
+
+class AsyncUserRegisterView(AsyncIdempotencyMixin, AsyncAPIView):
+    """
+    Async version of UserRegisterView.
+    """
+    throttle_classes = [RegisterThrottle]
+    idempotency_scope = "register"
+
+    async def post(self, request, *args, **kwargs):
+        ip_address = request.META.get('REMOTE_ADDR')
+        auth_serializer = UserRegisterSerializer(data=request.data, context={"request": request})
+        if not auth_serializer.is_valid():
+            return JsonResponse(auth_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        phone_number = auth_serializer.validated_data["phone_number"]
+
+        # Step 1: Validate profile
+        profile_serializer = UserProfileSerializer(data=request.data, context={'phone_number': phone_number})
+        if not await sync_to_async(profile_serializer.is_valid)():
+            return JsonResponse(profile_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        # Hashed before the OTP is consumed: a saturated pool must leave
+        # the code usable for the retry
+        try:
+            password_hash = await hashing.amake_password(profile_serializer.validated_data["password"])
+        except HashingPoolSaturated as e:
+            return service_busy_response(e)
+
+        # Step 2: Verify OTP
+        try:
+            await auth_serializer.acheck_otp()
+        except serializers.ValidationError as e:
+            return JsonResponse(serializers.as_serializer_error(e), status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            user = await CustomUser.objects.acreate_user(
+                phone_number=phone_number,
+                email=profile_serializer.validated_data["email"],
+                first_name=profile_serializer.validated_data["first_name"],
+                last_name=profile_serializer.validated_data["last_name"],
+                password_hash=password_hash
+            )
+
+            await BlockService.areset_attempts(ip_address)
+            return issues_tokens(JsonResponse(get_token_for_user(user), status=status.HTTP_201_CREATED), user)
+
+        except IntegrityError as e:
+            errors = CustomUser.unique_violation_errors(e)
+            if errors is not None:
+                return JsonResponse(errors, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse(
+                {
+                    "code": "user_creation_failed",
+                    "detail": str(e)
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            logger.error(f"User registration failed: {str(e)}")
+            return JsonResponse(
+                {
+                    "code": "server_error",
+                    "detail": "Internal server error"
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
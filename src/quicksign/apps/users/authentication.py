@@ -0,0 +1,192 @@
+import functools
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from .models import CustomUser
+from quicksign.utils import metrics
+from quicksign.utils.localcache import InvalidationSubscriber, LocalTTLCache, publish_invalidation
+from quicksign.utils.redis_scripts import RedisScript
+from quicksign.utils.replicas import use_primary
+
+
+# Caches a row loaded from the database unless the user was invalidated
+# since the reader read the version, so a stale row cannot outlive the
+# invalidation that raced with its load.
+#   KEYS: entry, version
+#   ARGV: version read before loading, encoded entry, ttl (s)
+FILL_SCRIPT = RedisScript("""
+if (redis.call('GET', KEYS[2]) or '0') ~= ARGV[1] then
+    return 0
+end
+redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+return 1
+""")
+
+
+@functools.lru_cache(maxsize=None)
+def _user_local_cache(max_size, ttl):
+    local_cache = LocalTTLCache(max_size=max_size, ttl=ttl)
+    InvalidationSubscriber(UserClaimsCache.invalidation_channel(), local_cache).start()
+    metrics.register("jwt_user_local_cache", local_cache.stats)
+    return local_cache
+
+
+class UserClaimsCache:
+    """
+    Cached user rows for token authentication: a process-local LRU in front
+    of Redis in front of the users table.
+
+    Entries hold every concrete field except the password hash, plus its
+    md5 fingerprint for simplejwt's CHECK_REVOKE_TOKEN. They are dropped
+    everywhere when the user is saved, updated through a queryset or deleted.
+
+    Every invalidation bumps a per-user version; a row loaded from the
+    database is only cached if the version is still the one read before
+    the load.
+    """
+    counters = {"redis_hits": 0, "db_loads": 0, "stale_fills": 0}
+    # Outlives any load in flight when the version is bumped
+    version_ttl = 24 * 3600
+
+    @staticmethod
+    def key(user_id):
+        return f"jwt_user_{user_id}"
+
+    @staticmethod
+    def version_key(user_id):
+        return f"jwt_user_version_{user_id}"
+
+    @staticmethod
+    def invalidation_channel():
+        return cache.make_key("jwt_user_invalidation")
+
+    @staticmethod
+    def local_cache():
+        options = settings.JWT_USER_CACHE
+        return _user_local_cache(options["LOCAL_MAX_SIZE"], options["LOCAL_TTL"])
+
+    @staticmethod
+    def fields():
+        return [field.attname for field in CustomUser._meta.concrete_fields if field.attname != "password"]
+
+    @staticmethod
+    def get(user_id):
+        """
+        Return the cached entry of a user, or None if no such user exists.
+        """
+        key = UserClaimsCache.key(user_id)
+        local_cache = UserClaimsCache.local_cache()
+        entry = local_cache.get(key)
+        if entry is not None:
+            return entry
+
+        generation = local_cache.generation
+        redis_client = cache.client.get_client()
+        redis_key = cache.make_key(key)
+        version_key = cache.make_key(UserClaimsCache.version_key(user_id))
+        raw, version = redis_client.mget([redis_key, version_key])
+        if raw is not None:
+            UserClaimsCache.counters["redis_hits"] += 1
+            entry = cache.client.decode(raw)
+        else:
+            # A lagging replica could cache a stale row right after an invalidation
+            with use_primary():
+                row = CustomUser.objects.filter(
+                    **{api_settings.USER_ID_FIELD: user_id}
+                ).values(*UserClaimsCache.fields(), "password").first()
+            if row is None:
+                return None
+            UserClaimsCache.counters["db_loads"] += 1
+            revoke_hash = get_md5_hash_password(row.pop("password"))
+            entry = {**row, "revoke_hash": revoke_hash}
+            filled = FILL_SCRIPT(
+                redis_client,
+                keys=[redis_key, version_key],
+                args=[version or b"0", cache.client.encode(entry), settings.JWT_USER_CACHE["TTL"]]
+            )
+            if not filled:
+                # Serve the row to this request only; the next one reloads it
+                UserClaimsCache.counters["stale_fills"] += 1
+                return entry
+
+        local_cache.set(key, entry, generation=generation)
+        return entry
+
+    @staticmethod
+    def to_user(entry):
+        """
+        Build a user instance from an entry; the password is a deferred field,
+        loaded from the database only if accessed.
+        """
+        field_names = [name for name in UserClaimsCache.fields() if name in entry]
+        return CustomUser.from_db("default", field_names, [entry[name] for name in field_names])
+
+    @staticmethod
+    def invalidate(*user_ids):
+        if not user_ids:
+            return
+        keys = [UserClaimsCache.key(user_id) for user_id in user_ids]
+        pipe = cache.client.get_client().pipeline(transaction=True)
+        for user_id, key in zip(user_ids, keys):
+            version_key = cache.make_key(UserClaimsCache.version_key(user_id))
+            pipe.incr(version_key)
+            pipe.expire(version_key, UserClaimsCache.version_ttl)
+            pipe.delete(cache.make_key(key))
+        pipe.execute()
+        UserClaimsCache.local_cache().delete(*keys)
+        publish_invalidation(UserClaimsCache.invalidation_channel(), *keys)
+
+    @staticmethod
+    def invalidate_on_commit(*user_ids):
+        """
+        Invalidate once the surrounding transaction commits; a reader that
+        loaded the old row meanwhile finds the version bumped and does not
+        cache it.
+        """
+        transaction.on_commit(lambda: UserClaimsCache.invalidate(*user_ids))
+
+    @staticmethod
+    def stats():
+        return dict(UserClaimsCache.counters)
+
+
+metrics.register("jwt_user_cache", UserClaimsCache.stats)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves the token's user through UserClaimsCache
+    instead of querying the users table on every request.
+    """
+
+    def get_user(self, validated_token):
+        if not settings.JWT_USER_CACHE["ENABLED"]:
+            return super().get_user(validated_token)
+
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken(_("Token contained no recognizable user identification"))
+
+        entry = UserClaimsCache.get(user_id)
+        if entry is None:
+            raise AuthenticationFailed(_("User not found"), code="user_not_found")
+
+        if not entry["is_active"]:
+            raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+        if api_settings.CHECK_REVOKE_TOKEN:
+            if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != entry["revoke_hash"]:
+                raise AuthenticationFailed(
+                    _("The user's password has been changed."), code="password_changed"
+                )
+
+        return UserClaimsCache.to_user(entry)
@@ -0,0 +1,58 @@
+from django import forms
+from django.db import models
+from django.utils.translation import gettext_lazy as _
+
+from .validators import normalize_phone_number
+
+COUNTRY_CODE = "+98"
+
+
+class PhoneNumberField(models.BigIntegerField):
+    """
+    Mobile number stored as a bigint of its national number (9123456789)
+    and read back as '+989123456789'.
+
+    Values and lookups are normalized with ``normalize_phone_number``, so
+    '09123456789' and '00989123456789' find the same row.
+    """
+    description = _("Phone number")
+
+    @staticmethod
+    def to_national(value):
+        return int(value[len(COUNTRY_CODE):])
+
+    @staticmethod
+    def from_national(value):
+        return f"{COUNTRY_CODE}{value}"
+
+    @property
+    def validators(self):
+        # Skip the integer range validators of BigIntegerField; values are strings
+        return [*self.default_validators, *self._validators]
+
+    def from_db_value(self, value, expression, connection):
+        return None if value is None else self.from_national(value)
+
+    def to_python(self, value):
+        if value is None or isinstance(value, str) and not value:
+            return value
+        if isinstance(value, int):
+            return self.from_national(value)
+        # Invalid values are kept for the validators to report
+        return normalize_phone_number(value) or value
+
+    def get_prep_value(self, value):
+        if value is None or isinstance(value, int):
+            return super().get_prep_value(value)
+        if hasattr(value, "resolve_expression"):
+            return value
+        normalized = normalize_phone_number(value)
+        if normalized is None:
+            raise ValueError(f"Field '{self.name}' expected a phone number but got {value!r}.")
+        return self.to_national(normalized)
+
+    def value_to_string(self, obj):
+        return self.value_from_object(obj)
+
+    def formfield(self, **kwargs):
+        return models.Field.formfield(self, **{"form_class": forms.CharField, "max_length": 20, **kwargs})
@@ -0,0 +1,121 @@
+import copy
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import environ
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from quicksign.apps.users.authentication import UserClaimsCache
+from quicksign.apps.users.models import CustomUser
+from quicksign.utils.database import configure_database_pool
+
+# DATABASE_POOL overrides of each profile
+PROFILES = {
+    "per-request": {"MODE": "none", "PREPARE_THRESHOLD": 0},
+    "pooled": {"MODE": "native", "PREPARE_THRESHOLD": 0},
+    "pooled+prepared": {"MODE": "native"},
+    "pgbouncer": {"MODE": "pgbouncer"},
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the latency of the login and phone check queries with a new "
+        "connection per request, with the psycopg pool, and with the pool and "
+        "prepared statements. Each simulated request looks a user up by phone "
+        "number twice and by id once, then releases its connection like Django "
+        "does at the end of a request. Pass --pgbouncer-url to include a "
+        "PgBouncer in transaction pooling mode."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per profile.")
+        parser.add_argument("--concurrency", type=int, default=8, help="Threads issuing requests.")
+        parser.add_argument("--pgbouncer-url", help="Database URL of a PgBouncer in front of the default database.")
+
+    def handle(self, *args, **options):
+        users = list(CustomUser.objects.using("default").values_list("phone_number", "id")[:1000])
+        if not users:
+            raise CommandError("Create some users first, e.g. with import_users.")
+
+        results = {}
+        for name, overrides in PROFILES.items():
+            if name == "pgbouncer" and not options["pgbouncer_url"]:
+                continue
+            alias = self.add_database(name, overrides, options)
+            try:
+                results[name] = self.run(alias, users, options)
+            finally:
+                self.remove_database(alias)
+
+            result = results[name]
+            speedup = results["per-request"]["p50"] / result["p50"]
+            self.stdout.write(
+                f"{name:16} {result['throughput']:.0f} req/s "
+                f"p50={result['p50']:.2f}ms p95={result['p95']:.2f}ms p99={result['p99']:.2f}ms "
+                f"({speedup:.1f}x per-request p50)"
+            )
+
+    def add_database(self, name, overrides, options):
+        database = copy.deepcopy(connections.settings["default"])
+        if name == "pgbouncer":
+            database.update(environ.Env.db_url_config(options["pgbouncer_url"]))
+        # Start from plain connections, then apply the profile
+        for option in ("pool", "server_side_binding", "prepare_threshold"):
+            database["OPTIONS"].pop(option, None)
+        database.update(CONN_MAX_AGE=0, CONN_HEALTH_CHECKS=False, DISABLE_SERVER_SIDE_CURSORS=False)
+        profile = {
+            **settings.DATABASE_POOL,
+            "MIN_SIZE": options["concurrency"],
+            "MAX_SIZE": options["concurrency"],
+            **overrides,
+        }
+        configure_database_pool(database, profile)
+
+        alias = f"benchmark_{name}"
+        connections.settings[alias] = database
+        return alias
+
+    def remove_database(self, alias):
+        connection = connections[alias]
+        if connection.settings_dict["OPTIONS"].get("pool"):
+            connection.close_pool()
+        del connections[alias]
+        del connections.settings[alias]
+
+    def request(self, alias, phone_number, user_id):
+        start = time.perf_counter()
+        connection = connections[alias]
+        users = CustomUser.objects.db_manager(alias)
+        # Phone check, login and token authentication lookups
+        users.filter(phone_number=phone_number).values_list("id", flat=True).first()
+        users.filter(phone_number=phone_number).first()
+        users.filter(id=user_id).values(*UserClaimsCache.fields()).first()
+        connection.close_if_unusable_or_obsolete()
+        return (time.perf_counter() - start) * 1000
+
+    def close(self, alias):
+        connections[alias].close()
+
+    def run(self, alias, users, options):
+        samples = [random.choice(users) for _ in range(options["requests"])]
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            # Warm up: open pools, prepare statements, load type info
+            list(executor.map(lambda user: self.request(alias, *user), samples[:options["concurrency"] * 10]))
+            start = time.perf_counter()
+            latencies = list(executor.map(lambda user: self.request(alias, *user), samples))
+            elapsed = time.perf_counter() - start
+            # Persistent connections belong to the worker threads
+            list(executor.map(lambda _: self.close(alias), range(options["concurrency"])))
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            "throughput": len(latencies) / elapsed,
+            "p50": quantiles[49],
+            "p95": quantiles[94],
+            "p99": quantiles[98],
+        }
@@ -0,0 +1,70 @@
+import asyncio
+import random
+import statistics
+import time
+
+import httpx
+from django.core.management.base import BaseCommand
+
+SYNC_PATH = "/api/user/phone-number/check/"
+ASYNC_PATH = "/api/user/async/phone-number/check/"
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test the sync and async phone check endpoints of a running server "
+        "and compare throughput and latency percentiles. Every request uses a new "
+        "phone number, so unregistered numbers trigger OTP sends: run the server "
+        "with a reachable broker or OTP_DISPATCH_MODE=batch."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url",
+            default="http://127.0.0.1:8000",
+            help="Base URL of a server running quicksign.asgi (e.g. under daphne)."
+        )
+        parser.add_argument("--requests", type=int, default=2000, help="Requests per variant.")
+        parser.add_argument("--concurrency", type=int, default=200, help="Requests in flight at once.")
+
+    def handle(self, *args, **options):
+        for label, path in (("sync", SYNC_PATH), ("async", ASYNC_PATH)):
+            result = asyncio.run(self.run(options["url"] + path, options))
+            self.stdout.write(
+                f"{label:5} {path}: {result['throughput']:.0f} req/s "
+                f"p50={result['p50']:.1f}ms p95={result['p95']:.1f}ms p99={result['p99']:.1f}ms "
+                f"statuses={result['statuses']}"
+            )
+
+    async def run(self, url, options):
+        semaphore = asyncio.Semaphore(options["concurrency"])
+        latencies = []
+        statuses = {}
+        limits = httpx.Limits(max_connections=options["concurrency"])
+
+        async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+            async def one():
+                # A fresh number per request keeps the per-phone throttle out of the way
+                payload = {"phone_number": f"+989{random.randrange(10 ** 9):09d}"}
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.post(url, json=payload)
+                        code = response.status_code
+                    except httpx.HTTPError as e:
+                        code = e.__class__.__name__
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    statuses[code] = statuses.get(code, 0) + 1
+
+            start = time.perf_counter()
+            await asyncio.gather(*(one() for _ in range(options["requests"])))
+            elapsed = time.perf_counter() - start
+
+        quantiles = statistics.quantiles(latencies, n=100)
+        return {
+            "throughput": len(latencies) / elapsed,
+            "p50": quantiles[49],
+            "p95": quantiles[94],
+            "p99": quantiles[98],
+            "statuses": statuses,
+        }
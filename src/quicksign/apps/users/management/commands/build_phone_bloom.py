@@ -0,0 +1,58 @@
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from quicksign.apps.users.models import CustomUser
+from quicksign.utils.bloom import BloomFilter
+from quicksign.utils.services import PhoneRegistry
+
+
+class Command(BaseCommand):
+    help = "Build the registered-phones Bloom filter from the users table."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=10000,
+            help="Rows fetched per database round trip."
+        )
+
+    def handle(self, *args, **options):
+        redis_filter = PhoneRegistry.bloom_filter()
+        if redis_filter is None:
+            raise CommandError("PHONE_BLOOM_FILTER is disabled.")
+
+        started_at = timezone.now()
+        start = time.perf_counter()
+        local_filter = BloomFilter(redis_filter.capacity, redis_filter.error_rate)
+        phone_numbers = CustomUser.objects.values_list("phone_number", flat=True)
+        for phone_number in phone_numbers.iterator(chunk_size=options["chunk_size"]):
+            local_filter.add(phone_number)
+
+        redis_filter.replace(local_filter)
+
+        # Users created while the table was being read may be missing from
+        # the uploaded bitmap; add them again now that the filter exists.
+        recent = phone_numbers.filter(created_at__gte=started_at - timedelta(minutes=1))
+        for phone_number in recent.iterator(chunk_size=options["chunk_size"]):
+            redis_filter.add(phone_number)
+
+        if local_filter.count > local_filter.capacity:
+            self.stderr.write(self.style.WARNING(
+                f"{local_filter.count} phones exceed the configured capacity of "
+                f"{local_filter.capacity}; raise PHONE_BLOOM_FILTER_CAPACITY."
+            ))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {redis_filter.key} from {local_filter.count} phones "
+            f"in {time.perf_counter() - start:.2f}s"
+        ))
+        self.stdout.write(
+            f"bits={local_filter.num_bits} hashes={local_filter.num_hashes} "
+            f"memory={local_filter.size_bytes / 1024:.1f} KiB "
+            f"target_fpr={local_filter.error_rate} "
+            f"current_fpr={local_filter.false_positive_rate():.6f}"
+        )
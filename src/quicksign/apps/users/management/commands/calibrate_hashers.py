@@ -0,0 +1,176 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher, PBKDF2PasswordHasher,
+                                         ScryptPasswordHasher, get_hashers)
+from django.core.management.base import BaseCommand, CommandError
+
+from quicksign.utils.hashers import (CalibratedArgon2PasswordHasher,
+                                     CalibratedPBKDF2PasswordHasher,
+                                     CalibratedScryptPasswordHasher)
+
+SAMPLE_PASSWORD = "calibration-Passw0rd"
+
+# Recommendations never go below Django's defaults, whatever the target
+# latency, or every existing hash would be downgraded on the next login
+MIN_PBKDF2_ITERATIONS = PBKDF2PasswordHasher.iterations
+MIN_SCRYPT_WORK_FACTOR = ScryptPasswordHasher.work_factor
+MAX_SCRYPT_WORK_FACTOR = 2 ** 20
+MIN_ARGON2_TIME_COST = Argon2PasswordHasher.time_cost
+MAX_ARGON2_TIME_COST = 20
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the configured password hashers on this CPU and write the "
+        "parameters that hit a target verify latency to PASSWORD_HASHER_PARAMS_FILE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--target-ms",
+            type=float,
+            default=100,
+            help="Target verify latency per password, in milliseconds."
+        )
+        parser.add_argument(
+            "--samples",
+            type=int,
+            default=3,
+            help="Timed verifications per candidate; the median is used."
+        )
+        parser.add_argument(
+            "--algorithms",
+            nargs="+",
+            help="Only calibrate these algorithms (e.g. pbkdf2_sha256 scrypt argon2)."
+        )
+        parser.add_argument(
+            "--output",
+            default=settings.PASSWORD_HASHER_PARAMS_FILE,
+            help="Parameters file to write."
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Print the recommendations without writing them."
+        )
+
+    def handle(self, *args, **options):
+        self.target = options["target_ms"] / 1000
+        self.samples = options["samples"]
+        calibrators = {
+            CalibratedPBKDF2PasswordHasher: self.calibrate_pbkdf2,
+            CalibratedScryptPasswordHasher: self.calibrate_scrypt,
+            CalibratedArgon2PasswordHasher: self.calibrate_argon2,
+        }
+
+        params = dict(settings.PASSWORD_HASHER_PARAMS)
+        calibrated = 0
+        for hasher in get_hashers():
+            calibrate = calibrators.get(type(hasher))
+            if calibrate is None:
+                continue
+            if options["algorithms"] and hasher.algorithm not in options["algorithms"]:
+                continue
+            try:
+                recommended, elapsed = calibrate(hasher)
+            except ValueError as e:
+                self.stderr.write(self.style.WARNING(f"Skipping {hasher.algorithm}: {e}"))
+                continue
+
+            params[hasher.algorithm] = recommended
+            calibrated += 1
+            summary = " ".join(f"{name}={value}" for name, value in recommended.items())
+            self.stdout.write(f"{hasher.algorithm}: {summary} verify={elapsed * 1000:.1f}ms")
+            if elapsed > self.target * 1.5:
+                self.stderr.write(self.style.WARNING(
+                    f"{hasher.algorithm} minimum parameters exceed the {options['target_ms']}ms target"
+                ))
+
+        if not calibrated:
+            raise CommandError("No calibrated hashers found in PASSWORD_HASHERS.")
+        if options["dry_run"]:
+            return
+
+        with open(options["output"], "w") as params_file:
+            json.dump(params, params_file, indent=2, sort_keys=True)
+        self.stdout.write(self.style.SUCCESS(
+            f"Wrote {options['output']}; restart the workers to apply it. "
+            f"Existing hashes are upgraded on the next login."
+        ))
+
+    def measure(self, hasher, encoded):
+        timings = []
+        for _ in range(self.samples):
+            start = time.perf_counter()
+            hasher.verify(SAMPLE_PASSWORD, encoded)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings)
+
+    def calibrate_pbkdf2(self, hasher):
+        """
+        PBKDF2 cost is linear in the iteration count, so scale from one probe.
+        """
+        base = PBKDF2PasswordHasher()
+        salt = base.salt()
+        probe = 100000
+        elapsed = self.measure(base, base.encode(SAMPLE_PASSWORD, salt, iterations=probe))
+        iterations = int(probe * self.target / elapsed) // 10000 * 10000
+        iterations = max(iterations, MIN_PBKDF2_ITERATIONS)
+        elapsed = self.measure(base, base.encode(SAMPLE_PASSWORD, salt, iterations=iterations))
+        return {"iterations": iterations}, elapsed
+
+    def calibrate_scrypt(self, hasher):
+        """
+        Double the work factor while verification stays under the target.
+        """
+        base = ScryptPasswordHasher()
+        base.block_size = hasher.block_size
+        base.parallelism = hasher.parallelism
+        salt = base.salt()
+
+        def measure(work_factor):
+            base.maxmem = 256 * work_factor * base.block_size
+            return self.measure(base, base.encode(SAMPLE_PASSWORD, salt, n=work_factor))
+
+        work_factor = MIN_SCRYPT_WORK_FACTOR
+        elapsed = measure(work_factor)
+        while work_factor < MAX_SCRYPT_WORK_FACTOR:
+            candidate = measure(work_factor * 2)
+            if candidate > self.target:
+                break
+            work_factor, elapsed = work_factor * 2, candidate
+        return {
+            "work_factor": work_factor,
+            "block_size": base.block_size,
+            "parallelism": base.parallelism,
+        }, elapsed
+
+    def calibrate_argon2(self, hasher):
+        """
+        Keep the configured memory cost and raise the time cost up to the target.
+        """
+        base = Argon2PasswordHasher()
+        base._load_library()
+        base.memory_cost = hasher.memory_cost
+        base.parallelism = hasher.parallelism
+        salt = base.salt()
+
+        def measure(time_cost):
+            base.time_cost = time_cost
+            return self.measure(base, base.encode(SAMPLE_PASSWORD, salt))
+
+        time_cost = MIN_ARGON2_TIME_COST
+        elapsed = measure(time_cost)
+        while time_cost < MAX_ARGON2_TIME_COST:
+            candidate = measure(time_cost + 1)
+            if candidate > self.target:
+                break
+            time_cost, elapsed = time_cost + 1, candidate
+        return {
+            "time_cost": time_cost,
+            "memory_cost": base.memory_cost,
+            "parallelism": base.parallelism,
+        }, elapsed
@@ -0,0 +1,235 @@
+import csv
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import EmailValidator
+from django.db import connection, transaction
+
+from quicksign.apps.users.models import CustomUser
+from quicksign.apps.users.validators import phone_number_validator
+from quicksign.utils.hashers import make_passwords, setup_hashing_process
+from quicksign.utils.services import PhoneRegistry
+
+STAGING_TABLE = "import_users_staging"
+PROFILE_FIELDS = ("phone_number", "email", "first_name", "last_name")
+
+email_validator = EmailValidator()
+
+
+class Command(BaseCommand):
+    help = (
+        "Import users from a CSV or NDJSON file with the columns phone_number, "
+        "email, first_name, last_name and either password or password_hash. "
+        "Passwords are hashed on a process pool, rows are loaded with COPY in "
+        "chunks, and rejected rows are written to a side file. Users without "
+        "a password get an unusable one."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="File to import, or - for stdin.")
+        parser.add_argument("--format", choices=["csv", "ndjson"], help="Defaults to the file extension.")
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Rows per COPY.")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=os.cpu_count() or 1,
+            help="Password hashing processes; 0 hashes in this process."
+        )
+        parser.add_argument(
+            "--rejects",
+            help="NDJSON file for rejected rows (defaults to <path>.rejects.ndjson)."
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or ("ndjson" if path.endswith((".ndjson", ".jsonl")) else "csv")
+        if path == "-" and not options["format"]:
+            raise CommandError("Pass --format when reading from stdin.")
+        rejects_path = options["rejects"] or f"{'import_users' if path == '-' else path}.rejects.ndjson"
+
+        self.chunk_size = options["chunk_size"]
+        self.read = self.imported = self.rejected = 0
+        self.start = time.perf_counter()
+
+        source = sys.stdin if path == "-" else open(path, newline="", encoding="utf-8")
+        executor = None
+        if options["workers"] > 0:
+            executor = ProcessPoolExecutor(
+                max_workers=options["workers"],
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=setup_hashing_process
+            )
+        try:
+            with source, open(rejects_path, "w", encoding="utf-8") as self.rejects:
+                self.create_staging_table()
+                self.run(self.read_rows(source, file_format), executor, max(options["workers"], 1) * 2)
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {self.imported} of {self.read} rows in {self.elapsed():.1f}s "
+            f"({self.imported / self.elapsed():.0f} rows/s); {self.rejected} rejected"
+            + (f", see {rejects_path}" if self.rejected else "")
+        ))
+
+    def elapsed(self):
+        return max(time.perf_counter() - self.start, 1e-6)
+
+    def read_rows(self, source, file_format):
+        """
+        Yield ``(line, row)`` pairs, or ``(line, None)`` for unparseable lines.
+        """
+        if file_format == "csv":
+            for line, row in enumerate(csv.DictReader(source), start=2):
+                yield line, row
+            return
+        for line, text in enumerate(source, start=1):
+            if not text.strip():
+                continue
+            try:
+                row = json.loads(text)
+            except ValueError:
+                row = None
+            yield line, row if isinstance(row, dict) else None
+
+    def run(self, rows, executor, max_pending):
+        # Chunks wait here while their passwords are hashed; the oldest one
+        # is loaded once the queue is full, so hashing and COPY overlap
+        pending = deque()
+        for chunk in self.chunks(rows):
+            pending.append(self.hash_chunk(chunk, executor))
+            if len(pending) >= max_pending:
+                self.load_chunk(*pending.popleft())
+        while pending:
+            self.load_chunk(*pending.popleft())
+
+    def chunks(self, rows):
+        chunk, phones, emails = [], set(), set()
+        for line, row in rows:
+            self.read += 1
+            user, errors = self.clean(row)
+            if not errors:
+                if user["phone_number"] in phones:
+                    errors = {"phone_number": ["Duplicate phone number in this chunk."]}
+                elif user["email"].lower() in emails:
+                    errors = {"email": ["Duplicate email in this chunk."]}
+            if errors:
+                self.reject(line, row, errors)
+                continue
+
+            phones.add(user["phone_number"])
+            emails.add(user["email"].lower())
+            chunk.append((line, row, user))
+            if len(chunk) >= self.chunk_size:
+                yield chunk
+                chunk, phones, emails = [], set(), set()
+        if chunk:
+            yield chunk
+
+    def clean(self, row):
+        """
+        ``(user, errors)`` for one input row; ``user`` holds the profile
+        fields and either ``password`` (plain) or ``password_hash``.
+        """
+        if row is None:
+            return None, {"row": ["Unparseable row."]}
+
+        user = {name: str(row.get(name) or "").strip() for name in PROFILE_FIELDS}
+        user["phone_number"] = CustomUser.normalize_username(user["phone_number"])
+        errors = {}
+        for name, validator in (("phone_number", phone_number_validator), ("email", email_validator)):
+            try:
+                validator(user[name])
+            except ValidationError as e:
+                errors[name] = e.messages
+        for name in ("first_name", "last_name"):
+            if len(user[name]) > CustomUser._meta.get_field(name).max_length:
+                errors[name] = ["Too long."]
+
+        password_hash = row.get("password_hash") or ""
+        if password_hash:
+            try:
+                identify_hasher(password_hash)
+            except ValueError:
+                errors["password_hash"] = ["Unknown hash format."]
+            user["password_hash"] = password_hash
+        else:
+            user["password"] = row.get("password") or None
+        return user, errors
+
+    def reject(self, line, row, errors):
+        self.rejected += 1
+        if row is not None:
+            # Plain passwords never reach the side file
+            row = {name: value for name, value in row.items() if name != "password"}
+        self.rejects.write(json.dumps({"line": line, "row": row, "errors": errors}) + "\n")
+
+    def hash_chunk(self, chunk, executor):
+        """
+        ``(chunk, future)`` where the future resolves to the hashes of the
+        plain passwords in ``chunk``, in order.
+        """
+        passwords = [user["password"] for _, _, user in chunk if "password_hash" not in user]
+        if executor is None or not passwords:
+            future = Future()
+            future.set_result([make_password(password) for password in passwords])
+            return chunk, future
+        return chunk, executor.submit(make_passwords, passwords)
+
+    def create_staging_table(self):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"CREATE TEMPORARY TABLE IF NOT EXISTS {STAGING_TABLE} ("
+                "line integer, password text, phone_number bigint, email text, "
+                "first_name text, last_name text) ON COMMIT DELETE ROWS"
+            )
+
+    def load_chunk(self, chunk, future):
+        hashes = iter(future.result())
+        opts = CustomUser._meta
+        phone_field = opts.get_field("phone_number")
+        staged = [
+            (
+                line,
+                user.get("password_hash") or next(hashes),
+                phone_field.get_prep_value(user["phone_number"]),
+                *(user[name] for name in PROFILE_FIELDS[1:])
+            )
+            for line, _, user in chunk
+        ]
+
+        columns = {name: opts.get_field(name).column for name in ("password", *PROFILE_FIELDS)}
+        target = ", ".join(columns.values())
+        with transaction.atomic(), connection.cursor() as cursor:
+            with cursor.copy(f"COPY {STAGING_TABLE} (line, {', '.join(columns)}) FROM STDIN") as copy:
+                for row in staged:
+                    copy.write_row(row)
+            # Rows clashing with existing users are skipped, not failed
+            cursor.execute(
+                f"INSERT INTO {opts.db_table} ({target}, last_login, is_superuser, is_staff, is_active, "
+                "created_at, updated_at) "
+                f"SELECT {', '.join(columns)}, NULL, false, false, true, now(), now() "
+                f"FROM {STAGING_TABLE} ORDER BY line "
+                f"ON CONFLICT DO NOTHING RETURNING {columns['phone_number']}"
+            )
+            inserted = {phone_field.from_national(national) for (national,) in cursor.fetchall()}
+
+        for line, row, user in chunk:
+            if user["phone_number"] not in inserted:
+                self.reject(line, row, {"user": ["A user with that phone number or email already exists."]})
+        self.imported += len(inserted)
+        PhoneRegistry.add_many(list(inserted))
+
+        self.stdout.write(
+            f"{self.read} read, {self.imported} imported, {self.rejected} rejected "
+            f"({self.imported / self.elapsed():.0f} rows/s)"
+        )
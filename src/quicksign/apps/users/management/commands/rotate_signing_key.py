@@ -0,0 +1,84 @@
+import os
+import secrets
+from datetime import datetime, timezone
+
+from cryptography.hazmat.primitives import serialization
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from quicksign.utils.signing import ASYMMETRIC_ALGORITHMS, generate_private_key
+
+
+class Command(BaseCommand):
+    help = (
+        "Manage the JWT signing keys in JWT_SIGNING_KEYS_DIR. Rotate in three "
+        "steps: add a key and restart so it is published in the JWKS, wait "
+        "JWT_SIGNING_JWKS_MAX_AGE, then make it active with JWT_SIGNING_ACTIVE_KID. "
+        "Retire the old key once its tokens have expired."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--algorithm",
+            choices=sorted(ASYMMETRIC_ALGORITHMS),
+            help="Type of the new key (defaults to JWT_SIGNING_ALGORITHM)."
+        )
+        parser.add_argument("--retire", metavar="KID", help="Keep only the public part of a key.")
+        parser.add_argument("--remove", metavar="KID", help="Delete a retired key.")
+
+    def handle(self, *args, **options):
+        keys_dir = settings.JWT_SIGNING["KEYS_DIR"]
+        if options["retire"]:
+            self.retire(keys_dir, options["retire"])
+        elif options["remove"]:
+            self.remove(keys_dir, options["remove"])
+        else:
+            self.add(keys_dir, options["algorithm"] or settings.JWT_SIGNING["ALGORITHM"])
+
+    def add(self, keys_dir, algorithm):
+        if algorithm not in ASYMMETRIC_ALGORITHMS:
+            raise CommandError(f"Pass --algorithm; {algorithm} does not use a key ring.")
+
+        kid = f"{datetime.now(timezone.utc):%Y%m%d%H%M%S}-{algorithm.lower()}-{secrets.token_hex(4)}"
+        private_key = generate_private_key(algorithm)
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        )
+        os.makedirs(keys_dir, exist_ok=True)
+        path = os.path.join(keys_dir, f"{kid}.pem")
+        fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        with os.fdopen(fd, "wb") as key_file:
+            key_file.write(pem)
+
+        self.stdout.write(self.style.SUCCESS(f"Added {algorithm} key {kid} to {keys_dir}"))
+        self.stdout.write(
+            f"Restart the servers to publish it, wait {settings.JWT_SIGNING['JWKS_MAX_AGE']}s "
+            f"for cached JWKS to expire, then set JWT_SIGNING_ACTIVE_KID={kid}"
+        )
+
+    def retire(self, keys_dir, kid):
+        if kid == settings.JWT_SIGNING["ACTIVE_KID"]:
+            raise CommandError(f"{kid} is the active key.")
+        path = os.path.join(keys_dir, f"{kid}.pem")
+        if not os.path.exists(path):
+            raise CommandError(f"No private key {kid} in {keys_dir}.")
+
+        with open(path, "rb") as key_file:
+            private_key = serialization.load_pem_private_key(key_file.read(), password=None)
+        public_pem = private_key.public_key().public_bytes(
+            serialization.Encoding.PEM,
+            serialization.PublicFormat.SubjectPublicKeyInfo
+        )
+        with open(os.path.join(keys_dir, f"{kid}.pub.pem"), "wb") as key_file:
+            key_file.write(public_pem)
+        os.remove(path)
+        self.stdout.write(self.style.SUCCESS(f"Retired {kid}; it now only verifies."))
+
+    def remove(self, keys_dir, kid):
+        path = os.path.join(keys_dir, f"{kid}.pub.pem")
+        if not os.path.exists(path):
+            raise CommandError(f"No retired key {kid} in {keys_dir}; retire it first.")
+        os.remove(path)
+        self.stdout.write(self.style.SUCCESS(f"Removed {kid}."))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from quicksign.utils.sms.fake import FakeSMSProviderServer
+
+
+class Command(BaseCommand):
+    help = "Run a local fake SMS provider API for offline development."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--host", default="127.0.0.1")
+        parser.add_argument("--port", type=int, default=8025)
+        parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+
+    def handle(self, *args, **options):
+        server = FakeSMSProviderServer(options["host"], options["port"], latency=options["latency"])
+        self.stdout.write(self.style.SUCCESS(f"Fake SMS provider listening on {server.url}"))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Accepted {len(server.messages)} messages")
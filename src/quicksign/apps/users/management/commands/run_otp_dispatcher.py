@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from quicksign.utils.dispatch import OTPDispatcher
+
+
+class Command(BaseCommand):
+    help = "Flush queued OTP sends to the SMS provider in micro-batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max-batch-size", type=int, help="Overrides OTP_DISPATCH['MAX_BATCH_SIZE'].")
+        parser.add_argument("--max-latency-ms", type=int, help="Overrides OTP_DISPATCH['MAX_LATENCY_MS'].")
+        parser.add_argument(
+            "--worker-id",
+            help="Names this dispatcher's processing list (default: the host name); must be unique and stable."
+        )
+
+    def handle(self, *args, **options):
+        max_latency = options["max_latency_ms"]
+        dispatcher = OTPDispatcher(
+            max_batch_size=options["max_batch_size"],
+            max_latency=max_latency / 1000 if max_latency is not None else None,
+            worker_id=options["worker_id"]
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Dispatching OTPs in batches of up to {dispatcher.max_batch_size} "
+            f"every {dispatcher.max_latency * 1000:.0f}ms"
+        ))
+        try:
+            dispatcher.run_forever()
+        except KeyboardInterrupt:
+            self.stdout.write(str(OTPDispatcher.stats()))
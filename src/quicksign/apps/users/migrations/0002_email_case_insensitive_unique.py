@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:15
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("auth", "0012_alter_user_first_name_max_length"),
+        ("users", "0001_initial"),
+    ]
+
+    # The case-insensitive index is created before the old one is dropped,
+    # so email stays unique throughout
+    operations = [
+        migrations.AddConstraint(
+            model_name="customuser",
+            constraint=models.UniqueConstraint(
+                django.db.models.functions.text.Lower("email"),
+                name="users_customuser_email_lower_key",
+                violation_error_message="A user with that email already exists.",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="customuser",
+            name="email",
+            field=models.EmailField(max_length=254, verbose_name="email"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-17 00:40
+
+import quicksign.apps.users.fields
+import quicksign.apps.users.validators
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0003_admin_search_indexes"),
+    ]
+
+    # Existing rows are reduced to their national number in place, then the
+    # column is cast to bigint; both steps rewrite the table under a lock
+    operations = [
+        migrations.RunSQL(
+            sql=(
+                "UPDATE users_customuser "
+                "SET phone_number = regexp_replace(phone_number, '^(\\+98|0098|98|0)', '')"
+            ),
+            reverse_sql="UPDATE users_customuser SET phone_number = '+98' || phone_number",
+        ),
+        migrations.AlterField(
+            model_name="customuser",
+            name="phone_number",
+            field=quicksign.apps.users.fields.PhoneNumberField(
+                unique=True,
+                validators=[quicksign.apps.users.validators.PhoneNumberValidator()],
+                verbose_name="phone number",
+            ),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:09
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("users", "0004_phone_number_bigint"),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name="customuser",
+            options={
+                "permissions": [("bulk_check_phone_numbers", "Can check phone numbers in bulk")],
+                "verbose_name": "user",
+                "verbose_name_plural": "users",
+            },
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 14:02
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # Built concurrently, so the table stays writable meanwhile
+    atomic = False
+
+    dependencies = [
+        ("users", "0005_bulk_check_permission"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="customuser",
+            index=models.Index(fields=["updated_at", "id"], name="users_customuser_updated_idx"),
+        ),
+    ]
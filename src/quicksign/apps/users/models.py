@@ -1,30 +1,119 @@
 import logging
 
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import models, transaction
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.db.models.functions import Lower, Upper
 from django.contrib.auth.models import AbstractBaseUser, PermissionsMixin, BaseUserManager
 from django.utils.translation import gettext_lazy as _
 
-from .validators import phone_number_validator
+from .fields import PhoneNumberField
+from .validators import normalize_phone_number, phone_number_validator
+from quicksign.utils import hashing
+from quicksign.utils.replicas import StickyReads
+from quicksign.utils.services import PhoneRegistry
 
 logger = logging.getLogger(__name__)
 
 # Create your models here.
 
 
-class UserManager(BaseUserManager):
+class UserQuerySet(models.QuerySet):
+    """
+    Keeps the registered-phones Bloom filter and the cached JWT claims in
+    step with bulk writes, which send no post_save signal. Raw SQL writes
+    must call PhoneRegistry.add_many and UserClaimsCache.invalidate
+    themselves, as import_users does for the filter.
+    """
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = super().bulk_create(objs, *args, **kwargs)
+        PhoneRegistry.add_many([obj.phone_number for obj in objs])
+        return objs
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # Imported here: authentication -> models
+        from .authentication import UserClaimsCache
+
+        objs = list(objs)
+        rows = super().bulk_update(objs, fields, *args, **kwargs)
+        if "phone_number" in fields:
+            PhoneRegistry.add_many([obj.phone_number for obj in objs])
+        UserClaimsCache.invalidate_on_commit(*[obj.pk for obj in objs])
+        return rows
+
+    def update(self, **kwargs):
+        # Imported here: authentication -> models
+        from .authentication import UserClaimsCache
+
+        pks = list(self.values_list("pk", flat=True))
+        rows = super().update(**kwargs)
+        if "phone_number" in kwargs:
+            # The new value may be an expression, so it is read back by pk
+            phone_numbers = self.model._base_manager.using(self.db).filter(pk__in=pks).values_list("phone_number", flat=True)
+            PhoneRegistry.add_many(list(phone_numbers))
+        UserClaimsCache.invalidate_on_commit(*pks)
+        return rows
+
+
+class UserManager(BaseUserManager.from_queryset(UserQuerySet)):
     """
     Custom user manager for handling user creation with phone number as primary identifier
     """
-    def create_user(self, phone_number, password=None, **extra_fields):
+    def _insert(self, user):
+        """
+        Save a new user with a single INSERT. Inside a transaction it runs in a
+        savepoint, so a unique violation leaves the transaction usable.
+        """
+        if transaction.get_connection(self._db).in_atomic_block:
+            with transaction.atomic(using=self._db):
+                user.save(using=self._db)
+        else:
+            user.save(using=self._db)
+
+    def get_by_natural_key(self, phone_number):
+        # Anything that is not a phone number cannot match a user
+        if normalize_phone_number(phone_number) is None:
+            raise self.model.DoesNotExist
+        return super().get_by_natural_key(phone_number)
+
+    async def aget_by_natural_key(self, phone_number):
+        if normalize_phone_number(phone_number) is None:
+            raise self.model.DoesNotExist
+        return await super().aget_by_natural_key(phone_number)
+
+    def create_user(self, phone_number, password=None, *, password_hash=None, **extra_fields):
         """
         Create and return a regular user with a phone number and password.
+        A password already encoded with hashing.make_password can be passed
+        as password_hash instead.
         """
         try:
             if not phone_number:
                 raise ValueError('The phone number must be set')
-            user = self.model(phone_number=phone_number, **extra_fields)
-            user.set_password(password)
-            user.save(using=self._db)
+            user = self.model(phone_number=self.model.normalize_username(phone_number), **extra_fields)
+            user.password = password_hash or hashing.make_password(password)
+            self._insert(user)
+            StickyReads.mark(user.phone_number)
+            logger.info(f"User{phone_number} created successfully")
+            return user
+
+        except Exception as e:
+            logger.error(f"User creation failed: {str(e)}")
+            raise
+
+    async def acreate_user(self, phone_number, password=None, *, password_hash=None, **extra_fields):
+        """
+        Async counterpart of create_user; the password is hashed on the
+        hashing pool without blocking the event loop.
+        """
+        try:
+            if not phone_number:
+                raise ValueError('The phone number must be set')
+            user = self.model(phone_number=self.model.normalize_username(phone_number), **extra_fields)
+            user.password = password_hash or await hashing.amake_password(password)
+            await sync_to_async(self._insert)(user)
+            await StickyReads.amark(user.phone_number)
             logger.info(f"User{phone_number} created successfully")
             return user
 
@@ -55,19 +144,13 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     Inherits from Django's AbstractBaseUser and PermissionsMixin to provide core
     authentication functionality and permission handling.
     """
-    phone_number = models.CharField(
+    phone_number = PhoneNumberField(
         _("phone number"),
-        max_length=13,
         unique=True,
         validators=[phone_number_validator]
     )
-    email = models.EmailField(
-        _("email"),
-        unique=True,
-        error_messages={
-            "unique": _("A user with that email already exists."),
-        }
-    )
+    # Unique case-insensitively, see Meta.constraints
+    email = models.EmailField(_("email"))
     first_name = models.CharField(_("first name"), max_length=128)
     last_name = models.CharField(_("last name"), max_length=128)
 
@@ -85,9 +168,56 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     def __str__(self):
         return self.phone_number
 
+    @classmethod
+    def normalize_username(cls, username):
+        # 09..., 0098... and +989... are the same user
+        return normalize_phone_number(username) or super().normalize_username(username)
+
     class Meta:
         verbose_name = 'user'
         verbose_name_plural = 'users'
+        permissions = [
+            ("bulk_check_phone_numbers", "Can check phone numbers in bulk"),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                Lower("email"),
+                name="users_customuser_email_lower_key",
+                violation_error_message=_("A user with that email already exists.")
+            ),
+        ]
+        indexes = [
+            # The admin changelist is ordered by -created_at
+            models.Index(fields=["created_at"], name="users_customuser_created_idx"),
+            # Incremental exports walk updated_at, id
+            models.Index(fields=["updated_at", "id"], name="users_customuser_updated_idx"),
+            # Serve the admin's icontains search, which compares UPPER(column)
+            GinIndex(OpClass(Upper("email"), name="gin_trgm_ops"), name="users_customuser_email_trgm"),
+            GinIndex(OpClass(Upper("first_name"), name="gin_trgm_ops"), name="users_customuser_first_trgm"),
+            GinIndex(OpClass(Upper("last_name"), name="gin_trgm_ops"), name="users_customuser_last_trgm"),
+        ]
+
+    # Unique constraints of the table and the field each one protects
+    unique_constraint_fields = {
+        "users_customuser_phone_number_key": "phone_number",
+        "users_customuser_email_lower_key": "email",
+    }
+    unique_error_messages = {
+        "phone_number": _("A user with that phone number already exists."),
+        "email": _("A user with that email already exists."),
+    }
+
+    @classmethod
+    def unique_violation_errors(cls, exc):
+        """
+        Field errors for an IntegrityError raised by one of the unique
+        constraints, or None for any other integrity error.
+        """
+        diag = getattr(exc.__cause__, "diag", None)
+        field = cls.unique_constraint_fields.get(getattr(diag, "constraint_name", None))
+        if field is None:
+            return None
+        return {field: [cls.unique_error_messages[field]]}
 
 
 
@@ -0,0 +1,17 @@
+from rest_framework.permissions import BasePermission
+
+
+class CanBulkCheckPhoneNumbers(BasePermission):
+    """
+    Staff, or partners granted users.bulk_check_phone_numbers.
+
+    The bulk check reveals which numbers are registered together with their
+    user ids, so it is not open to every authenticated user.
+    """
+
+    def has_permission(self, request, view):
+        user = request.user
+        return bool(
+            user and user.is_authenticated
+            and (user.is_staff or user.has_perm("users.bulk_check_phone_numbers"))
+        )
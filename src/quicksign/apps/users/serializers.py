@@ -1,35 +1,102 @@
+from django.conf import settings
 from django.core.validators import EmailValidator, MinLengthValidator
 from django.utils.translation import gettext_lazy as _
 
 from rest_framework import serializers
-from rest_framework.exceptions import ValidationError
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
 
+from .authentication import UserClaimsCache
 from .models import CustomUser
-from .validators import phone_number_validator, number_validator, letter_validator
+from .tokens import AccessToken, RefreshToken
+from .validators import normalize_phone_number, number_validator, letter_validator
 from quicksign.utils.services import BlockService, OTPService
 
+class PhoneNumberField(serializers.CharField):
+    """
+    Mobile number in any notation normalize_phone_number accepts, validated
+    as its canonical '+989xxxxxxxxx' form.
+    """
+    default_error_messages = {
+        "invalid": _("Phone number must be entered in the format: '+989xxxxxxxxx'. Up to 12 digits allowed."),
+    }
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("max_length", 20)
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        phone_number = normalize_phone_number(super().to_internal_value(data))
+        if phone_number is None:
+            self.fail("invalid")
+        return phone_number
+
+
 class PhoneNumberCheckSerializer(serializers.Serializer):
-    phone_number = serializers.CharField(
-        required=True,
-        max_length=13,
-        validators=[phone_number_validator]
+    phone_number = PhoneNumberField(required=True)
+
+
+class PhoneNumberBulkCheckSerializer(serializers.Serializer):
+    phone_numbers = serializers.ListField(
+        child=serializers.CharField(max_length=20),
+        allow_empty=False
     )
 
-    def validate_phone_number(self, value: str)-> str:
-        try:
-            phone_number_validator(value)
-            return value
-        except ValidationError as e:
+    def validate_phone_numbers(self, value: list) -> list:
+        # Drop duplicates, keeping the order the client sent
+        value = list(dict.fromkeys(value))
+        max_size = settings.PHONE_CHECK_BATCH['MAX_SIZE']
+        if len(value) > max_size:
             raise serializers.ValidationError(
-                "Phone number must be entered in the format: '+989xxxxxxxxx'. Up to 12 digits allowed."
+                _("Ensure this field has no more than %(max_size)d distinct elements.") % {"max_size": max_size}
             )
+        return value
+
+
+class TokenRefreshSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs: dict) -> dict:
+        try:
+            refresh = RefreshToken(attrs["refresh"])
+            entry = UserClaimsCache.get(refresh[api_settings.USER_ID_CLAIM])
+            if entry is None or not entry["is_active"]:
+                raise TokenError(_("User is inactive or deleted"))
+            refresh.rotate()
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+
+        return {"refresh": str(refresh), "access": str(refresh.access_token)}
+
+
+class TokenVerifySerializer(serializers.Serializer):
+    token = serializers.CharField()
+
+    def validate(self, attrs: dict) -> dict:
+        # Either kind of token may be verified
+        for token_class in (AccessToken, RefreshToken):
+            try:
+                token_class(attrs["token"])
+                return {}
+            except TokenError as e:
+                error = e
+        raise InvalidToken(error.args[0])
+
+
+class LogoutSerializer(serializers.Serializer):
+    refresh = serializers.CharField()
+
+    def validate(self, attrs: dict) -> dict:
+        try:
+            refresh = RefreshToken(attrs["refresh"])
+        except TokenError as e:
+            raise InvalidToken(e.args[0])
+        return {"refresh": refresh}
 
 
 class UserLoginSerializer(serializers.Serializer):
-    phone_number = serializers.CharField(
+    phone_number = PhoneNumberField(
         required=True,
-        max_length=13,
-        validators=[phone_number_validator],
         help_text=_("Please provide the phone number that was sent to you.")
     )
     password = serializers.CharField(
@@ -38,55 +105,66 @@ class UserLoginSerializer(serializers.Serializer):
         style={'input_type': 'password'}
     )
 
-    def validate_phone_number(self, value: str)-> str:
-        try:
-            phone_number_validator(value)
-            return value
-        except ValidationError as e:
-            raise serializers.ValidationError(
-                "Phone number must be entered in the format: '+989xxxxxxxxx'. Up to 12 digits allowed."
-            )
-
 
 class UserRegisterSerializer(serializers.Serializer):
     code = serializers.CharField(required=True, min_length=6, max_length=6)
-    phone_number = serializers.CharField(
+    phone_number = PhoneNumberField(
         required=True,
-        max_length=13,
-        validators=[phone_number_validator],
         help_text=_("Please provide the phone number that was sent to you.")
     )
 
-    def validate(self, attrs: dict) -> dict:
-        request = self.context.get("request")
-        ip_address = request.META.get('REMOTE_ADDR')
-        phone_number = attrs["phone_number"]
-
-        block_status = BlockService.get_block_status(phone_number, ip_address)
-        if block_status["is_blocked"]:
-            raise serializers.ValidationError(
-                {
-                    "code": "account_blocked",
-                    "detail": "Account temporarily blocked.",
-                    "remaining_time": f"{block_status['block_time_left'] // 60} minutes"
-                }
-            )
-
-        if not OTPService.validate_code(phone_number, attrs["code"]):
-            attempts = BlockService.increment_attempts(phone_number, ip_address)
-            remaining_attempts = 3 - attempts
-            new_status = BlockService.get_block_status(phone_number, ip_address)
-            raise serializers.ValidationError(
-                {
-                    "code": "invalid_otp",
-                    "detail": "Invalid verification code.",
-                    "remaining_attempts": new_status['remaining_attempts'],
-                    'message': f'Account will be blocked after {remaining_attempts} more failed attempts'
-                    if remaining_attempts > 0 else 'Account blocked for 1 hour'
-                }
-            )
-
-        return attrs
+    def check_otp(self):
+        """
+        Check the block status, then verify and consume the code.
+
+        Called once the profile has been validated too, so a rejected
+        profile leaves the code usable for the corrected request.
+        """
+        ip_address = self.context["request"].META.get('REMOTE_ADDR')
+        phone_number = self.validated_data["phone_number"]
+
+        block_status = BlockService.get_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            raise self.account_blocked_error(block_status)
+
+        if not OTPService.validate_code(phone_number, self.validated_data["code"]):
+            attempt = BlockService.record_failed_attempt(phone_number, ip_address)
+            raise self.invalid_otp_error(attempt)
+
+    async def acheck_otp(self):
+        ip_address = self.context["request"].META.get('REMOTE_ADDR')
+        phone_number = self.validated_data["phone_number"]
+
+        block_status = await BlockService.aget_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            raise self.account_blocked_error(block_status)
+
+        if not await OTPService.avalidate_code(phone_number, self.validated_data["code"]):
+            attempt = await BlockService.arecord_failed_attempt(phone_number, ip_address)
+            raise self.invalid_otp_error(attempt)
+
+    @staticmethod
+    def account_blocked_error(block_status):
+        return serializers.ValidationError(
+            {
+                "code": "account_blocked",
+                "detail": "Account temporarily blocked.",
+                "remaining_time": f"{block_status.block_time_left // 60} minutes"
+            }
+        )
+
+    @staticmethod
+    def invalid_otp_error(attempt):
+        remaining_attempts = max(0, BlockService.max_attempts - attempt.attempts)
+        return serializers.ValidationError(
+            {
+                "code": "invalid_otp",
+                "detail": "Invalid verification code.",
+                "remaining_attempts": remaining_attempts,
+                'message': f'Account will be blocked after {remaining_attempts} more failed attempts'
+                if not attempt.is_blocked else 'Account blocked for 1 hour'
+            }
+        )
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
@@ -104,16 +182,18 @@ class UserProfileSerializer(serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         fields = ['email', 'first_name', 'last_name', 'password', 'confirm_password']
+        # Email uniqueness is checked in validate_email, before the OTP is
+        # consumed; the INSERT still catches races, see
+        # CustomUser.unique_violation_errors
         extra_kwargs = {
             'email': {
                 'validators': [EmailValidator()],
-                'error_messages': {'unique': 'A user with that email already exists.'}
             }
         }
 
     def validate_email(self, value: str) -> str:
-        if CustomUser.objects.filter(email=value).exists():
-            raise serializers.ValidationError("Email already exists")
+        if CustomUser.objects.filter(email__iexact=value).exists():
+            raise serializers.ValidationError(CustomUser.unique_error_messages["email"])
         return value
 
     def validate(self, attrs: dict) -> dict:
@@ -122,4 +202,9 @@ class UserProfileSerializer(serializers.ModelSerializer):
                 "confirm_password": "Passwords do not match"
             })
         attrs.pop('confirm_password', None)
-        return attrs
\ No newline at end of file
+        return attrs
+
+class UserExportSerializer(serializers.Serializer):
+    # Not "format", which DRF keeps for choosing a renderer
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="ndjson")
+    since = serializers.DateTimeField(required=False)
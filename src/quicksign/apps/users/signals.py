@@ -0,0 +1,28 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import UserClaimsCache
+from .models import CustomUser
+from quicksign.utils.services import PhoneRegistry
+
+
+@receiver(post_save, sender=CustomUser)
+def add_phone_to_registry(sender, instance, created, update_fields=None, **kwargs):
+    """
+    Keep the registered-phones Bloom filter in step with new users and
+    changed phone numbers; bulk writes are covered by UserQuerySet.
+    """
+    # Re-adding an unchanged number sets no new bits
+    if created or update_fields is None or "phone_number" in update_fields:
+        PhoneRegistry.add(instance.phone_number)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, created=False, **kwargs):
+    """
+    Drop the cached row used by token authentication after any change,
+    including deactivation and password changes.
+    """
+    if not created:
+        UserClaimsCache.invalidate_on_commit(instance.pk)
@@ -1,8 +1,10 @@
 import logging
 
 from celery import shared_task
+from django.conf import settings
+from django.contrib.auth import get_user_model
 
-from .models import CustomUser
+from quicksign.utils.sms import SMSDeliveryError, get_sms_provider
 
 logger = logging.getLogger(__name__)
 
@@ -10,5 +12,29 @@ logger = logging.getLogger(__name__)
 def send_verification_code(*, phone_number, verification_code):
     """
     Send the verification code to the user via SMS.
+
+    The provider already retries what is safe to resend, so a failure here
+    is final; the user can ask for a new code.
+    """
+    text = settings.SMS_VERIFICATION_MESSAGE.format(code=verification_code)
+    try:
+        result = get_sms_provider().send(phone_number, text)
+    except SMSDeliveryError as e:
+        logger.error(f"Sending verification code to phone: {phone_number} failed: {str(e)}")
+        return None
+    logger.info(f"Verification code sent to phone: {phone_number} ({result.message_id})")
+    return result.message_id
+
+
+@shared_task
+def update_password_hash(*, user_id, old_password_hash, new_password_hash):
+    """
+    Store an upgraded password hash unless the password changed meanwhile.
     """
-    logger.info(f"Sending verification code {verification_code} to phone: {phone_number}")
\ No newline at end of file
+    updated = get_user_model().objects.filter(
+        pk=user_id,
+        password=old_password_hash
+    ).update(password=new_password_hash)
+    if updated:
+        logger.info(f"Password hash upgraded for user: {user_id}")
+    return bool(updated)
@@ -1,17 +1,45 @@
 import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import StringIO
 from unittest.mock import patch
 
-from django.test import TestCase, RequestFactory
+import jwt
+from django.conf import settings
+from django.contrib.auth.hashers import PBKDF2PasswordHasher, get_hasher
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.test import TestCase, RequestFactory, override_settings
 from django.urls import reverse
+from django.utils import timezone
 from django.core.cache import cache
+from django.db import IntegrityError, connection, connections
+from django.http import JsonResponse
+from django.test.utils import CaptureQueriesContext
 
 from rest_framework.test import APITestCase, APIRequestFactory, APIClient
 from rest_framework import status
-
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenBackendError
+from rest_framework_simplejwt import tokens as simplejwt_tokens
+from rest_framework_simplejwt.settings import api_settings
+
+from .authentication import CachedJWTAuthentication, UserClaimsCache
+from .exports import UserExport
 from .models import CustomUser
-from .serializers import PhoneNumberCheckSerializer
+from .tokens import FAMILY_CLAIM, AccessToken, RefreshToken
+from .tasks import update_password_hash
+from .serializers import PhoneNumberCheckSerializer, UserProfileSerializer
+from .throttles import LoginThrottle, PhoneBulkCheckThrottle
 from .views import PhoneNumberCheckView
-from quicksign.utils.services import BlockService, OTPService
+from quicksign.utils import signing
+from quicksign.utils.hashing import HashingPool, HashingPoolSaturated
+from quicksign.utils.idempotency import IdempotencyStore
+from quicksign.utils.services import BlockService, BlockStatus, get_token_for_user, OTPService, PhoneRegistry
 
 # Create your tests here.
 
@@ -73,6 +101,18 @@ class CustomUserTestCase(TestCase):
                 password='testPass123'
             )
 
+    def test_email_is_unique_case_insensitively(self):
+        with self.assertRaises(IntegrityError) as cm:
+            CustomUser.objects.create_user(
+                phone_number='+989123456788',
+                email='Test@Example.com',
+                password='testPass123'
+            )
+        self.assertEqual(CustomUser.unique_violation_errors(cm.exception),
+                         {'email': ['A user with that email already exists.']})
+        # The failed INSERT ran in a savepoint, so the transaction is usable
+        self.assertEqual(CustomUser.objects.count(), 1)
+
     def test_create_user_with_duplicate_email(self):
         """Test duplicate email are not allowed"""
         with self.assertRaises(Exception):
@@ -87,7 +127,7 @@ class CustomUserTestCase(TestCase):
 class PhoneNumberCheckSerializerTest(TestCase):
     def setUp(self):
         self.valid_phone = "+989123456789"
-        self.invalid_phone = "09123456789"  # Missing +
+        self.invalid_phone = "+19123456789"  # Not an Iranian mobile number
         self.long_phone = "+9891234567890"  # Too long
 
     def test_valid_phone_number(self):
@@ -95,6 +135,12 @@ class PhoneNumberCheckSerializerTest(TestCase):
         self.assertTrue(serializer.is_valid())
         self.assertEqual(serializer.validated_data['phone_number'], self.valid_phone)
 
+    def test_national_formats_are_normalized(self):
+        for phone_number in ("09123456789", "00989123456789", "989123456789", "0912 345 6789"):
+            serializer = PhoneNumberCheckSerializer(data={'phone_number': phone_number})
+            self.assertTrue(serializer.is_valid(), phone_number)
+            self.assertEqual(serializer.validated_data['phone_number'], self.valid_phone)
+
     def test_invalid_phone_number_format(self):
         serializer = PhoneNumberCheckSerializer(data={'phone_number': self.invalid_phone})
         self.assertFalse(serializer.is_valid())
@@ -106,6 +152,47 @@ class PhoneNumberCheckSerializerTest(TestCase):
         self.assertIn('phone_number', serializer.errors)
 
 
+class PhoneNumberStorageTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            phone_number='0912 345 0000',
+            email='compact@example.com',
+            password='testPass123'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_stored_as_national_number(self):
+        self.assertEqual(self.user.phone_number, '+989123450000')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT phone_number FROM users_customuser WHERE id = %s', [self.user.id])
+            self.assertEqual(cursor.fetchone()[0], 9123450000)
+
+        self.assertEqual(CustomUser.objects.get(phone_number='00989123450000'), self.user)
+        self.assertEqual(
+            list(CustomUser.objects.filter(pk=self.user.pk).values_list('phone_number', flat=True)),
+            ['+989123450000']
+        )
+        with self.assertRaises(CustomUser.DoesNotExist):
+            CustomUser.objects.get_by_natural_key('not-a-phone')
+
+    def test_login_with_national_format(self):
+        response = self.client.post(reverse('login-user'), {'phone_number': '09123450000', 'password': 'testPass123'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_throttle_key_is_canonical(self):
+        throttle = LoginThrottle()
+        factory = APIRequestFactory()
+        keys = {
+            throttle.get_cache_key(Request(factory.post('/', {'phone_number': phone_number}, format='json'),
+                                           parsers=[JSONParser()]), None)
+            for phone_number in ('+989123450000', '09123450000', '00989123450000')
+        }
+        self.assertEqual(len(keys), 1)
+
+
 class PhoneNumberCheckViewTest(APITestCase):
     def setUp(self):
         self.factory = APIRequestFactory()
@@ -117,15 +204,16 @@ class PhoneNumberCheckViewTest(APITestCase):
         CustomUser.objects.create(phone_number=self.registered_phone)
 
         # Mock block service
-        self.original_is_blocked = BlockService.is_blocked
-        self.original_get_status = BlockService.get_block_status
-        BlockService.is_blocked = lambda phone, ip: phone == self.blocked_phone
-        BlockService.get_block_status = lambda phone, ip: {'block_time_left': 300}
+        self.original_get_status = BlockService.get_status
+        BlockService.get_status = lambda phone, ip: BlockStatus(
+            is_blocked=phone == self.blocked_phone,
+            attempts=0,
+            block_time_left=300
+        )
 
     def tearDown(self):
         # Restore original block service methods
-        BlockService.is_blocked = self.original_is_blocked
-        BlockService.get_block_status = self.original_get_status
+        BlockService.get_status = self.original_get_status
 
     def test_registered_user(self):
         data = {'phone_number': self.registered_phone}
@@ -176,6 +264,159 @@ class PhoneNumberCheckViewTest(APITestCase):
         self.assertIn('phone_number', response.data)
 
 
+@override_settings(PHONE_BLOOM_FILTER={'ENABLED': True, 'CAPACITY': 1000, 'ERROR_RATE': 0.001})
+class PhoneNumberCheckBloomFilterTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('check-phone')
+        self.registered_phone = "+989111111111"
+        CustomUser.objects.create(phone_number=self.registered_phone, email='old@example.com')
+        call_command('build_phone_bloom', stdout=StringIO())
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('quicksign.apps.users.tasks.send_verification_code.delay')
+    def test_definite_miss_skips_database(self, mock_send):
+        with self.assertNumQueries(0):
+            response = self.client.post(self.url, {'phone_number': '+989222222222'})
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.data['status'], 'not_registered')
+
+    def test_registered_phone_found(self):
+        response = self.client.post(self.url, {'phone_number': self.registered_phone})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'registered')
+
+    def test_new_user_added_to_filter(self):
+        """Users created after the build are added by the post_save signal"""
+        CustomUser.objects.create_user(
+            phone_number='+989333333333',
+            email='new@example.com',
+            password='testPass123'
+        )
+        self.assertTrue(PhoneRegistry.might_be_registered('+989333333333'))
+
+    def test_changed_phone_added_to_filter(self):
+        """Edits and bulk writes that set a phone number add it too"""
+        user = CustomUser.objects.get(phone_number=self.registered_phone)
+        user.phone_number = '+989333333333'
+        user.save()
+        self.assertTrue(PhoneRegistry.might_be_registered('+989333333333'))
+
+        CustomUser.objects.filter(pk=user.pk).update(phone_number='09444444444')
+        self.assertTrue(PhoneRegistry.might_be_registered('+989444444444'))
+
+        user.refresh_from_db()
+        user.phone_number = '+989555555555'
+        CustomUser.objects.bulk_update([user], ['phone_number'])
+        self.assertTrue(PhoneRegistry.might_be_registered('+989555555555'))
+
+        CustomUser.objects.bulk_create([CustomUser(phone_number='+989666666666', email='bulk@example.com')])
+        self.assertTrue(PhoneRegistry.might_be_registered('+989666666666'))
+
+    def test_national_formats_added_as_canonical(self):
+        user = CustomUser.objects.get(phone_number=self.registered_phone)
+        user.phone_number = '0933 777 7777'
+        user.save()
+        CustomUser.objects.bulk_create([CustomUser(phone_number='00989388888888', email='bulk@example.com')])
+
+        bloom_filter = PhoneRegistry.bloom_filter()
+        self.assertTrue(bloom_filter.might_contain('+989337777777'))
+        self.assertTrue(bloom_filter.might_contain('+989388888888'))
+
+
+class PhoneNumberBulkCheckViewTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('check-phone-bulk')
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989111111111',
+            email='partner@example.com',
+            password='testPass123',
+            is_staff=True
+        )
+        self.client.force_authenticate(self.user)
+        BlockService.block_user(phone_number='+989333333333')
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_bulk_results(self):
+        data = {'phone_numbers': ['+989111111111', '+989222222222', '+989333333333', 'bad', '+989222222222']}
+        with self.assertNumQueries(1):
+            response = self.client.post(self.url, data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['results'], [
+            {'phone_number': '+989111111111', 'status': 'registered', 'user_id': self.user.id},
+            {'phone_number': '+989222222222', 'status': 'not_registered'},
+            {'phone_number': '+989333333333', 'status': 'blocked'},
+            {'phone_number': 'bad', 'status': 'invalid'},
+        ])
+
+    @override_settings(PHONE_CHECK_BATCH={'MAX_SIZE': 5000, 'STREAM_THRESHOLD': 2, 'CHUNK_SIZE': 2})
+    def test_large_batch_is_streamed(self):
+        data = {'phone_numbers': ['+989111111111', '+989222222222', '+989444444444']}
+        with self.assertNumQueries(2):
+            response = self.client.post(self.url, data, format='json')
+            lines = b''.join(response.streaming_content).decode().splitlines()
+
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertEqual([json.loads(line)['status'] for line in lines],
+                         ['registered', 'not_registered', 'not_registered'])
+
+    def test_throttle_weighted_by_batch_size(self):
+        phone_numbers = [f'+98912000000{i}' for i in range(4)]
+        with patch.dict(PhoneBulkCheckThrottle.THROTTLE_RATES, {'phone_bulk_check_request': '5/hour'}):
+            # Repeats and other notations of a number are charged once
+            response = self.client.post(
+                self.url, {'phone_numbers': phone_numbers + ['09120000000', 'bad']}, format='json'
+            )
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            response = self.client.post(self.url, {'phone_numbers': phone_numbers[:2]}, format='json')
+            self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+
+    def test_batch_over_burst_is_refused(self):
+        phone_numbers = ['+989222222222', '+989333333333', '+989444444444']
+        with patch.dict(PhoneBulkCheckThrottle.THROTTLE_RATES, {'phone_bulk_check_request': '2/hour'}):
+            response = self.client.post(self.url, {'phone_numbers': phone_numbers}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertNotIn('Retry-After', response)
+        self.assertEqual(str(response.data['detail']), 'Request costs 3 units but at most 2 are allowed per 3600 seconds.')
+
+    def test_requires_authentication(self):
+        self.client.force_authenticate(None)
+        response = self.client.post(self.url, {'phone_numbers': ['+989222222222']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_requires_staff_or_permission(self):
+        partner = CustomUser.objects.create_user(
+            phone_number='+989555555555',
+            email='other@example.com',
+            password='testPass123'
+        )
+        self.client.force_authenticate(partner)
+        response = self.client.post(self.url, {'phone_numbers': ['+989222222222']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+        partner.user_permissions.add(Permission.objects.get(codename='bulk_check_phone_numbers'))
+        self.client.force_authenticate(CustomUser.objects.get(pk=partner.pk))
+        response = self.client.post(self.url, {'phone_numbers': ['+989222222222']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    @override_settings(PHONE_CHECK_BATCH={'MAX_SIZE': 2, 'STREAM_THRESHOLD': 500, 'CHUNK_SIZE': 500})
+    def test_batch_size_limit(self):
+        response = self.client.post(self.url, {'phone_numbers': ['+989222222222'] * 3}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+        response = self.client.post(
+            self.url, {'phone_numbers': ['+989222222222', '+989333333333', '+989444444444']}, format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('phone_numbers', response.data)
+
+
 class BlockServiceIntegrationTest(TestCase):
     def setUp(self):
         self.phone = "+989123456789"
@@ -268,6 +509,18 @@ class UserLoginViewTests(APITestCase):
         response = self.client.post(self.login_url, self.invalid_password_data)
         self.assertEqual(response.data['remaining_attempts'], 2)
 
+    def test_login_throttled(self):
+        """Test login is rate limited per IP and phone number"""
+        # Requests without a password are rejected early but still count
+        data = {'phone_number': self.valid_data['phone_number']}
+        for _ in range(10):
+            self.assertEqual(self.client.post(self.login_url, data).status_code,
+                             status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.login_url, data)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response)
+
     def test_invalid_serializer_data(self):
         """Test login with invalid phone number format"""
         invalid_data = {
@@ -278,16 +531,181 @@ class UserLoginViewTests(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('phone_number', response.data)
 
-    @patch('quicksign.utils.services.BlockService.is_blocked', return_value=True)
-    @patch('quicksign.utils.services.BlockService.get_block_status',
-           return_value={'block_time_left': 1800})  # 30 minutes
-    def test_blocked_user_login(self, mock_get_status, mock_is_blocked):
+    def test_outdated_hash_upgraded_after_login(self):
+        """Test login with an outdated hash succeeds and schedules a rehash"""
+        old_hash = self.user.password
+        scheduled = threading.Event()
+        iterations = PBKDF2PasswordHasher.iterations + 10000
+        with patch('quicksign.apps.users.tasks.update_password_hash.delay',
+                   side_effect=lambda **kwargs: scheduled.set()) as mock_delay:
+            with override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': iterations}}):
+                response = self.client.post(self.login_url, self.valid_data)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertTrue(scheduled.wait(timeout=5))
+
+        kwargs = mock_delay.call_args.kwargs
+        self.assertEqual(kwargs['old_password_hash'], old_hash)
+        self.assertTrue(kwargs['new_password_hash'].startswith(f'pbkdf2_sha256${iterations}$'))
+
+        self.assertTrue(update_password_hash(**kwargs))
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password('testpass123'))
+        # A hash changed in the meantime is left alone
+        self.assertFalse(update_password_hash(**kwargs))
+
+    @patch.object(HashingPool, 'run', side_effect=HashingPoolSaturated(retry_after=2))
+    def test_login_when_hashing_pool_saturated(self, mock_run):
+        """Test a full hashing pool fails fast without counting an attempt"""
+        response = self.client.post(self.login_url, self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '2')
+        self.assertEqual(BlockService.get_status(phone_number='+989123456789', ip_address='127.0.0.1').attempts, 0)
+
+    @patch('quicksign.utils.services.BlockService.get_status',
+           return_value=BlockStatus(is_blocked=True, attempts=3, block_time_left=1800))  # 30 minutes
+    def test_blocked_user_login(self, mock_get_status):
         """Test blocked user can't login"""
         response = self.client.post(self.login_url, self.valid_data)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
         self.assertEqual(response.data['remaining_time'], '30 minutes')
 
 
+class IdempotencyKeyTests(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.url = reverse('login-user')
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989123456789',
+            email='test@example.com',
+            password='testpass123'
+        )
+        self.valid_data = {'phone_number': '+989123456789', 'password': 'testpass123'}
+
+    def tearDown(self):
+        cache.clear()
+
+    def login(self, data, key='key-1'):
+        return self.client.post(self.url, data, format='json', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retry_replays_response(self):
+        first = self.login(self.valid_data)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', first)
+
+        with patch('quicksign.apps.users.views.authenticate') as mock_authenticate:
+            retry = self.login(self.valid_data)
+        mock_authenticate.assert_not_called()
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertEqual(AccessToken(retry.json()['access'])[api_settings.USER_ID_CLAIM], self.user.pk)
+
+        # Another key runs the request again
+        with patch('quicksign.apps.users.views.authenticate', return_value=self.user) as mock_authenticate:
+            self.login(self.valid_data, key='key-2')
+        mock_authenticate.assert_called_once()
+
+    def test_tokens_are_not_stored(self):
+        first = self.login(self.valid_data).json()
+        record = IdempotencyStore.get(IdempotencyStore.key('login', 'key-1'))
+        self.assertNotIn('content', record)
+        self.assertNotIn(first['refresh'], json.dumps(record))
+
+        # Rotating the first refresh token does not make a replay hand it out again
+        self.assertEqual(self.client.post(reverse('token-refresh'), {'refresh': first['refresh']},
+                                          format='json').status_code, status.HTTP_200_OK)
+        retry = self.login(self.valid_data).json()
+        self.assertNotEqual(retry['refresh'], first['refresh'])
+        self.assertEqual(self.client.post(reverse('token-refresh'), {'refresh': retry['refresh']},
+                                          format='json').status_code, status.HTTP_200_OK)
+
+    def test_replay_for_inactive_user(self):
+        self.login(self.valid_data)
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['code'], 'idempotency_key_expired')
+
+    def test_replay_after_password_change(self):
+        self.login(self.valid_data)
+        self.user.set_password('newpass456')
+        self.user.save()
+        response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['code'], 'idempotency_key_expired')
+
+    def test_replay_for_blocked_user(self):
+        self.login(self.valid_data)
+        BlockService.block_user(phone_number='+989123456789', ip_address='10.0.0.1')
+        response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(response.json()['code'], 'idempotency_key_expired')
+
+    def test_token_responses_kept_for_lock_ttl(self):
+        key = IdempotencyStore.key('login', 'key-1')
+        self.login(self.valid_data)
+        self.assertLessEqual(cache.client.get_client().ttl(key), settings.IDEMPOTENCY['LOCK_TTL'])
+
+        # Failures are kept for the full TTL
+        key = IdempotencyStore.key('login', 'key-2')
+        self.login({'phone_number': '+989123456789', 'password': 'wrongpass'}, key='key-2')
+        self.assertGreater(cache.client.get_client().ttl(key), settings.IDEMPOTENCY['LOCK_TTL'])
+
+    def test_retried_failure_counts_once(self):
+        data = {'phone_number': '+989123456789', 'password': 'wrongpass'}
+        for _ in range(3):
+            response = self.login(data)
+            self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(BlockService.get_status(ip_address='127.0.0.1').attempts, 1)
+
+    def test_key_reused_for_other_request(self):
+        self.login(self.valid_data)
+        response = self.login({'phone_number': '+989123456789', 'password': 'otherpass1'})
+        self.assertEqual(response.status_code, status.HTTP_422_UNPROCESSABLE_ENTITY)
+        self.assertEqual(response.json()['code'], 'idempotency_key_reused')
+
+    def test_server_errors_are_not_stored(self):
+        with patch('quicksign.apps.users.views.authenticate', side_effect=HashingPoolSaturated(retry_after=1)):
+            self.assertEqual(self.login(self.valid_data).status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotIn('Idempotent-Replayed', response)
+
+    def test_retry_waits_for_request_in_flight(self):
+        request = APIRequestFactory().post(self.url, self.valid_data, format='json')
+        key = IdempotencyStore.key('login', 'key-1')
+        fingerprint = IdempotencyStore.fingerprint(request)
+        self.assertIsNone(IdempotencyStore.begin(key, fingerprint))
+
+        with override_settings(IDEMPOTENCY={**settings.IDEMPOTENCY, 'WAIT_TIMEOUT': 0.2}):
+            response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        finished = JsonResponse({'access': 'a', 'refresh': 'r'})
+        timer = threading.Timer(0.2, IdempotencyStore.complete, args=(key, fingerprint, finished))
+        timer.start()
+        self.addCleanup(timer.join)
+        response = self.login(self.valid_data)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json(), {'access': 'a', 'refresh': 'r'})
+
+    async def test_async_retry_replays_response(self):
+        url = reverse('async-login-user')
+        headers = {'Idempotency-Key': 'key-1'}
+        first = await self.async_client.post(url, self.valid_data, content_type='application/json', headers=headers)
+        self.assertEqual(first.status_code, status.HTTP_200_OK)
+        retry = await self.async_client.post(url, self.valid_data, content_type='application/json', headers=headers)
+        self.assertEqual(retry.status_code, status.HTTP_200_OK)
+        self.assertEqual(retry['Idempotent-Replayed'], 'true')
+        self.assertNotEqual(retry.json()['refresh'], first.json()['refresh'])
+
+    def test_sync_and_async_views_share_keys(self):
+        self.login(self.valid_data)
+        response = self.client.post(reverse('async-login-user'), self.valid_data, format='json',
+                                    HTTP_IDEMPOTENCY_KEY='key-1')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+
+
 class UserRegisterViewTests(TestCase):
     def setUp(self):
         self.client = APIClient()
@@ -317,6 +735,70 @@ class UserRegisterViewTests(TestCase):
         user = CustomUser.objects.get(phone_number=self.valid_data['phone_number'])
         self.assertEqual(user.email, self.valid_data['email'])
 
+    def test_registration_is_an_email_lookup_and_a_single_insert(self):
+        with patch.object(OTPService, 'validate_code', return_value=True), CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, self.valid_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        user_queries = [query['sql'] for query in queries if 'users_customuser' in query['sql']]
+        self.assertEqual(len(user_queries), 2)
+        self.assertTrue(user_queries[0].startswith('SELECT'))
+        self.assertTrue(user_queries[1].startswith('INSERT'))
+
+    def test_duplicate_phone_or_email(self):
+        CustomUser.objects.create_user(
+            phone_number='+989111111111',
+            email='taken@example.com',
+            password='testPass123'
+        )
+        cases = [
+            ({'phone_number': '+989111111111'}, {'phone_number': ['A user with that phone number already exists.']}),
+            ({'email': 'TAKEN@example.com'}, {'email': ['A user with that email already exists.']}),
+        ]
+        for changes, errors in cases:
+            with self.subTest(changes=changes), patch.object(OTPService, 'validate_code', return_value=True):
+                response = self.client.post(self.url, {**self.valid_data, **changes}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+                self.assertEqual(response.data, errors)
+
+    def test_duplicate_email_keeps_otp(self):
+        CustomUser.objects.create_user(
+            phone_number='+989111111111',
+            email='taken@example.com',
+            password='testPass123'
+        )
+        with patch.object(OTPService, 'validate_code', return_value=True) as mock_validate:
+            response = self.client.post(self.url, {**self.valid_data, 'email': 'Taken@Example.com'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'email': ['A user with that email already exists.']})
+        mock_validate.assert_not_called()
+
+    def test_email_taken_after_lookup(self):
+        """Test an email registered between the lookup and the INSERT is still reported"""
+        CustomUser.objects.create_user(
+            phone_number='+989111111111',
+            email='taken@example.com',
+            password='testPass123'
+        )
+        with patch.object(OTPService, 'validate_code', return_value=True), \
+                patch.object(UserProfileSerializer, 'validate_email', side_effect=lambda value: value):
+            response = self.client.post(self.url, {**self.valid_data, 'email': 'taken@example.com'}, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'email': ['A user with that email already exists.']})
+
+    @patch.object(HashingPool, 'run', side_effect=HashingPoolSaturated(retry_after=1))
+    def test_registration_when_hashing_pool_saturated(self, mock_run):
+        with patch.object(OTPService, 'validate_code', return_value=True) as mock_validate:
+            response = self.client.post(self.url, self.valid_data, format='json')
+
+        self.assertEqual(response.status_code, status.HTTP_503_SERVICE_UNAVAILABLE)
+        self.assertEqual(response['Retry-After'], '1')
+        self.assertFalse(CustomUser.objects.filter(phone_number=self.valid_data['phone_number']).exists())
+        # The code is left for the retry
+        mock_validate.assert_not_called()
+
     def test_invalid_otp(self):
         # Mock invalid OTP
         with patch.object(OTPService, 'validate_code', return_value=False):
@@ -347,6 +829,18 @@ class UserRegisterViewTests(TestCase):
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
         self.assertIn('email', response.data)
 
+    def test_invalid_profile_keeps_code(self):
+        code = OTPService.generate_code(self.valid_data['phone_number'])
+        data = {**self.valid_data, 'code': code}
+
+        for changes in ({'email': 'invalid-email'}, {'confirm_password': 'differentpassword123'}):
+            with self.subTest(changes=changes):
+                response = self.client.post(self.url, {**data, **changes}, format='json')
+                self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
     def test_reset_attempts_after_success(self):
         valid_data = {
             'phone_number': '+989123456788',
@@ -378,3 +872,607 @@ class UserRegisterViewTests(TestCase):
         ip = '127.0.0.1'
         attempts = cache.get(f"failed_attempts_{ip}", 0)
         self.assertEqual(attempts, 0)
+
+
+class CachedJWTAuthenticationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UserClaimsCache.local_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989123456789',
+            email='test@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.token = RefreshToken.for_user(self.user).access_token
+        self.authentication = CachedJWTAuthentication()
+
+    def tearDown(self):
+        cache.clear()
+        UserClaimsCache.local_cache().clear()
+
+    def test_user_is_cached(self):
+        with self.assertNumQueries(1):
+            self.authentication.get_user(self.token)
+        with self.assertNumQueries(0):
+            user = self.authentication.get_user(self.token)
+
+        self.assertEqual(user.pk, self.user.pk)
+        self.assertEqual(user.phone_number, self.user.phone_number)
+        self.assertTrue(user.is_authenticated)
+        # Served from Redis once the local entry is gone
+        UserClaimsCache.local_cache().clear()
+        with self.assertNumQueries(0):
+            self.authentication.get_user(self.token)
+
+    def test_password_is_deferred(self):
+        user = self.authentication.get_user(self.token)
+        self.assertNotIn('password', cache.get(UserClaimsCache.key(self.user.pk)))
+        with self.assertNumQueries(1):
+            self.assertTrue(user.check_password('testpass123'))
+
+    def test_deactivated_user_is_rejected(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_deleted_user_is_rejected(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.delete()
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_queryset_update_invalidates(self):
+        self.authentication.get_user(self.token)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+
+        with self.assertRaises(AuthenticationFailed):
+            self.authentication.get_user(self.token)
+
+    def test_stale_row_not_cached_after_invalidation(self):
+        """A row loaded before a concurrent invalidation is served but not cached"""
+        load = CustomUser.objects.filter
+
+        def invalidated_during_load(*args, **kwargs):
+            UserClaimsCache.invalidate(self.user.pk)
+            return load(*args, **kwargs)
+
+        with patch.object(CustomUser.objects, 'filter', side_effect=invalidated_during_load):
+            self.assertEqual(UserClaimsCache.get(self.user.pk)['id'], self.user.pk)
+
+        self.assertIsNone(cache.get(UserClaimsCache.key(self.user.pk)))
+        with self.assertNumQueries(1):
+            UserClaimsCache.get(self.user.pk)
+        self.assertIsNotNone(cache.get(UserClaimsCache.key(self.user.pk)))
+
+    def test_authenticates_bulk_check(self):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        response = self.client.post(reverse('check-phone-bulk'), {'phone_numbers': ['+989222222222']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+
+class TokenRotationTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        UserClaimsCache.local_cache().clear()
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989123456789',
+            email='test@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+        self.tokens = get_token_for_user(self.user)
+
+    def tearDown(self):
+        cache.clear()
+        UserClaimsCache.local_cache().clear()
+
+    def refresh(self, refresh):
+        return self.client.post(reverse('token-refresh'), {'refresh': refresh}, format='json')
+
+    def assertAccessAllowed(self, access, allowed=True):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.post(reverse('check-phone-bulk'), {'phone_numbers': ['+989222222222']}, format='json')
+        self.client.credentials()
+        self.assertEqual(response.status_code, status.HTTP_200_OK if allowed else status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_share_a_family(self):
+        refresh = RefreshToken(self.tokens['refresh'])
+        access = AccessToken(self.tokens['access'])
+        self.assertEqual(refresh[FAMILY_CLAIM], access[FAMILY_CLAIM])
+        self.assertEqual(access[api_settings.USER_ID_CLAIM], self.user.pk)
+
+    def test_refresh_rotates(self):
+        family = RefreshToken(self.tokens['refresh'])[FAMILY_CLAIM]
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(response.data['refresh'], self.tokens['refresh'])
+        self.assertEqual(RefreshToken(response.data['refresh'])[FAMILY_CLAIM], family)
+        self.assertAccessAllowed(response.data['access'])
+
+        # The new refresh token is itself usable once
+        self.assertEqual(self.refresh(response.data['refresh']).status_code, status.HTTP_200_OK)
+
+    def test_reuse_revokes_family(self):
+        rotated = self.refresh(self.tokens['refresh']).data
+
+        response = self.refresh(self.tokens['refresh'])
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+        # Every token of the session is now revoked
+        self.assertEqual(self.refresh(rotated['refresh']).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertAccessAllowed(rotated['access'], allowed=False)
+        self.assertAccessAllowed(self.tokens['access'], allowed=False)
+
+        # Other sessions of the same user are unaffected
+        self.assertAccessAllowed(get_token_for_user(self.user)['access'])
+
+    def test_inactive_user_cannot_refresh(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.is_active = False
+            self.user.save(update_fields=['is_active'])
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_logout(self):
+        response = self.client.post(reverse('logout-user'), {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_205_RESET_CONTENT)
+
+        self.assertAccessAllowed(self.tokens['access'], allowed=False)
+        self.assertEqual(self.refresh(self.tokens['refresh']).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('logout-user'), {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_verify(self):
+        url = reverse('token-verify')
+        self.assertEqual(self.client.post(url, {'token': self.tokens['access']}, format='json').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(url, {'token': self.tokens['refresh']}, format='json').status_code, status.HTTP_200_OK)
+        self.assertEqual(self.client.post(url, {'token': 'garbage'}, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+        RefreshToken(self.tokens['refresh']).revoke()
+        self.assertEqual(self.client.post(url, {'token': self.tokens['access']}, format='json').status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class SigningKeyRingTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.keys_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.keys_dir)
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989123456789',
+            email='test@example.com',
+            password='testpass123',
+            is_staff=True
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def add_key(self, algorithm):
+        existing = set(os.listdir(self.keys_dir))
+        with override_settings(JWT_SIGNING=self.signing_settings(algorithm, '')):
+            call_command('rotate_signing_key', stdout=StringIO())
+        (name,) = set(os.listdir(self.keys_dir)) - existing
+        return name[:-len('.pem')]
+
+    def signing_settings(self, algorithm, active_kid, hs256_issued_before=''):
+        return {
+            'ALGORITHM': algorithm,
+            'KEYS_DIR': self.keys_dir,
+            'ACTIVE_KID': active_kid,
+            'HS256_ISSUED_BEFORE': hs256_issued_before,
+            'JWKS_MAX_AGE': 86400,
+        }
+
+    def assertAccessAllowed(self, access, allowed=True):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        response = self.client.post(reverse('check-phone-bulk'), {'phone_numbers': ['+989222222222']}, format='json')
+        self.client.credentials()
+        self.assertEqual(response.status_code, status.HTTP_200_OK if allowed else status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_verify_against_jwks(self):
+        for algorithm in ('EdDSA', 'ES256'):
+            kid = self.add_key(algorithm)
+            with override_settings(JWT_SIGNING=self.signing_settings(algorithm, kid)):
+                access = get_token_for_user(self.user)['access']
+                self.assertEqual(jwt.get_unverified_header(access), {'alg': algorithm, 'kid': kid, 'typ': 'JWT'})
+                self.assertAccessAllowed(access)
+
+                response = self.client.get(reverse('jwks'))
+                self.assertEqual(response['Cache-Control'], 'public, max-age=86400')
+                jwks = jwt.PyJWKSet.from_dict(response.json())
+                payload = jwt.decode(access, jwks[kid].key, algorithms=[algorithm])
+                self.assertEqual(payload[api_settings.USER_ID_CLAIM], self.user.pk)
+
+                response = self.client.get(reverse('jwks'), HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_rotation(self):
+        old_kid = self.add_key('EdDSA')
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', old_kid)):
+            old_access = get_token_for_user(self.user)['access']
+
+        new_kid = self.add_key('EdDSA')
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', new_kid)):
+            call_command('rotate_signing_key', retire=old_kid, stdout=StringIO())
+
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', new_kid)):
+            self.assertEqual(
+                {key['kid'] for key in self.client.get(reverse('jwks')).json()['keys']},
+                {old_kid, new_kid}
+            )
+            # The retired key only verifies
+            self.assertAccessAllowed(old_access)
+            self.assertEqual(jwt.get_unverified_header(get_token_for_user(self.user)['access'])['kid'], new_kid)
+
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', new_kid)):
+            call_command('rotate_signing_key', remove=old_kid, stdout=StringIO())
+            # Keys are loaded once per process, so removal takes a restart
+            self.assertAccessAllowed(old_access)
+            signing._token_backend.cache_clear()
+            self.assertAccessAllowed(old_access, allowed=False)
+
+    def test_hs256_tokens_during_migration(self):
+        hs256_access = str(simplejwt_tokens.RefreshToken.for_user(self.user).access_token)
+        kid = self.add_key('EdDSA')
+        switched_at = timezone.now() + timedelta(seconds=1)
+
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', kid, switched_at.isoformat())):
+            self.assertAccessAllowed(hs256_access)
+        # Rejected unless a switch time is set
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', kid)):
+            self.assertAccessAllowed(hs256_access, allowed=False)
+        # Tokens issued after the switch are rejected
+        earlier = (switched_at - timedelta(minutes=1)).isoformat()
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', kid, earlier)):
+            self.assertAccessAllowed(hs256_access, allowed=False)
+        # Nothing is accepted once the refresh tokens issued before the switch expired
+        with override_settings(JWT_SIGNING=self.signing_settings('EdDSA', kid, switched_at.isoformat())):
+            backend = signing.get_token_backend()
+            self.assertTrue(backend.decode_hs256(hs256_access, verify=False))
+            later = switched_at + api_settings.REFRESH_TOKEN_LIFETIME
+            with patch('quicksign.utils.signing.timezone.now', return_value=later):
+                with self.assertRaises(TokenBackendError):
+                    backend.decode_hs256(hs256_access, verify=False)
+
+
+class ImportUsersCommandTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        CustomUser.objects.create_user(
+            phone_number='+989100000000',
+            email='existing@example.com',
+            password='testPass123'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def write(self, name, content):
+        path = os.path.join(self.tmpdir, name)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def read_rejects(self, path):
+        with open(f'{path}.rejects.ndjson') as f:
+            return {reject['line']: reject for reject in map(json.loads, f)}
+
+    def test_import_csv(self):
+        password_hash = get_hasher('pbkdf2_sha256').encode('legacyPass1', 'salt1234', iterations=1000)
+        path = self.write('users.csv', '\n'.join([
+            'phone_number,email,first_name,last_name,password,password_hash',
+            '+989111111111,one@example.com,One,User,onePass123,',
+            f'+989122222222,two@example.com,Two,User,,{password_hash}',
+            '+989133333333,three@example.com,Three,User,,',
+            '0914444444,four@example.com,Four,User,fourPass123,',
+            '+989155555555,EXISTING@example.com,Five,User,fivePass123,',
+            '+989111111111,six@example.com,Six,User,sixPass123,',
+            '+989177777777,seven@example.com,Seven,User,,not-a-hash',
+        ]))
+        out = StringIO()
+        call_command('import_users', path, workers=0, chunk_size=100, stdout=out)
+
+        self.assertIn('Imported 3 of 7 rows', out.getvalue())
+        self.assertTrue(CustomUser.objects.get(phone_number='+989111111111').check_password('onePass123'))
+        self.assertTrue(CustomUser.objects.get(phone_number='+989122222222').check_password('legacyPass1'))
+        self.assertFalse(CustomUser.objects.get(phone_number='+989133333333').has_usable_password())
+
+        rejects = self.read_rejects(path)
+        self.assertEqual(sorted(rejects), [5, 6, 7, 8])
+        self.assertIn('phone_number', rejects[5]['errors'])
+        self.assertIn('user', rejects[6]['errors'])
+        self.assertIn('phone_number', rejects[7]['errors'])
+        self.assertIn('password_hash', rejects[8]['errors'])
+        self.assertNotIn('password', rejects[5]['row'])
+
+    def test_import_ndjson_on_process_pool(self):
+        path = self.write('users.ndjson', '\n'.join([
+            json.dumps({'phone_number': f'+98919000000{i}', 'email': f'user{i}@example.com', 'password': f'pass{i}word'})
+            for i in range(3)
+        ] + ['not json']))
+        call_command('import_users', path, workers=1, chunk_size=2, stdout=StringIO())
+
+        self.assertTrue(CustomUser.objects.get(phone_number='+989190000002').check_password('pass2word'))
+        self.assertEqual(list(self.read_rejects(path)), [4])
+
+
+@override_settings(USER_EXPORT={'CHUNK_SIZE': 2000, 'SAFETY_MARGIN': 0})
+class UserExportTest(APITestCase):
+    def setUp(self):
+        cache.clear()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.users = [
+            CustomUser.objects.create_user(
+                phone_number=f'+98912000000{i}',
+                email=f'user{i}@example.com',
+                password='testPass123',
+                first_name='Export'
+            )
+            for i in range(3)
+        ]
+        self.staff = CustomUser.objects.create_user(
+            phone_number='+989129999999',
+            email='staff@example.com',
+            password='testPass123',
+            is_staff=True
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_command_exports_changes_since_watermark(self):
+        output = os.path.join(self.tmpdir, 'users.ndjson')
+        watermark = os.path.join(self.tmpdir, 'watermark')
+        call_command('export_users', output=output, watermark_file=watermark, chunk_size=2, stderr=StringIO())
+        with open(output) as f:
+            rows = [json.loads(line) for line in f]
+        self.assertEqual(len(rows), 4)
+        self.assertNotIn('password', rows[0])
+        self.assertEqual(rows[0]['phone_number'], '+989120000000')
+
+        self.users[1].first_name = 'Changed'
+        self.users[1].save()
+        output = os.path.join(self.tmpdir, 'changes.csv')
+        call_command('export_users', output=output, watermark_file=watermark, stderr=StringIO())
+        with open(output) as f:
+            lines = f.read().splitlines()
+        self.assertEqual(lines[0].split(',')[:3], ['id', 'phone_number', 'email'])
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Changed', lines[1])
+
+    def test_api_streams_for_staff_only(self):
+        url = reverse('export-users')
+        self.client.force_authenticate(self.users[0])
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(url, {'output': 'csv'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 5)
+
+        response = self.client.get(url, {'since': response['X-Export-Watermark']})
+        self.assertEqual(b''.join(response.streaming_content), b'')
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_export_stops_before_open_transactions(self):
+        with override_settings(USER_EXPORT={'CHUNK_SIZE': 2000, 'SAFETY_MARGIN': 300}):
+            export = UserExport()
+        self.assertLessEqual(export.until, timezone.now() - timedelta(seconds=300))
+        # Rows changed within the margin are left to the next export
+        self.assertEqual(list(export.iter_ndjson()), [])
+        self.assertEqual(UserExport(since=export.until).queryset().count(), 4)
+
+
+class CustomUserAdminTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.admin = CustomUser.objects.create_superuser(
+            phone_number='+989130000000',
+            email='admin@example.com',
+            password='testPass123'
+        )
+        CustomUser.objects.create_user(
+            phone_number='+989131111111',
+            email='jane@example.com',
+            password='testPass123',
+            first_name='Jane',
+            last_name='Doe'
+        )
+        self.client.force_login(self.admin)
+        self.url = reverse('admin:users_customuser_changelist')
+
+    def tearDown(self):
+        cache.clear()
+
+    def search(self, term):
+        response = self.client.get(self.url, {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return sorted(user.phone_number for user in response.context['cl'].result_list)
+
+    def test_phone_prefix_search(self):
+        self.assertEqual(self.search('+98913'), ['+989130000000', '+989131111111'])
+        self.assertEqual(self.search('0913111'), ['+989131111111'])
+        self.assertEqual(self.search('989131111111'), ['+989131111111'])
+        # Phone numbers are matched from the start only
+        self.assertEqual(self.search('1111'), [])
+
+    def test_name_and_email_search(self):
+        self.assertEqual(self.search('ane'), ['+989131111111'])
+        self.assertEqual(self.search('ADMIN@'), ['+989130000000'])
+
+    def test_estimated_count(self):
+        with patch('quicksign.utils.pagination.estimated_count', return_value=5_000_000):
+            response = self.client.get(self.url)
+            self.assertEqual(response.context['cl'].result_count, 5_000_000)
+            # Searches are counted exactly
+            response = self.client.get(self.url, {'q': 'jane'})
+            self.assertEqual(response.context['cl'].result_count, 1)
+
+
+class BenchmarkDbCommandTest(TestCase):
+    def test_compares_connection_profiles(self):
+        CustomUser.objects.create_user(phone_number='+989140000000', email='bench@example.com', password='testPass123')
+        out = StringIO()
+        aliases = []
+
+        # The test runner forbids the worker threads' connections, so the timed
+        # loop is replaced; each profile still gets its own configured alias
+        def run(command, alias, users, options):
+            aliases.append(alias)
+            settings_dict = connections.settings[alias]
+            return {'throughput': 100, 'p50': 1 if settings_dict['OPTIONS'].get('pool') else 3, 'p95': 4, 'p99': 5}
+
+        with patch('quicksign.apps.users.management.commands.benchmark_db.Command.run', run):
+            call_command('benchmark_db', requests=20, concurrency=2, stdout=out)
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual([line.split()[0] for line in lines], ['per-request', 'pooled', 'pooled+prepared'])
+        self.assertIn('(3.0x per-request p50)', lines[2])
+        self.assertEqual(aliases, ['benchmark_per-request', 'benchmark_pooled', 'benchmark_pooled+prepared'])
+        self.assertFalse(set(aliases) & set(connections.settings))
+
+
+class CalibrateHashersCommandTest(TestCase):
+    def test_writes_recommended_params(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            output = os.path.join(tmpdir, 'hasher_params.json')
+            call_command(
+                'calibrate_hashers',
+                target_ms=1,
+                samples=1,
+                algorithms=['pbkdf2_sha256', 'scrypt'],
+                output=output,
+                stdout=StringIO(),
+                stderr=StringIO()
+            )
+            with open(output) as params_file:
+                params = json.load(params_file)
+
+        # A 1ms target is unreachable, so the minimum parameters are recommended
+        self.assertEqual(params['pbkdf2_sha256'], {'iterations': PBKDF2PasswordHasher.iterations})
+        self.assertEqual(params['scrypt']['work_factor'], 2 ** 14)
+
+        with override_settings(PASSWORD_HASHER_PARAMS=params):
+            hasher = get_hasher('pbkdf2_sha256')
+            self.assertEqual(hasher.iterations, PBKDF2PasswordHasher.iterations)
+            self.assertTrue(hasher.must_update(hasher.encode('password', hasher.salt(), iterations=1000)))
+
+    def test_params_below_defaults_are_ignored(self):
+        with override_settings(PASSWORD_HASHER_PARAMS={'pbkdf2_sha256': {'iterations': 1000}}):
+            hasher = get_hasher('pbkdf2_sha256')
+            self.assertEqual(hasher.iterations, PBKDF2PasswordHasher.iterations)
+            encoded = hasher.encode('password', hasher.salt(), iterations=PBKDF2PasswordHasher.iterations)
+            self.assertFalse(hasher.must_update(encoded))
+
+
+class AsyncUsersViewsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(
+            phone_number='+989123456789',
+            email='test@example.com',
+            password='testpass123',
+            first_name='Test',
+            last_name='User'
+        )
+
+    def tearDown(self):
+        cache.clear()
+
+    @patch('quicksign.apps.users.tasks.send_verification_code.delay')
+    async def test_check_unregistered_phone(self, mock_send):
+        response = await self.async_client.post(
+            reverse('async-check-phone'), {'phone_number': '+989222222222'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertEqual(response.json()['status'], 'not_registered')
+        self.assertEqual(response.json()['data']['retry_after'], 60)
+        mock_send.assert_called_once()
+
+    async def test_check_registered_phone(self):
+        response = await self.async_client.post(
+            reverse('async-check-phone'), {'phone_number': '+989123456789'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['user_id'], self.user.pk)
+
+    async def test_check_blocked_phone(self):
+        BlockService.block_user(phone_number='+989123456789')
+        response = await self.async_client.post(
+            reverse('async-check-phone'), {'phone_number': '+989123456789'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
+
+    async def test_check_throttled(self):
+        url = reverse('async-check-phone')
+        await self.async_client.post(url, {'phone_number': '+989123456789'}, content_type='application/json')
+        response = await self.async_client.post(url, {'phone_number': '+989123456789'}, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertIn('Retry-After', response.headers)
+
+    async def test_check_invalid_phone(self):
+        response = await self.async_client.post(
+            reverse('async-check-phone'), {'phone_number': 'invalid'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('phone_number', response.json())
+
+    async def test_login(self):
+        url = reverse('async-login-user')
+        response = await self.async_client.post(
+            url, {'phone_number': '+989123456789', 'password': 'wrongpass'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(response.json()['remaining_attempts'], 2)
+
+        response = await self.async_client.post(
+            url, {'phone_number': '+989123456789', 'password': 'testpass123'}, content_type='application/json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('access', response.json())
+        self.assertEqual(BlockService.get_status(ip_address='127.0.0.1').attempts, 0)
+
+    async def test_register(self):
+        data = {
+            'phone_number': '+989333333333',
+            'code': '123456',
+            'email': 'new@example.com',
+            'first_name': 'new',
+            'last_name': 'user',
+            'password': 'securepassword123',
+            'confirm_password': 'securepassword123'
+        }
+        with patch.object(OTPService, 'avalidate_code', return_value=False):
+            response = await self.async_client.post(reverse('async-register-user'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json()['code'][0], 'invalid_otp')
+
+        with patch.object(OTPService, 'avalidate_code', return_value=True):
+            response = await self.async_client.post(reverse('async-register-user'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIn('refresh', response.json())
+        self.assertTrue(await CustomUser.objects.filter(phone_number='+989333333333').aexists())
+
+        data['phone_number'] = '+989444444444'
+        data['email'] = 'NEW@example.com'
+        with patch.object(OTPService, 'avalidate_code', return_value=True) as mock_validate:
+            response = await self.async_client.post(reverse('async-register-user'), data, content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.json(), {'email': ['A user with that email already exists.']})
+        mock_validate.assert_not_called()
@@ -1,13 +1,109 @@
+from rest_framework.exceptions import Throttled
 from rest_framework.throttling import SimpleRateThrottle
 
+from .validators import normalize_phone_number
+from quicksign.utils.ratelimit import GCRARateLimiter
 
-class PhoneCheckThrottle(SimpleRateThrottle):
-    scope = 'phone_check_request'
+
+class GCRAThrottle(SimpleRateThrottle):
+    """
+    SimpleRateThrottle backed by an atomic GCRA limiter in Redis.
+
+    Rates and cache keys are resolved exactly like SimpleRateThrottle, but no
+    request history is stored: one round trip decides each request.
+    """
+
+    def get_cost(self, request, view):
+        return 1
+
+    def allow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        cost = self.get_cost(request, view)
+        limiter = GCRARateLimiter(self.num_requests, self.duration)
+        return self.decide(limiter.hit(self.key, cost=cost), cost)
+
+    async def aallow_request(self, request, view):
+        if self.rate is None:
+            return True
+
+        self.key = self.get_cache_key(request, view)
+        if self.key is None:
+            return True
+
+        cost = self.get_cost(request, view)
+        limiter = GCRARateLimiter(self.num_requests, self.duration)
+        return self.decide(await limiter.ahit(self.key, cost=cost), cost)
+
+    def decide(self, result, cost):
+        if result.retry_after is None:
+            # No amount of waiting lets this request through
+            raise Throttled(detail=(
+                f"Request costs {cost} units but at most {self.num_requests} "
+                f"are allowed per {self.duration} seconds."
+            ))
+        self.retry_after = result.retry_after
+        return result.allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class PhoneNumberRateThrottle(GCRAThrottle):
+    """
+    Throttle keyed on the client IP together with the submitted phone number.
+
+    Numbers are keyed in canonical form, so writing one as 09... or
+    0098... does not get a fresh limit.
+    """
 
     def get_cache_key(self, request, view):
         phone_number = request.data.get('phone_number', '')
+        phone_number = normalize_phone_number(phone_number) or phone_number
         ident = f"{self.get_ident(request)}_{phone_number}"
         return self.cache_format % {
             'scope': self.scope,
             'ident': ident
-        }
\ No newline at end of file
+        }
+
+
+class PhoneCheckThrottle(PhoneNumberRateThrottle):
+    scope = 'phone_check_request'
+
+
+class LoginThrottle(PhoneNumberRateThrottle):
+    scope = 'login_request'
+
+
+class RegisterThrottle(PhoneNumberRateThrottle):
+    scope = 'register_request'
+
+
+class PhoneBulkCheckThrottle(GCRAThrottle):
+    """
+    Per-client throttle where each batch costs one unit per distinct valid
+    phone number, however often or in whichever notation it was sent.
+    """
+    scope = 'phone_bulk_check_request'
+
+    def get_cost(self, request, view):
+        phone_numbers = request.data.get('phone_numbers')
+        if not isinstance(phone_numbers, list):
+            return 1
+        distinct = {normalize_phone_number(phone_number) for phone_number in phone_numbers} - {None}
+        return max(1, len(distinct))
+
+    def get_cache_key(self, request, view):
+        if request.user and request.user.is_authenticated:
+            ident = request.user.pk
+        else:
+            ident = self.get_ident(request)
+        return self.cache_format % {
+            'scope': self.scope,
+            'ident': ident
+        }
@@ -0,0 +1,102 @@
+from uuid import uuid4
+
+from django.utils.translation import gettext_lazy as _
+
+from rest_framework_simplejwt import tokens
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import aware_utcnow, datetime_from_epoch
+
+from quicksign.utils.revocation import TokenDenyList
+from quicksign.utils.signing import get_token_backend
+
+# Id shared by a refresh token, its rotations and the access tokens they issue
+FAMILY_CLAIM = "fam"
+
+
+class KeyRingMixin:
+    """
+    Sign and verify with the process-wide backend of JWT_SIGNING.
+    """
+
+    @property
+    def token_backend(self):
+        return get_token_backend()
+
+
+class DenyListMixin:
+    """
+    Reject tokens whose id or family is on the TokenDenyList.
+    """
+
+    @property
+    def jti_item(self):
+        return f"jti:{self.payload[api_settings.JTI_CLAIM]}"
+
+    @property
+    def family_item(self):
+        family = self.payload.get(FAMILY_CLAIM)
+        return f"fam:{family}" if family else None
+
+    def remaining_lifetime(self):
+        """
+        Seconds until this token expires.
+        """
+        exp = datetime_from_epoch(self.payload["exp"])
+        return (exp - aware_utcnow()).total_seconds()
+
+    def verify(self):
+        super().verify()
+        self.check_revoked()
+
+    def check_revoked(self):
+        if self.family_item and TokenDenyList.is_revoked(self.family_item):
+            raise TokenError(_("Token is revoked"))
+        if TokenDenyList.is_revoked(self.jti_item):
+            raise TokenError(_("Token is revoked"))
+
+    def revoke(self):
+        """
+        Deny this token and every token of its family until they expire.
+        """
+        TokenDenyList.revoke(self.jti_item, ttl=self.remaining_lifetime())
+        if self.family_item:
+            TokenDenyList.revoke(self.family_item, ttl=api_settings.REFRESH_TOKEN_LIFETIME.total_seconds())
+
+
+class AccessToken(KeyRingMixin, DenyListMixin, tokens.AccessToken):
+    pass
+
+
+class RefreshToken(KeyRingMixin, DenyListMixin, tokens.RefreshToken):
+    """
+    Single-use refresh token. Rotating it spends its id; presenting a spent
+    token again means it leaked, so the whole family is revoked.
+    """
+    access_token_class = AccessToken
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[FAMILY_CLAIM] = uuid4().hex
+        return token
+
+    def check_revoked(self):
+        if self.family_item and TokenDenyList.is_revoked(self.family_item):
+            raise TokenError(_("Token is revoked"))
+        if TokenDenyList.is_revoked(self.jti_item):
+            self.revoke()
+            raise TokenError(_("Token has already been used"))
+
+    def rotate(self):
+        """
+        Spend this token and turn it into its successor in the same family.
+        """
+        if not TokenDenyList.revoke(self.jti_item, ttl=self.remaining_lifetime()):
+            # Lost a race against another rotation of the same token
+            self.revoke()
+            raise TokenError(_("Token has already been used"))
+
+        self.set_jti()
+        self.set_exp()
+        self.set_iat()
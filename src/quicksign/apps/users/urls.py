@@ -1,9 +1,20 @@
 from django.urls import path
 
-from . import views
+from . import async_views, views
 
 urlpatterns = [
     path('phone-number/check/', views.PhoneNumberCheckView.as_view(), name='check-phone'),
+    path('phone-number/check/bulk/', views.PhoneNumberBulkCheckView.as_view(), name='check-phone-bulk'),
     path('login/', views.UserLoginView.as_view(), name='login-user'),
-    path('register/', views.UserRegisterView.as_view(), name='register-user')
+    path('register/', views.UserRegisterView.as_view(), name='register-user'),
+    path('token/refresh/', views.TokenRefreshView.as_view(), name='token-refresh'),
+    path('token/verify/', views.TokenVerifyView.as_view(), name='token-verify'),
+    path('logout/', views.LogoutView.as_view(), name='logout-user'),
+    path('export/', views.UserExportView.as_view(), name='export-users'),
+    path('metrics/', views.MetricsView.as_view(), name='metrics'),
+
+    # Async implementations of the hot endpoints, for ASGI deployments
+    path('async/phone-number/check/', async_views.AsyncPhoneNumberCheckView.as_view(), name='async-check-phone'),
+    path('async/login/', async_views.AsyncUserLoginView.as_view(), name='async-login-user'),
+    path('async/register/', async_views.AsyncUserRegisterView.as_view(), name='async-register-user'),
 ]
\ No newline at end of file
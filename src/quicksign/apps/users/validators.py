@@ -16,6 +16,23 @@ class PhoneNumberValidator(RegexValidator):
     code = "phone_number_is_invalid"
 
 
+# Country code or trunk prefix, then the national number of a mobile line
+NATIONAL_PHONE_NUMBER_RE = re.compile(r"(?:\+98|0098|98|0)?(9\d{9})")
+# Separators people type inside phone numbers
+PHONE_NUMBER_SEPARATORS_RE = re.compile(r"[\s\-().]")
+
+
+def normalize_phone_number(value) -> str | None:
+    """
+    Return the canonical '+989xxxxxxxxx' form of a mobile number written as
+    +989..., 00989..., 989..., 09... or 9..., or None if it is not one.
+    """
+    if not isinstance(value, str):
+        return None
+    match = NATIONAL_PHONE_NUMBER_RE.fullmatch(PHONE_NUMBER_SEPARATORS_RE.sub("", value))
+    return f"+98{match[1]}" if match else None
+
+
 def number_validator(password)-> any:
     """
     Validates that password contains at least one numeric character.
@@ -1,24 +1,56 @@
+import json
 import logging
 
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.db import IntegrityError
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.http import condition
 
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from rest_framework import serializers, status
 
+from .exports import UserExport
 from .models import CustomUser
-from .throttles import PhoneCheckThrottle
+from .permissions import CanBulkCheckPhoneNumbers
+from .throttles import PhoneCheckThrottle, PhoneBulkCheckThrottle, LoginThrottle, RegisterThrottle
+from .validators import normalize_phone_number
 from .serializers import (PhoneNumberCheckSerializer,
+                          PhoneNumberBulkCheckSerializer,
+                          TokenRefreshSerializer,
+                          TokenVerifySerializer,
+                          LogoutSerializer,
                           UserLoginSerializer,
                           UserRegisterSerializer,
+                          UserExportSerializer,
                           UserProfileSerializer)
-from quicksign.utils.services import BlockService, get_token_for_user, OTPService
+from quicksign.utils import hashing, metrics
+from quicksign.utils.hashing import HashingPoolSaturated
+from quicksign.utils.idempotency import IdempotencyMixin, issues_tokens
+from quicksign.utils.replicas import StickyReads, use_primary
+from quicksign.utils.services import BlockService, get_token_for_user, OTPService, PhoneRegistry
+from quicksign.utils.signing import get_token_backend
 
 # Create your views here.
 
 logger=logging.getLogger(__name__)
 
+
+def service_busy_response(exc):
+    return Response(
+        {
+            "code": "service_busy",
+            "detail": "Server is busy, please retry shortly"
+        },
+        status=status.HTTP_503_SERVICE_UNAVAILABLE,
+        headers={"Retry-After": str(exc.retry_after)}
+    )
+
+
 class PhoneNumberCheckView(APIView):
     throttle_classes = [PhoneCheckThrottle]
 
@@ -40,9 +72,9 @@ class PhoneNumberCheckView(APIView):
 
         phone_number = serializer.validated_data["phone_number"]
 
-        if BlockService.is_blocked(phone_number, ip_address):
-            block_status = BlockService.get_block_status(phone_number, ip_address)
-            remaining_minutes = block_status['block_time_left'] // 60
+        block_status = BlockService.get_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            remaining_minutes = block_status.block_time_left // 60
             return Response(
                 {
                     "code": "Account_temporarily_blocked.",
@@ -52,30 +84,99 @@ class PhoneNumberCheckView(APIView):
                 status=status.HTTP_403_FORBIDDEN
             )
 
-        try:
-            user = CustomUser.objects.get(phone_number=phone_number)
+        user_id = None
+        if PhoneRegistry.might_be_registered(phone_number) is not False:
+            with use_primary(StickyReads.is_sticky(phone_number)):
+                user_id = CustomUser.objects.filter(phone_number=phone_number).values_list("id", flat=True).first()
+
+        if user_id is not None:
             return Response(
                 {
                     "status": "registered",
                     "phone_number": phone_number,
                     "message": f"User {phone_number} needs to login",
-                    "user_id": user.id
+                    "user_id": user_id
                 },
                 status=status.HTTP_200_OK
             )
-        except CustomUser.DoesNotExist:
-            otp_response = OTPService.send_otp_code(phone_number)
+
+        otp_response = OTPService.send_otp_code(phone_number)
+        return Response(
+            {
+                "status": "not_registered",
+                "phone_number": phone_number,
+                **otp_response
+            },
+            status=status.HTTP_404_NOT_FOUND
+        )
+
+
+class PhoneNumberBulkCheckView(APIView):
+    """
+    Check the registration and block status of many phone numbers at once.
+
+    Every chunk of numbers is resolved with one database query and one Redis
+    MGET. Batches above PHONE_CHECK_BATCH['STREAM_THRESHOLD'] are streamed
+    as newline-delimited JSON, one result per line. No OTP codes are sent.
+    Only staff and partners with users.bulk_check_phone_numbers may call it.
+    """
+    permission_classes = [CanBulkCheckPhoneNumbers]
+    throttle_classes = [PhoneBulkCheckThrottle]
+
+    def post(self, request, *args, **kwargs):
+        ip_address = request.META.get('REMOTE_ADDR')
+
+        serializer = PhoneNumberBulkCheckSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        if BlockService.is_blocked(ip_address=ip_address):
             return Response(
                 {
-                    "status": "not_registered",
-                    "phone_number": phone_number,
-                    **otp_response
+                    "code": "Account_temporarily_blocked.",
+                    "detail": "Account temporarily blocked due to too many attempts",
                 },
-                status=status.HTTP_404_NOT_FOUND
+                status=status.HTTP_403_FORBIDDEN
             )
 
+        phone_numbers = serializer.validated_data["phone_numbers"]
+        if len(phone_numbers) > settings.PHONE_CHECK_BATCH['STREAM_THRESHOLD']:
+            lines = (json.dumps(result) + "\n" for result in self.iter_results(phone_numbers))
+            return StreamingHttpResponse(lines, content_type="application/x-ndjson")
+
+        return Response({"results": list(self.iter_results(phone_numbers))}, status=status.HTTP_200_OK)
+
+    def iter_results(self, phone_numbers):
+        chunk_size = settings.PHONE_CHECK_BATCH['CHUNK_SIZE']
+        for start in range(0, len(phone_numbers), chunk_size):
+            yield from self.check_chunk(phone_numbers[start:start + chunk_size])
+
+    def check_chunk(self, phone_numbers):
+        # Results echo the numbers as sent; lookups use the canonical form
+        normalized = {phone_number: normalize_phone_number(phone_number) for phone_number in phone_numbers}
+        valid = list({phone_number for phone_number in normalized.values() if phone_number is not None})
+
+        user_ids = {}
+        if valid:
+            with use_primary(StickyReads.is_sticky(*valid)):
+                user_ids = dict(CustomUser.objects.filter(phone_number__in=valid).values_list("phone_number", "id"))
+        blocked = BlockService.blocked_phone_numbers(valid)
 
-class UserLoginView(APIView):
+        for phone_number in phone_numbers:
+            canonical = normalized[phone_number]
+            if canonical is None:
+                yield {"phone_number": phone_number, "status": "invalid"}
+            elif canonical in blocked:
+                yield {"phone_number": phone_number, "status": "blocked"}
+            elif canonical in user_ids:
+                yield {"phone_number": phone_number, "status": "registered", "user_id": user_ids[canonical]}
+            else:
+                yield {"phone_number": phone_number, "status": "not_registered"}
+
+
+class UserLoginView(IdempotencyMixin, APIView):
+    throttle_classes = [LoginThrottle]
+    idempotency_scope = "login"
 
     def post(self, request, *args, **kwargs):
         ip_address = request.META.get('REMOTE_ADDR')
@@ -88,9 +189,9 @@ class UserLoginView(APIView):
         password = serializer.validated_data["password"]
 
         # Check if user or IP is blocked
-        if BlockService.is_blocked(phone_number, ip_address):
-            block_status = BlockService.get_block_status(phone_number, ip_address)
-            remaining_minutes = block_status['block_time_left'] // 60
+        block_status = BlockService.get_status(phone_number, ip_address)
+        if block_status.is_blocked:
+            remaining_minutes = block_status.block_time_left // 60
             return Response(
                 {
                     'detail': 'Account temporarily blocked due to too many attempts',
@@ -100,59 +201,81 @@ class UserLoginView(APIView):
             )
 
         # Attempt authentication
-        user = authenticate(phone_number=phone_number, password=password)
+        try:
+            with use_primary(StickyReads.is_sticky(phone_number)):
+                user = authenticate(phone_number=phone_number, password=password)
+        except HashingPoolSaturated as e:
+            return service_busy_response(e)
 
         if not user:
             # Handle failed attempt
-            attempts = BlockService.increment_attempts(phone_number, ip_address)
-            remaining_attempts = 3 - attempts
+            attempt = BlockService.record_failed_attempt(phone_number, ip_address)
+            remaining_attempts = max(0, BlockService.max_attempts - attempt.attempts)
             return Response(
                 {
                     'detail': 'Invalid credentials',
                     'remaining_attempts': remaining_attempts,
-                    'message': f'Account will be blocked after {remaining_attempts} more failed attempts' if remaining_attempts > 0 else 'Account blocked for 1 hour'
+                    'message': f'Account will be blocked after {remaining_attempts} more failed attempts' if not attempt.is_blocked else 'Account blocked for 1 hour'
                 },
                 status=status.HTTP_401_UNAUTHORIZED
             )
         BlockService.reset_attempts(ip_address)
 
-        return Response(get_token_for_user(user), status=status.HTTP_200_OK)
+        return issues_tokens(Response(get_token_for_user(user), status=status.HTTP_200_OK), user)
 
 
-class UserRegisterView(APIView):
+class UserRegisterView(IdempotencyMixin, APIView):
     """
     User registration endpoint with two-step validation:
-    1. OTP verification
-    2. Profile creation
+    1. Profile validation
+    2. OTP verification, which consumes the code
     """
+    throttle_classes = [RegisterThrottle]
+    idempotency_scope = "register"
+
     def post(self, request, *args, **kwargs):
         ip_address = request.META.get('REMOTE_ADDR')
-        # Step 1: Verify OTP
         auth_serializer = UserRegisterSerializer(data=request.data,context={"request": request})
         auth_serializer.is_valid(raise_exception=True)
 
         phone_number = auth_serializer.validated_data["phone_number"]
 
-        # Step 2: Create profile
+        # Step 1: Validate profile
         profile_serializer = UserProfileSerializer(data=request.data,context={'phone_number': phone_number})
         profile_serializer.is_valid(raise_exception=True)
 
+        # Hashed before the OTP is consumed: a saturated pool must leave
+        # the code usable for the retry
+        try:
+            password_hash = hashing.make_password(profile_serializer.validated_data["password"])
+        except HashingPoolSaturated as e:
+            return service_busy_response(e)
+
+        # Step 2: Verify OTP
+        try:
+            auth_serializer.check_otp()
+        except serializers.ValidationError as e:
+            return Response(serializers.as_serializer_error(e), status=status.HTTP_400_BAD_REQUEST)
+
         try:
             user = CustomUser.objects.create_user(
                 phone_number=phone_number,
                 email=profile_serializer.validated_data["email"],
                 first_name=profile_serializer.validated_data["first_name"],
                 last_name=profile_serializer.validated_data["last_name"],
-                password=profile_serializer.validated_data["password"]
+                password_hash=password_hash
             )
 
             BlockService.reset_attempts(ip_address)
-            return Response(
+            return issues_tokens(Response(
                 data=get_token_for_user(user),
                 status=status.HTTP_201_CREATED
-            )
+            ), user)
 
         except IntegrityError as e:
+            errors = CustomUser.unique_violation_errors(e)
+            if errors is not None:
+                return Response(errors, status=status.HTTP_400_BAD_REQUEST)
             return Response(
                 {
                     "code": "user_creation_failed",
@@ -169,3 +292,111 @@ class UserRegisterView(APIView):
                 },
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
+
+
+class TokenAPIView(APIView):
+    """
+    Base for endpoints that take a token in the body instead of a header.
+    """
+    authentication_classes = []
+
+    def get_authenticate_header(self, request):
+        # Answer invalid tokens with 401 rather than 403
+        return 'Bearer realm="api"'
+
+
+class TokenRefreshView(TokenAPIView):
+    """
+    Exchange a refresh token for a new access and refresh token pair.
+
+    Every refresh token can be used once; reusing one revokes the whole
+    login session it belongs to.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = TokenRefreshSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response(serializer.validated_data, status=status.HTTP_200_OK)
+
+
+class TokenVerifyView(TokenAPIView):
+    """
+    Check that an access or refresh token is valid and not revoked.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = TokenVerifySerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        return Response({}, status=status.HTTP_200_OK)
+
+
+class LogoutView(TokenAPIView):
+    """
+    Revoke a refresh token together with every token issued from the same
+    login, including access tokens that have not expired yet.
+    """
+
+    def post(self, request, *args, **kwargs):
+        serializer = LogoutSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        serializer.validated_data["refresh"].revoke()
+        return Response(status=status.HTTP_205_RESET_CONTENT)
+
+
+def jwks_etag(request, *args, **kwargs):
+    key_ring = getattr(get_token_backend(), "key_ring", None)
+    return key_ring.jwks_etag if key_ring else None
+
+
+@method_decorator(condition(etag_func=jwks_etag), name="get")
+class JWKSView(View):
+    """
+    Public keys that verify our tokens, as a JSON Web Key Set.
+
+    The document is built once per process and is safe for clients and
+    proxies to cache for JWT_SIGNING_JWKS_MAX_AGE.
+    """
+
+    def get(self, request, *args, **kwargs):
+        key_ring = getattr(get_token_backend(), "key_ring", None)
+        response = HttpResponse(key_ring.jwks if key_ring else b'{"keys":[]}', content_type="application/json")
+        response["Cache-Control"] = f"public, max-age={settings.JWT_SIGNING['JWKS_MAX_AGE']}"
+        return response
+
+
+class MetricsView(APIView):
+    """
+    Per-process counters of local caches and worker pools, for staff only.
+    """
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        return Response(metrics.snapshot(), status=status.HTTP_200_OK)
+
+
+class UserExportView(APIView):
+    """
+    Stream users changed after ``since`` as CSV or NDJSON, for staff only.
+
+    Rows are read through a server-side cursor, so memory stays flat however
+    many users are exported. The X-Export-Watermark header is the ``since``
+    of the next incremental export.
+    """
+    permission_classes = [IsAdminUser]
+    content_types = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
+    def get(self, request, *args, **kwargs):
+        serializer = UserExportSerializer(data=request.query_params)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        output = serializer.validated_data["output"]
+        export = UserExport(
+            since=serializer.validated_data.get("since"),
+            chunk_size=settings.USER_EXPORT['CHUNK_SIZE']
+        )
+        chunks = export.iter_csv() if output == "csv" else export.iter_ndjson()
+        response = StreamingHttpResponse(chunks, content_type=self.content_types[output])
+        response["Content-Disposition"] = f'attachment; filename="users-{export.until:%Y%m%dT%H%M%S}.{output}"'
+        response["X-Export-Watermark"] = export.until.isoformat()
+        return response
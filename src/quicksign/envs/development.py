@@ -1,4 +1,10 @@
 from .common import *
+from .common import (
+    DATABASE_POOL,
+    DATABASE_REPLICATION,
+    INSTALLED_APPS,
+    configure_database_pool,
+)
 
 DEBUG = True
 
@@ -30,6 +36,15 @@ DATABASES = {
         'PORT': '5432',
     }
 }
+configure_database_pool(DATABASES['default'], DATABASE_POOL)
+# Replicas configured in common.py are only kept if still defined here
+DATABASE_REPLICATION = {
+    **DATABASE_REPLICATION,
+    'REPLICAS': [
+        alias for alias in DATABASE_REPLICATION['REPLICAS']
+        if alias in DATABASES
+    ],
+}
 
 SPECTACULAR_SETTINGS = {
     'TITLE': 'Your Project API',
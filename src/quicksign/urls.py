@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.urls import path, include
 
+from quicksign.apps.users.views import JWKSView
+
 from drf_spectacular.views import SpectacularAPIView, SpectacularSwaggerView, SpectacularRedocView
 
 doc_urlpatterns = [
@@ -13,4 +15,5 @@ urlpatterns = [
     path('secret/', admin.site.urls),
     path('__debug__/', include("debug_toolbar.urls")),
     path('api/user/', include('quicksign.apps.users.urls')),
+    path('.well-known/jwks.json', JWKSView.as_view(), name='jwks'),
 ]+doc_urlpatterns
@@ -0,0 +1,26 @@
+import asyncio
+import weakref
+
+from django.conf import settings
+from redis import asyncio as aioredis
+
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_redis():
+    """
+    asyncio Redis client for the default cache's server and database.
+
+    Connections are bound to an event loop, so one client (and pool) is kept
+    per running loop. Keys must still be built with ``cache.make_key`` and
+    values with ``cache.client.encode`` to stay compatible with the cache.
+    """
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        location = settings.CACHES["default"]["LOCATION"]
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        client = aioredis.Redis.from_url(location)
+        _clients[loop] = client
+    return client
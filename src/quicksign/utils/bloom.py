@@ -0,0 +1,142 @@
+import hashlib
+import math
+
+from django.core.cache import cache
+
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.redis_scripts import RedisScript
+
+
+# Returns -1 when the filter has not been built, so callers can tell
+# "definitely absent" apart from "no filter".
+#   KEYS: bitmap
+#   ARGV: bit offsets
+BLOOM_CHECK_SCRIPT = RedisScript("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -1
+end
+for i = 1, #ARGV do
+    if redis.call('GETBIT', KEYS[1], ARGV[i]) == 0 then
+        return 0
+    end
+end
+return 1
+""")
+
+# Only sets bits on an existing filter; a partially populated filter would
+# report false negatives.
+#   KEYS: bitmap
+#   ARGV: bit offsets
+BLOOM_ADD_SCRIPT = RedisScript("""
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return 0
+end
+for i = 1, #ARGV do
+    redis.call('SETBIT', KEYS[1], ARGV[i], 1)
+end
+return 1
+""")
+
+
+class BloomFilter:
+    """
+    In-process Bloom filter sized for ``capacity`` items at ``error_rate``.
+
+    Bits are laid out like a Redis bitmap (bit 0 is the most significant bit
+    of byte 0), so ``bits`` can be uploaded as a RedisBloomFilter as-is.
+    """
+
+    def __init__(self, capacity, error_rate):
+        self._set_geometry(capacity, error_rate)
+        self.bits = bytearray(self.size_bytes)
+        self.count = 0
+
+    def _set_geometry(self, capacity, error_rate):
+        if capacity <= 0 or not 0 < error_rate < 1:
+            raise ValueError("capacity must be positive and error_rate within (0, 1)")
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+
+    @property
+    def size_bytes(self):
+        return (self.num_bits + 7) // 8
+
+    def offsets(self, item):
+        """
+        Bit positions for ``item`` using double hashing over one blake2b digest.
+        """
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        return [(h1 + i * h2) % self.num_bits for i in range(self.num_hashes)]
+
+    def add(self, item):
+        for offset in self.offsets(item):
+            self.bits[offset >> 3] |= 0x80 >> (offset & 7)
+        self.count += 1
+
+    def __contains__(self, item):
+        return all(self.bits[offset >> 3] & (0x80 >> (offset & 7)) for offset in self.offsets(item))
+
+    def false_positive_rate(self, count=None):
+        """
+        Expected false-positive rate once ``count`` items have been added.
+        """
+        count = self.count if count is None else count
+        return (1 - math.exp(-self.num_hashes * count / self.num_bits)) ** self.num_hashes
+
+
+class RedisBloomFilter(BloomFilter):
+    """
+    Bloom filter whose bitmap lives in Redis, shared by all workers.
+
+    The key embeds the filter geometry, so changing capacity or error rate
+    points at a new (unbuilt) filter instead of misreading the old one.
+    """
+
+    def __init__(self, name, capacity, error_rate):
+        self._set_geometry(capacity, error_rate)
+        self.key = cache.make_key(f"{name}_{self.num_bits}_{self.num_hashes}")
+
+    def might_contain(self, item):
+        """
+        True if ``item`` may be present, False if it is definitely absent and
+        None if the filter has not been built yet.
+        """
+        found = BLOOM_CHECK_SCRIPT(cache.client.get_client(), keys=[self.key], args=self.offsets(item))
+        return None if found == -1 else bool(found)
+
+    async def amight_contain(self, item):
+        found = await BLOOM_CHECK_SCRIPT.acall(get_async_redis(), keys=[self.key], args=self.offsets(item))
+        return None if found == -1 else bool(found)
+
+    def add(self, item):
+        return bool(BLOOM_ADD_SCRIPT(cache.client.get_client(), keys=[self.key], args=self.offsets(item)))
+
+    def add_many(self, items):
+        """
+        Add ``items`` in a single round trip.
+        """
+        pipe = cache.client.get_client().pipeline(transaction=False)
+        for item in items:
+            BLOOM_ADD_SCRIPT(pipe, keys=[self.key], args=self.offsets(item))
+        return all(pipe.execute())
+
+    def __contains__(self, item):
+        return bool(self.might_contain(item))
+
+    def replace(self, local_filter):
+        """
+        Atomically swap the Redis bitmap for the bits of a locally built filter.
+        """
+        redis_client = cache.client.get_client()
+        staging_key = f"{self.key}_staging"
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.set(staging_key, bytes(local_filter.bits))
+        pipe.rename(staging_key, self.key)
+        pipe.execute()
+
+    def exists(self):
+        return bool(cache.client.get_client().exists(self.key))
@@ -0,0 +1,27 @@
+def configure_database_pool(database, options):
+    """
+    Apply the DATABASE_POOL ``options`` to one entry of DATABASES. Imported
+    by the settings, so it must not need them.
+    """
+    if database["ENGINE"] != "django.db.backends.postgresql":
+        return database
+    database_options = database.setdefault("OPTIONS", {})
+    if options["MODE"] == "native":
+        # Health checks make the pool test connections before handing them out
+        database["CONN_HEALTH_CHECKS"] = True
+        database_options["pool"] = {
+            "min_size": options["MIN_SIZE"],
+            "max_size": options["MAX_SIZE"],
+            "timeout": options["TIMEOUT"],
+            "max_idle": options["MAX_IDLE"],
+            "max_lifetime": options["MAX_LIFETIME"],
+        }
+    elif options["MODE"] == "pgbouncer":
+        database["CONN_MAX_AGE"] = options["PGBOUNCER_CONN_MAX_AGE"]
+        database["CONN_HEALTH_CHECKS"] = True
+        database["DISABLE_SERVER_SIDE_CURSORS"] = True
+        return database
+    if options["PREPARE_THRESHOLD"]:
+        database_options["server_side_binding"] = True
+        database_options["prepare_threshold"] = options["PREPARE_THRESHOLD"]
+    return database
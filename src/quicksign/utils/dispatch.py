@@ -0,0 +1,246 @@
+import json
+import logging
+import socket
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+from quicksign.utils import metrics
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.sms import SMSDeliveryError, SMSMessage, SMSResult, get_sms_provider
+
+logger = logging.getLogger(__name__)
+
+
+class OTPDispatcher:
+    """
+    Micro-batching stage between OTPService and the SMS provider.
+
+    Web workers push OTP sends onto a Redis list with ``enqueue``. A single
+    dispatcher process (``manage.py run_otp_dispatcher``) drains the list in
+    batches of up to ``max_batch_size`` messages or ``max_latency`` seconds
+    after the first one. Each batch goes out through the provider's bulk API
+    in one call, and a delivery result is stored per message.
+
+    Collected messages are moved to a processing list of the dispatcher's
+    ``worker_id`` and removed only once their results are stored. Whatever a
+    crashed or failed run left there is queued again on the next start, so
+    a message is sent at least once; every dispatcher needs its own id.
+    Batches that failed with a temporary error are queued again the same
+    way, and messages whose code expired meanwhile are dropped unsent.
+    """
+
+    def __init__(self, provider=None, max_batch_size=None, max_latency=None, worker_id=None):
+        options = settings.OTP_DISPATCH
+        self.provider = provider or get_sms_provider()
+        self.max_batch_size = max_batch_size or options["MAX_BATCH_SIZE"]
+        self.max_latency = max_latency if max_latency is not None else options["MAX_LATENCY_MS"] / 1000
+        self.worker_id = worker_id or socket.gethostname()
+
+    @staticmethod
+    def queue_key():
+        return cache.make_key("otp_outbox")
+
+    def processing_key(self):
+        return cache.make_key(f"otp_outbox_processing_{self.worker_id}")
+
+    @staticmethod
+    def stats_key():
+        return cache.make_key("otp_dispatcher_stats")
+
+    @staticmethod
+    def result_key(message_id):
+        return cache.make_key(f"otp_delivery_{message_id}")
+
+    @staticmethod
+    def latest_key(phone_number):
+        return cache.make_key(f"otp_delivery_latest_{phone_number}")
+
+    @staticmethod
+    def _queue_enqueue_commands(pipe, phone_number, verification_code, ttl):
+        message_id = uuid.uuid4().hex
+        now = time.time()
+        payload = json.dumps({
+            "id": message_id,
+            "phone_number": phone_number,
+            "code": verification_code,
+            "enqueued_at": now,
+            "expires_at": now + ttl if ttl else None,
+        })
+        result_ttl = settings.OTP_DISPATCH["RESULT_TTL"]
+        pipe.rpush(OTPDispatcher.queue_key(), payload)
+        pipe.set(OTPDispatcher.result_key(message_id), json.dumps({"status": "queued"}), ex=result_ttl)
+        pipe.set(OTPDispatcher.latest_key(phone_number), message_id, ex=result_ttl)
+        return message_id
+
+    @staticmethod
+    def enqueue(phone_number, verification_code, ttl=None):
+        """
+        Queue an OTP send and return the id to look up its delivery result.
+
+        A message still queued ``ttl`` seconds from now, when its code has
+        expired, is dropped instead of sent.
+        """
+        pipe = cache.client.get_client().pipeline(transaction=False)
+        message_id = OTPDispatcher._queue_enqueue_commands(pipe, phone_number, verification_code, ttl)
+        pipe.execute()
+        return message_id
+
+    @staticmethod
+    async def aenqueue(phone_number, verification_code, ttl=None):
+        pipe = get_async_redis().pipeline(transaction=False)
+        message_id = OTPDispatcher._queue_enqueue_commands(pipe, phone_number, verification_code, ttl)
+        await pipe.execute()
+        return message_id
+
+    @staticmethod
+    def delivery_status(message_id):
+        raw = cache.client.get_client().get(OTPDispatcher.result_key(message_id))
+        return json.loads(raw) if raw else None
+
+    @staticmethod
+    def latest_delivery_status(phone_number):
+        """
+        Delivery result of the last code queued for ``phone_number``.
+        """
+        message_id = cache.client.get_client().get(OTPDispatcher.latest_key(phone_number))
+        return OTPDispatcher.delivery_status(message_id.decode()) if message_id else None
+
+    @staticmethod
+    def stats():
+        raw = cache.client.get_client().hgetall(OTPDispatcher.stats_key())
+        counters = {key.decode(): int(value) for key, value in raw.items()}
+        batches = counters.get("batches", 0)
+        messages = counters.get("messages", 0)
+        provider_calls = counters.get("provider_calls", 0)
+        return {
+            "batches": batches,
+            "messages": messages,
+            "failed": counters.get("failed", 0),
+            "provider_calls": provider_calls,
+            "provider_calls_saved": messages - provider_calls,
+            "avg_batch_size": round(messages / batches, 2) if batches else 0.0,
+            "avg_flush_latency_ms": round(counters.get("flush_latency_ms", 0) / batches, 2) if batches else 0.0,
+        }
+
+    def collect(self, block_timeout=1):
+        """
+        Wait up to ``block_timeout`` seconds for a message, then keep
+        collecting until the batch is full or ``max_latency`` has passed.
+        """
+        redis_client = cache.client.get_client()
+        queue_key = self.queue_key()
+        processing_key = self.processing_key()
+        raw = redis_client.blmove(queue_key, processing_key, block_timeout, "LEFT", "RIGHT")
+        if raw is None:
+            return []
+
+        batch = [raw]
+        deadline = time.monotonic() + self.max_latency
+        while len(batch) < self.max_batch_size:
+            pipe = redis_client.pipeline(transaction=False)
+            for _ in range(self.max_batch_size - len(batch)):
+                pipe.lmove(queue_key, processing_key, "LEFT", "RIGHT")
+            moved = [raw for raw in pipe.execute() if raw is not None]
+            if moved:
+                batch.extend(moved)
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            raw = redis_client.blmove(queue_key, processing_key, remaining, "LEFT", "RIGHT")
+            if raw is None:
+                break
+            batch.append(raw)
+        # The raw payload identifies the message in the processing list
+        return [{**json.loads(raw), "raw": raw} for raw in batch]
+
+    def requeue(self):
+        """
+        Put messages left in the processing list back at the head of the
+        queue, in their original order. Returns how many were moved.
+        """
+        redis_client = cache.client.get_client()
+        moved = 0
+        while redis_client.lmove(self.processing_key(), self.queue_key(), "RIGHT", "LEFT") is not None:
+            moved += 1
+        if moved:
+            logger.warning(f"Requeued {moved} OTP messages left unacknowledged by {self.worker_id}")
+        return moved
+
+    def flush(self, batch):
+        """
+        Send a batch through the provider and record per-message results.
+
+        A temporary provider error is raised with the batch left in the
+        processing list, to be queued again by ``requeue``.
+        """
+        if not batch:
+            return []
+
+        now = time.time()
+        pending, expired = [], []
+        for item in batch:
+            (expired if item.get("expires_at") and item["expires_at"] <= now else pending).append(item)
+        messages = [
+            SMSMessage(item["phone_number"], settings.SMS_VERIFICATION_MESSAGE.format(code=item["code"]))
+            for item in pending
+        ]
+        try:
+            results = list(self.provider.send_bulk(messages)) if messages else []
+        except SMSDeliveryError as e:
+            if e.temporary:
+                raise
+            results = [SMSResult(phone_number=message.phone_number, success=False, error=str(e)) for message in messages]
+        # A provider answering for fewer messages must not drop the rest
+        results += [
+            SMSResult(phone_number=message.phone_number, success=False, error="missing_result")
+            for message in messages[len(results):]
+        ]
+        flush_latency_ms = int((now - min(item["enqueued_at"] for item in batch)) * 1000)
+        provider_calls = (1 if self.provider.supports_bulk else len(messages)) if messages else 0
+        failed = sum(not result.success for result in results) + len(expired)
+
+        # Results and acknowledgements are written together
+        pipe = cache.client.get_client().pipeline(transaction=True)
+        processing_key = self.processing_key()
+        outcomes = [
+            (item, {"status": "sent" if result.success else "failed",
+                    "provider_message_id": result.message_id, "error": result.error})
+            for item, result in zip(pending, results)
+        ]
+        outcomes += [(item, {"status": "expired", "provider_message_id": "", "error": "code_expired"}) for item in expired]
+        for item, outcome in outcomes:
+            pipe.lrem(processing_key, 1, item["raw"])
+            pipe.set(self.result_key(item["id"]), json.dumps(outcome), ex=settings.OTP_DISPATCH["RESULT_TTL"])
+        stats_key = self.stats_key()
+        pipe.hincrby(stats_key, "batches", 1)
+        pipe.hincrby(stats_key, "messages", len(batch))
+        pipe.hincrby(stats_key, "failed", failed)
+        pipe.hincrby(stats_key, "provider_calls", provider_calls)
+        pipe.hincrby(stats_key, "flush_latency_ms", flush_latency_ms)
+        pipe.execute()
+
+        logger.info(
+            f"Flushed {len(batch)} OTP messages in {provider_calls} provider call(s), "
+            f"{failed} failed, oldest waited {flush_latency_ms}ms"
+        )
+        return results
+
+    def run_forever(self):
+        self.requeue()
+        while True:
+            try:
+                self.flush(self.collect())
+            except Exception as e:
+                logger.error(f"OTP dispatcher iteration failed: {str(e)}")
+                time.sleep(1)
+                try:
+                    self.requeue()
+                except Exception as e:
+                    logger.error(f"Requeueing OTP messages failed: {str(e)}")
+
+
+metrics.register("otp_dispatcher", OTPDispatcher.stats)
@@ -0,0 +1,69 @@
+"""
+Password hashers whose cost parameters come from PASSWORD_HASHER_PARAMS.
+
+``manage.py calibrate_hashers`` measures the configured hashers on the local
+CPU and writes the parameters that hit a target verify latency to
+PASSWORD_HASHER_PARAMS_FILE, which settings load into PASSWORD_HASHER_PARAMS.
+Algorithms without calibrated parameters keep Django's defaults, which are
+also the floor for the cost parameters. Hashes made with other parameters
+are upgraded on the next successful login.
+"""
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import (Argon2PasswordHasher, PBKDF2PasswordHasher,
+                                         ScryptPasswordHasher, make_password)
+
+
+def calibrated_params(algorithm):
+    return settings.PASSWORD_HASHER_PARAMS.get(algorithm, {})
+
+
+def setup_hashing_process():
+    """
+    Initializer for worker processes that run ``make_passwords``; this
+    module imports no models, so spawned workers can load it before setup.
+    """
+    django.setup()
+
+
+def make_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+class CalibratedPBKDF2PasswordHasher(PBKDF2PasswordHasher):
+    @property
+    def iterations(self):
+        return max(calibrated_params(self.algorithm).get("iterations", 0), PBKDF2PasswordHasher.iterations)
+
+
+class CalibratedScryptPasswordHasher(ScryptPasswordHasher):
+    @property
+    def work_factor(self):
+        return max(calibrated_params(self.algorithm).get("work_factor", 0), ScryptPasswordHasher.work_factor)
+
+    @property
+    def block_size(self):
+        return calibrated_params(self.algorithm).get("block_size", ScryptPasswordHasher.block_size)
+
+    @property
+    def parallelism(self):
+        return calibrated_params(self.algorithm).get("parallelism", ScryptPasswordHasher.parallelism)
+
+    @property
+    def maxmem(self):
+        # Room for the 128 * n * r byte working set beyond OpenSSL's 32 MiB default
+        return 256 * self.work_factor * self.block_size
+
+
+class CalibratedArgon2PasswordHasher(Argon2PasswordHasher):
+    @property
+    def time_cost(self):
+        return max(calibrated_params(self.algorithm).get("time_cost", 0), Argon2PasswordHasher.time_cost)
+
+    @property
+    def memory_cost(self):
+        return max(calibrated_params(self.algorithm).get("memory_cost", 0), Argon2PasswordHasher.memory_cost)
+
+    @property
+    def parallelism(self):
+        return calibrated_params(self.algorithm).get("parallelism", Argon2PasswordHasher.parallelism)
@@ -0,0 +1,191 @@
+import asyncio
+import functools
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import hashers
+
+from quicksign.apps.users.tasks import update_password_hash
+from quicksign.utils import metrics
+
+
+class HashingPoolSaturated(Exception):
+    """
+    Raised without queueing when the hashing pool already holds
+    ``max_workers + max_queue`` jobs.
+    """
+
+    def __init__(self, retry_after):
+        super().__init__("Password hashing pool is saturated")
+        self.retry_after = retry_after
+
+
+class HashingPool:
+    """
+    Bounded thread pool for password hashing and verification.
+
+    PBKDF2, scrypt and argon2 release the GIL while hashing, so threads give
+    real parallelism. At most ``max_workers`` hashes run at once and at most
+    ``max_queue`` more wait for a worker; anything beyond that fails fast
+    with HashingPoolSaturated instead of adding latency for every request.
+    """
+
+    def __init__(self, max_workers, max_queue, retry_after=1):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hashing")
+        self._slots = threading.BoundedSemaphore(max_workers + max_queue)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.active = 0
+        self.completed = 0
+        self.rejected = 0
+        self.wait_time = 0.0
+        self.run_time = 0.0
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue ``fn`` on a pool worker and return its Future.
+        """
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HashingPoolSaturated(self.retry_after)
+
+        with self._lock:
+            self.in_flight += 1
+        submitted_at = time.monotonic()
+
+        def job():
+            started_at = time.monotonic()
+            with self._lock:
+                self.active += 1
+                self.wait_time += started_at - submitted_at
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._lock:
+                    self.active -= 1
+                    self.in_flight -= 1
+                    self.completed += 1
+                    self.run_time += time.monotonic() - started_at
+                self._slots.release()
+
+        return self._executor.submit(job)
+
+    def run(self, fn, *args, **kwargs):
+        """
+        Run ``fn`` on a pool worker and return its result.
+        """
+        return self.submit(fn, *args, **kwargs).result()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queued": max(0, self.in_flight - self.active),
+                "active": self.active,
+                "utilisation": round(self.active / self.max_workers, 4),
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "avg_wait_ms": round(self.wait_time / self.completed * 1000, 2) if self.completed else 0.0,
+                "avg_run_ms": round(self.run_time / self.completed * 1000, 2) if self.completed else 0.0,
+            }
+
+
+@functools.lru_cache(maxsize=None)
+def get_hashing_pool():
+    """
+    Process-wide pool configured by PASSWORD_HASHING_POOL.
+    """
+    config = settings.PASSWORD_HASHING_POOL
+    return HashingPool(
+        max_workers=config["MAX_WORKERS"],
+        max_queue=config["MAX_QUEUE"],
+        retry_after=config["RETRY_AFTER"]
+    )
+
+
+def submit_hashing(fn, *args, **kwargs):
+    if not settings.PASSWORD_HASHING_POOL["ENABLED"]:
+        future = Future()
+        future.set_result(fn(*args, **kwargs))
+        return future
+    return get_hashing_pool().submit(fn, *args, **kwargs)
+
+
+def run_hashing(fn, *args, **kwargs):
+    if not settings.PASSWORD_HASHING_POOL["ENABLED"]:
+        return fn(*args, **kwargs)
+    return get_hashing_pool().run(fn, *args, **kwargs)
+
+
+def make_password(password):
+    """
+    Pooled counterpart of django.contrib.auth.hashers.make_password.
+    """
+    if password is None:
+        return hashers.make_password(None)
+    return run_hashing(hashers.make_password, password)
+
+
+def check_password(password, encoded):
+    """
+    Verify ``password`` on the pool.
+
+    Returns ``(valid, must_update)``; rehashing is left to the caller so the
+    pool never touches the database.
+    """
+    needs_update = []
+    valid = run_hashing(hashers.check_password, password, encoded, needs_update.append)
+    return valid, bool(needs_update)
+
+
+async def amake_password(password):
+    if password is None:
+        return hashers.make_password(None)
+    return await asyncio.wrap_future(submit_hashing(hashers.make_password, password))
+
+
+async def acheck_password(password, encoded):
+    """
+    Verify ``password`` on the pool without blocking the event loop.
+    """
+    needs_update = []
+    future = submit_hashing(hashers.check_password, password, encoded, needs_update.append)
+    valid = await asyncio.wrap_future(future)
+    return valid, bool(needs_update)
+
+
+def upgrade_password_hash(user, password):
+    """
+    Rehash ``password`` with the current hasher parameters in the background.
+
+    The new hash is computed on the pool and handed to a Celery task that
+    stores it only if the user's hash is still the one that was verified,
+    so the login response is not delayed and a concurrent password change
+    is never overwritten. A saturated pool skips the upgrade until the next
+    login.
+    """
+    old_password_hash = user.password
+
+    def enqueue(future):
+        if future.exception() is None:
+            update_password_hash.delay(
+                user_id=user.pk,
+                old_password_hash=old_password_hash,
+                new_password_hash=future.result()
+            )
+
+    try:
+        submit_hashing(hashers.make_password, password).add_done_callback(enqueue)
+    except HashingPoolSaturated:
+        pass
+
+
+metrics.register("password_hashing_pool", lambda: get_hashing_pool().stats())
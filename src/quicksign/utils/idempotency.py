@@ -0,0 +1,327 @@
+import asyncio
+import base64
+import hashlib
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.redis_scripts import RedisScript
+from quicksign.utils.services import BlockService, get_token_for_user
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# Claims an idempotency key for the first request, or returns the record
+# left by an earlier one: still in flight or holding its stored response.
+#   KEYS: record
+#   ARGV: in-flight record, lock ttl (ms)
+BEGIN_SCRIPT = RedisScript("""
+local record = redis.call('GET', KEYS[1])
+if record then
+    return record
+end
+redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+return false
+""")
+
+
+class IdempotencyStore:
+    """
+    Redis records of requests sent with an Idempotency-Key.
+
+    A record is claimed for LOCK_TTL seconds while the first request runs,
+    then holds its response for TTL seconds. Records are bound to a
+    fingerprint of the request, so a key cannot be reused for another body.
+
+    Tokens are never stored: a response marked with ``issues_tokens`` is
+    kept as the id of its user, and every replay mints a new token pair.
+    Replaying the original pair could hand out a refresh token that was
+    rotated since, whose reuse would revoke the whole family. Such records
+    are kept for LOCK_TTL seconds only, and a replay is refused once the
+    user is inactive or blocked or has changed their password, which is
+    what revokes their tokens.
+    """
+
+    @staticmethod
+    def key(scope, idempotency_key):
+        return cache.make_key(f"idempotency_{scope}_{idempotency_key}")
+
+    @staticmethod
+    def fingerprint(request):
+        # The path is left out: the scope of the key names the endpoint,
+        # whichever of its sync and async views served it
+        digest = hashlib.sha256(request.method.encode())
+        digest.update(request.body)
+        return digest.hexdigest()
+
+    @staticmethod
+    def _begin_call(key, fingerprint):
+        in_flight = json.dumps({"fingerprint": fingerprint, "state": "in_flight"})
+        return [key], [in_flight, settings.IDEMPOTENCY["LOCK_TTL"] * 1000]
+
+    @staticmethod
+    def begin(key, fingerprint):
+        """
+        None if the caller now owns ``key``, otherwise the existing record.
+        """
+        keys, args = IdempotencyStore._begin_call(key, fingerprint)
+        record = BEGIN_SCRIPT(cache.client.get_client(), keys=keys, args=args)
+        return json.loads(record) if record else None
+
+    @staticmethod
+    async def abegin(key, fingerprint):
+        keys, args = IdempotencyStore._begin_call(key, fingerprint)
+        record = await BEGIN_SCRIPT.acall(get_async_redis(), keys=keys, args=args)
+        return json.loads(record) if record else None
+
+    @staticmethod
+    def _completed_record(fingerprint, response):
+        headers = {name: value for name, value in response.items() if name in ("Content-Type", "Retry-After")}
+        record = {
+            "fingerprint": fingerprint,
+            "state": "completed",
+            "status": response.status_code,
+            "headers": headers,
+        }
+        token_user_id = getattr(response, "token_user_id", None)
+        if token_user_id is not None:
+            record["token_user_id"] = token_user_id
+            record["token_password"] = response.token_password
+        else:
+            record["content"] = base64.b64encode(response.content).decode()
+        return json.dumps(record)
+
+    @staticmethod
+    def replayable(response):
+        # Blocks, throttling and server errors depend on when the request
+        # ran, not on what it asked for, so a retry has to run again
+        return response.status_code < 500 and response.status_code not in (403, 429)
+
+    @staticmethod
+    def record_ttl(response):
+        # A replay of new tokens skips the password check and throttles of
+        # the view, so it is only offered to the retries of a lost response
+        if getattr(response, "token_user_id", None) is not None:
+            return settings.IDEMPOTENCY["LOCK_TTL"]
+        return settings.IDEMPOTENCY["TTL"]
+
+    @staticmethod
+    def complete(key, fingerprint, response):
+        redis_client = cache.client.get_client()
+        if IdempotencyStore.replayable(response):
+            record = IdempotencyStore._completed_record(fingerprint, response)
+            redis_client.set(key, record, ex=IdempotencyStore.record_ttl(response))
+        else:
+            redis_client.delete(key)
+
+    @staticmethod
+    async def acomplete(key, fingerprint, response):
+        if IdempotencyStore.replayable(response):
+            record = IdempotencyStore._completed_record(fingerprint, response)
+            await get_async_redis().set(key, record, ex=IdempotencyStore.record_ttl(response))
+        else:
+            await get_async_redis().delete(key)
+
+    @staticmethod
+    def get(key):
+        record = cache.client.get_client().get(key)
+        return json.loads(record) if record else None
+
+    @staticmethod
+    async def aget(key):
+        record = await get_async_redis().get(key)
+        return json.loads(record) if record else None
+
+    @staticmethod
+    def release(key):
+        cache.client.get_client().delete(key)
+
+    @staticmethod
+    async def arelease(key):
+        await get_async_redis().delete(key)
+
+    @staticmethod
+    def token_user(record):
+        """
+        The user to mint the tokens of a replay for, or None if they may no
+        longer sign in the way the original request did.
+        """
+        user = get_user_model()._default_manager.filter(pk=record["token_user_id"], is_active=True).first()
+        if user is None or get_md5_hash_password(user.password) != record["token_password"]:
+            return None
+        if BlockService.is_blocked(phone_number=user.get_username()):
+            return None
+        return user
+
+    @staticmethod
+    def replay(record):
+        if "token_user_id" in record:
+            user = IdempotencyStore.token_user(record)
+            if user is None:
+                return idempotency_error(
+                    409, "idempotency_key_expired",
+                    f"The user of this request can no longer sign in this way; send it with a new {IDEMPOTENCY_HEADER}."
+                )
+            content = json.dumps(get_token_for_user(user))
+        else:
+            content = base64.b64decode(record["content"])
+        response = HttpResponse(content, status=record["status"])
+        for name, value in record["headers"].items():
+            response[name] = value
+        response[REPLAYED_HEADER] = "true"
+        return response
+
+    @staticmethod
+    async def areplay(record):
+        if "token_user_id" in record:
+            return await sync_to_async(IdempotencyStore.replay)(record)
+        return IdempotencyStore.replay(record)
+
+
+def issues_tokens(response, user):
+    """
+    Mark ``response`` as carrying new tokens for ``user``, so that retries
+    get tokens minted for them instead of a stored copy of these.
+    """
+    response.token_user_id = user.pk
+    # Same fingerprint as simplejwt's CHECK_REVOKE_TOKEN claim
+    response.token_password = get_md5_hash_password(user.password)
+    return response
+
+
+def idempotency_error(status, code, detail, retry_after=None):
+    response = JsonResponse({"code": code, "detail": detail}, status=status)
+    if retry_after is not None:
+        response["Retry-After"] = str(retry_after)
+    return response
+
+
+class BaseIdempotencyMixin:
+    """
+    Request handling shared by the sync and async idempotency mixins.
+    """
+    idempotency_poll_interval = 0.05
+    # Keys are shared by every view of the endpoint, e.g. its sync and async
+    # versions; defaults to the view name
+    idempotency_scope = None
+
+    def get_idempotency_scope(self):
+        return self.idempotency_scope or self.__class__.__name__
+
+    def idempotency_begin(self, request):
+        """
+        ``(key, fingerprint, response)``: ``response`` answers the request
+        outright, otherwise the view runs and owns ``key`` if it is set.
+        """
+        idempotency_key = request.headers.get(IDEMPOTENCY_HEADER)
+        if idempotency_key is None:
+            return None, None, None
+        if not 0 < len(idempotency_key) <= MAX_KEY_LENGTH:
+            return None, None, idempotency_error(
+                400, "invalid_idempotency_key",
+                f"{IDEMPOTENCY_HEADER} must be 1 to {MAX_KEY_LENGTH} characters long."
+            )
+        key = IdempotencyStore.key(self.get_idempotency_scope(), idempotency_key)
+        return key, IdempotencyStore.fingerprint(request), None
+
+    def idempotency_key_reused(self, record, fingerprint):
+        """
+        Error response if the record of the key belongs to another request.
+        """
+        if record["fingerprint"] != fingerprint:
+            return idempotency_error(
+                422, "idempotency_key_reused",
+                f"{IDEMPOTENCY_HEADER} was already used for a different request."
+            )
+        return None
+
+    def idempotency_in_flight(self):
+        return idempotency_error(
+            409, "request_in_progress",
+            "A request with this idempotency key is still being processed.",
+            retry_after=1
+        )
+
+
+class IdempotencyMixin(BaseIdempotencyMixin):
+    """
+    View mixin that runs a request sent with an Idempotency-Key once.
+
+    Retries with the same key and body get the stored response, with an
+    Idempotent-Replayed header. Retries that arrive while the first request
+    is still running wait up to WAIT_TIMEOUT seconds for its response, then
+    get 409. Throttles and every other check run only for the first request.
+    """
+
+    def dispatch(self, request, *args, **kwargs):
+        key, fingerprint, response = self.idempotency_begin(request)
+        if response is not None:
+            return response
+        if key is None:
+            return super().dispatch(request, *args, **kwargs)
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY["WAIT_TIMEOUT"]
+        record = IdempotencyStore.begin(key, fingerprint)
+        while record is not None:
+            response = self.idempotency_key_reused(record, fingerprint)
+            if response is not None:
+                return response
+            if record["state"] == "completed":
+                return IdempotencyStore.replay(record)
+            if time.monotonic() >= deadline:
+                return self.idempotency_in_flight()
+            time.sleep(self.idempotency_poll_interval)
+            # The first request may have failed and released the key
+            record = IdempotencyStore.get(key) or IdempotencyStore.begin(key, fingerprint)
+
+        try:
+            response = super().dispatch(request, *args, **kwargs)
+            if hasattr(response, "render"):
+                response.render()
+        except BaseException:
+            IdempotencyStore.release(key)
+            raise
+        IdempotencyStore.complete(key, fingerprint, response)
+        return response
+
+
+class AsyncIdempotencyMixin(BaseIdempotencyMixin):
+    """
+    IdempotencyMixin for async views.
+    """
+
+    async def dispatch(self, request, *args, **kwargs):
+        key, fingerprint, response = self.idempotency_begin(request)
+        if response is not None:
+            return response
+        if key is None:
+            return await super().dispatch(request, *args, **kwargs)
+
+        deadline = time.monotonic() + settings.IDEMPOTENCY["WAIT_TIMEOUT"]
+        record = await IdempotencyStore.abegin(key, fingerprint)
+        while record is not None:
+            response = self.idempotency_key_reused(record, fingerprint)
+            if response is not None:
+                return response
+            if record["state"] == "completed":
+                return await IdempotencyStore.areplay(record)
+            if time.monotonic() >= deadline:
+                return self.idempotency_in_flight()
+            await asyncio.sleep(self.idempotency_poll_interval)
+            record = await IdempotencyStore.aget(key) or await IdempotencyStore.abegin(key, fingerprint)
+
+        try:
+            response = await super().dispatch(request, *args, **kwargs)
+        except BaseException:
+            await IdempotencyStore.arelease(key)
+            raise
+        await IdempotencyStore.acomplete(key, fingerprint, response)
+        return response
@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class LocalTTLCache:
+    """
+    Thread-safe, size-bounded LRU cache whose entries expire after ``ttl`` seconds.
+
+    Every invalidation bumps ``generation``; a value read from Redis before an
+    invalidation can pass that generation to ``set`` and will be dropped
+    instead of caching a stale answer.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, generation=None):
+        with self._lock:
+            if generation is not None and generation != self.generation:
+                return
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, *keys):
+        with self._lock:
+            self.generation += 1
+            self.invalidations += 1
+            for key in keys:
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class InvalidationSubscriber(threading.Thread):
+    """
+    Daemon thread that drops keys from a LocalTTLCache when they are published
+    on a Redis pub/sub channel.
+
+    Messages carry newline-separated cache keys. The local cache is cleared
+    whenever the subscription drops, since invalidations may have been missed.
+    """
+    daemon = True
+    reconnect_delay = 1
+
+    def __init__(self, channel, local_cache):
+        super().__init__(name=f"invalidation-{channel}")
+        self.channel = channel
+        self.local_cache = local_cache
+
+    def run(self):
+        while True:
+            try:
+                pubsub = cache.client.get_client().pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                for message in pubsub.listen():
+                    keys = message["data"].decode().split("\n")
+                    self.local_cache.delete(*keys)
+            except Exception as e:
+                logger.warning(f"Invalidation subscriber for {self.channel} failed: {str(e)}")
+            self.local_cache.clear()
+            time.sleep(self.reconnect_delay)
+
+
+def publish_invalidation(channel, *keys):
+    """
+    Ask every process subscribed to ``channel`` to drop ``keys``.
+    """
+    cache.client.get_client().publish(channel, "\n".join(keys))
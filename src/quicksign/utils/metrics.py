@@ -0,0 +1,16 @@
+"""
+Registry of per-process metric collectors.
+
+Components register a callable returning a dict of counters; ``snapshot``
+gathers them all for the metrics endpoint.
+"""
+
+_collectors = {}
+
+
+def register(name, collector):
+    _collectors[name] = collector
+
+
+def snapshot():
+    return {name: collector() for name, collector in _collectors.items()}
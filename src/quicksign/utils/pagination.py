@@ -0,0 +1,37 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+
+
+def estimated_count(model, using="default"):
+    """
+    Row count of ``model``'s table from the planner statistics, kept up to
+    date by autovacuum; -1 if the table was never analyzed.
+    """
+    with connections[using].cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass",
+            [model._meta.db_table]
+        )
+        return cursor.fetchone()[0]
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator that takes the count of an unfiltered queryset from
+    ``pg_class.reltuples`` instead of a sequential-scan COUNT(*).
+
+    Filtered querysets, and tables estimated below ``exact_count_threshold``
+    rows, are still counted exactly.
+    """
+    exact_count_threshold = 100_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if isinstance(queryset, QuerySet) and not queryset.query.where and not queryset.query.distinct:
+            estimate = estimated_count(queryset.model, using=queryset.db)
+            if estimate >= self.exact_count_threshold:
+                return estimate
+        return super().count
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+
+from django.core.cache import cache
+
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.redis_scripts import RedisScript
+
+
+# Generic Cell Rate Algorithm: the key stores the "theoretical arrival time"
+# (TAT) of the next request, so every decision is one GET/SET on one key.
+# Time comes from the Redis server to keep all workers on the same clock.
+#   KEYS: tat
+#   ARGV: emission interval (ms), period (ms), cost
+GCRA_SCRIPT = RedisScript("""
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local interval = tonumber(ARGV[1])
+local period = tonumber(ARGV[2])
+local tat = tonumber(redis.call('GET', KEYS[1]) or now)
+if tat < now then
+    tat = now
+end
+local new_tat = tat + interval * tonumber(ARGV[3])
+local allow_at = new_tat - period
+if allow_at > now then
+    return {0, math.ceil(allow_at - now)}
+end
+redis.call('SET', KEYS[1], new_tat, 'PX', math.ceil(new_tat - now))
+return {1, 0}
+""")
+
+
+@dataclass(frozen=True)
+class RateLimitResult:
+    """
+    Decision returned by GCRARateLimiter.
+
+    ``retry_after`` is None when the cost exceeds the burst, so waiting
+    would never get the request through.
+    """
+    allowed: bool
+    retry_after: float | None
+
+
+class GCRARateLimiter:
+    """
+    Allow ``limit`` requests per ``period`` seconds, bursting up to ``limit``.
+
+    Each decision is a single Redis script call with constant memory per key.
+    """
+
+    def __init__(self, limit, period):
+        if limit <= 0 or period <= 0:
+            raise ValueError("limit and period must be positive")
+        self.limit = limit
+        self.period = period
+
+    def _script_args(self, cost):
+        period_ms = self.period * 1000
+        return [period_ms / self.limit, period_ms, cost]
+
+    def hit(self, key, cost=1):
+        """
+        Consume ``cost`` units for ``key`` if the rate allows it.
+        """
+        if cost > self.limit:
+            return RateLimitResult(allowed=False, retry_after=None)
+        reply = GCRA_SCRIPT(cache.client.get_client(), keys=[cache.make_key(key)], args=self._script_args(cost))
+        return self._result(reply)
+
+    async def ahit(self, key, cost=1):
+        if cost > self.limit:
+            return RateLimitResult(allowed=False, retry_after=None)
+        reply = await GCRA_SCRIPT.acall(get_async_redis(), keys=[cache.make_key(key)], args=self._script_args(cost))
+        return self._result(reply)
+
+    @staticmethod
+    def _result(reply):
+        allowed, retry_after_ms = reply
+        return RateLimitResult(allowed=bool(allowed), retry_after=retry_after_ms / 1000)
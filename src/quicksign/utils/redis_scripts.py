@@ -0,0 +1,36 @@
+import hashlib
+
+from redis.client import Pipeline
+from redis.exceptions import NoScriptError
+
+
+class RedisScript:
+    """
+    Lua script declared once at module level and run on any client.
+
+    Unlike ``register_script``, nothing is bound to a client or hashed per
+    call: the SHA is computed here and the script is sent to a server only
+    the first time EVALSHA finds it missing there.
+    """
+
+    def __init__(self, script):
+        self.script = script
+        self.sha = hashlib.sha1(script.encode()).hexdigest()
+
+    def __call__(self, client, keys=(), args=()):
+        if isinstance(client, Pipeline):
+            # Pipelines load their missing scripts before executing
+            client.scripts.add(self)
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+        try:
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            client.script_load(self.script)
+            return client.evalsha(self.sha, len(keys), *keys, *args)
+
+    async def acall(self, client, keys=(), args=()):
+        try:
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
+        except NoScriptError:
+            await client.script_load(self.script)
+            return await client.evalsha(self.sha, len(keys), *keys, *args)
@@ -0,0 +1,229 @@
+import contextlib
+import contextvars
+import functools
+import logging
+import random
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.utils.decorators import sync_and_async_middleware
+
+from quicksign.utils import metrics
+from quicksign.utils.async_redis import get_async_redis
+
+logger = logging.getLogger(__name__)
+
+# Seconds of committed transactions the replica has yet to replay; 0 when it
+# has replayed everything it received, and on a server that is no replica.
+# NULL, i.e. unhealthy, when it is not streaming from the primary: it then
+# has nothing left to replay however far behind it falls. Also NULL until it
+# has replayed a transaction. Reading pg_stat_wal_receiver.status takes the
+# pg_read_all_stats role.
+LAG_SQL = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+END
+"""
+
+# Set for the rest of a request once it has written, or inside use_primary()
+_use_primary = contextvars.ContextVar("use_primary", default=False)
+
+
+@contextlib.contextmanager
+def use_primary(enabled=True):
+    """
+    Send the reads inside the block to the primary when ``enabled``.
+    """
+    token = _use_primary.set(_use_primary.get() or bool(enabled))
+    try:
+        yield
+    finally:
+        _use_primary.reset(token)
+
+
+class ReplicaMonitor(threading.Thread):
+    """
+    Daemon thread that measures the replay lag of every replica each
+    LAG_CHECK_INTERVAL seconds.
+
+    A replica takes reads while its last measurement is recent and under
+    MAX_LAG; a failed, missing or stale measurement sends reads to the
+    primary.
+    """
+    daemon = True
+
+    def __init__(self, replicas, max_lag, interval):
+        super().__init__(name="replica-monitor")
+        self.replicas = replicas
+        self.max_lag = max_lag
+        self.interval = interval
+        self.lags = {}
+        self.fallbacks = 0
+
+    def measure(self, alias):
+        connection = connections[alias]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_SQL)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            connection.close()
+            raise
+        return None if lag is None else float(lag)
+
+    def check(self):
+        for alias in self.replicas:
+            try:
+                lag = self.measure(alias)
+                if lag is None:
+                    logger.warning(f"Replica {alias} is not streaming from the primary")
+            except DatabaseError as e:
+                logger.warning(f"Lag check of replica {alias} failed: {str(e)}")
+                lag = None
+            self.lags[alias] = (lag, time.monotonic())
+
+    def run(self):
+        while True:
+            self.check()
+            time.sleep(self.interval)
+
+    def healthy(self):
+        # A measurement older than a few intervals means checks are hanging
+        oldest = time.monotonic() - 3 * self.interval
+        return [
+            alias for alias, (lag, measured_at) in self.lags.items()
+            if lag is not None and lag <= self.max_lag and measured_at >= oldest
+        ]
+
+    def stats(self):
+        return {
+            "lags": {alias: lag for alias, (lag, _) in self.lags.items()},
+            "healthy": len(self.healthy()),
+            "fallbacks": self.fallbacks,
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _replica_monitor(replicas, max_lag, interval):
+    monitor = ReplicaMonitor(list(replicas), max_lag, interval)
+    monitor.start()
+    metrics.register("database_replicas", monitor.stats)
+    return monitor
+
+
+def get_replica_monitor():
+    options = settings.DATABASE_REPLICATION
+    return _replica_monitor(tuple(options["REPLICAS"]), options["MAX_LAG"], options["LAG_CHECK_INTERVAL"])
+
+
+class ReplicaRouter:
+    """
+    Send writes to the primary and reads to a replica that is keeping up.
+
+    Reads stay on the primary inside transactions, for the rest of a request
+    that wrote (see replica_routing_middleware), and inside use_primary().
+    """
+
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICATION["REPLICAS"]:
+            return DEFAULT_DB_ALIAS
+        if _use_primary.get() or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+
+        monitor = get_replica_monitor()
+        healthy = monitor.healthy()
+        if not healthy:
+            monitor.fallbacks += 1
+            return DEFAULT_DB_ALIAS
+        return random.choice(healthy)
+
+    def db_for_write(self, model, **hints):
+        # Later reads of this request must see the write
+        _use_primary.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICATION["REPLICAS"]}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICATION["REPLICAS"]:
+            return False
+        return None
+
+
+@sync_and_async_middleware
+def replica_routing_middleware(get_response):
+    """
+    Start every request reading from replicas, whatever the previous
+    request handled by this thread wrote.
+    """
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = _use_primary.set(False)
+            try:
+                return await get_response(request)
+            finally:
+                _use_primary.reset(token)
+    else:
+        def middleware(request):
+            token = _use_primary.set(False)
+            try:
+                return get_response(request)
+            finally:
+                _use_primary.reset(token)
+    return middleware
+
+
+class StickyReads:
+    """
+    Short-lived Redis flags that send reads about a phone number to the
+    primary, so a user is found right after registering whatever the
+    replica lag. Without replicas no flag is set or read.
+    """
+
+    @staticmethod
+    def key(phone_number):
+        return f"db_sticky_{phone_number}"
+
+    @staticmethod
+    def enabled():
+        return bool(settings.DATABASE_REPLICATION["REPLICAS"])
+
+    @staticmethod
+    def mark(phone_number):
+        if StickyReads.enabled():
+            cache.set(StickyReads.key(phone_number), 1, timeout=settings.DATABASE_REPLICATION["STICKY_TTL"])
+
+    @staticmethod
+    async def amark(phone_number):
+        if StickyReads.enabled():
+            await get_async_redis().set(
+                cache.make_key(StickyReads.key(phone_number)), 1, ex=settings.DATABASE_REPLICATION["STICKY_TTL"]
+            )
+
+    @staticmethod
+    def is_sticky(*phone_numbers):
+        """
+        Whether reads about any of ``phone_numbers`` must go to the primary.
+        """
+        if not StickyReads.enabled() or not phone_numbers:
+            return False
+        keys = [cache.make_key(StickyReads.key(phone_number)) for phone_number in phone_numbers]
+        return cache.client.get_client().exists(*keys) > 0
+
+    @staticmethod
+    async def ais_sticky(*phone_numbers):
+        if not StickyReads.enabled() or not phone_numbers:
+            return False
+        keys = [cache.make_key(StickyReads.key(phone_number)) for phone_number in phone_numbers]
+        return await get_async_redis().exists(*keys) > 0
@@ -0,0 +1,232 @@
+import functools
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+from quicksign.utils import metrics
+from quicksign.utils.bloom import BloomFilter
+from quicksign.utils.redis_scripts import RedisScript
+
+logger = logging.getLogger(__name__)
+
+
+# Denies an item until it expires, indexes it by expiry time so process-local
+# filters can be rebuilt, and announces it to them. Returns 0 if the item was
+# already denied, which makes spending a one-time token atomic.
+#   KEYS: item key, expiry index
+#   ARGV: item, ttl (s), expiry (unix time), channel
+REVOKE_SCRIPT = RedisScript("""
+if not redis.call('SET', KEYS[1], 1, 'NX', 'EX', ARGV[2]) then
+    return 0
+end
+redis.call('ZADD', KEYS[2], ARGV[3], ARGV[1])
+redis.call('PUBLISH', ARGV[4], ARGV[1])
+return 1
+""")
+
+
+class RevocationFilter:
+    """
+    Process-local Bloom filter of every denied item.
+
+    While ``ready``, an item missing from the filter is definitely not
+    denied. The filter is only ready between a rebuild from the Redis index
+    and the next lost subscription, so no announcement can be missed.
+    """
+
+    def __init__(self, capacity, error_rate, rebuild_interval):
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_interval = rebuild_interval
+        self.ready = False
+        self.built_at = 0
+        self.rebuilds = 0
+        self.negatives = 0
+        self.fallbacks = 0
+        self._filter = BloomFilter(capacity, error_rate)
+        self._lock = threading.Lock()
+
+    def add(self, *items):
+        with self._lock:
+            for item in items:
+                self._filter.add(item)
+
+    def might_contain(self, item):
+        """
+        False if ``item`` is definitely not denied, True if it may be and None
+        while the filter cannot answer.
+        """
+        with self._lock:
+            if not self.ready:
+                self.fallbacks += 1
+                return None
+            if item in self._filter:
+                return True
+            self.negatives += 1
+            return False
+
+    def rebuild(self, items):
+        """
+        Replace the filter with one holding exactly ``items``, sized so that
+        expired entries stop inflating the false-positive rate.
+        """
+        local_filter = BloomFilter(max(self.capacity, 2 * len(items)), self.error_rate)
+        for item in items:
+            local_filter.add(item)
+        with self._lock:
+            self._filter = local_filter
+            self.ready = True
+            self.built_at = time.monotonic()
+            self.rebuilds += 1
+
+    def needs_rebuild(self):
+        with self._lock:
+            return self.ready and (
+                self._filter.count > self._filter.capacity
+                or time.monotonic() - self.built_at > self.rebuild_interval
+            )
+
+    def reset(self):
+        with self._lock:
+            self.ready = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "ready": self.ready,
+                "items": self._filter.count,
+                "capacity": self._filter.capacity,
+                "false_positive_rate": round(self._filter.false_positive_rate(), 6),
+                "negatives": self.negatives,
+                "fallbacks": self.fallbacks,
+                "rebuilds": self.rebuilds,
+            }
+
+
+class RevocationSubscriber(threading.Thread):
+    """
+    Daemon thread that keeps a RevocationFilter in sync with the deny list.
+
+    The filter is rebuilt from the Redis index once the subscription is
+    confirmed, so every item denied earlier is in the index and every item
+    denied later is announced. It is marked not ready whenever the
+    subscription drops.
+    """
+    daemon = True
+    reconnect_delay = 1
+    poll_timeout = 1
+
+    def __init__(self, channel, local_filter):
+        super().__init__(name=f"revocation-{channel}")
+        self.channel = channel
+        self.local_filter = local_filter
+
+    def run(self):
+        while True:
+            try:
+                pubsub = cache.client.get_client().pubsub()
+                pubsub.subscribe(self.channel)
+                while True:
+                    message = pubsub.get_message(timeout=self.poll_timeout)
+                    if message is not None:
+                        if message["type"] == "subscribe":
+                            self.local_filter.rebuild(TokenDenyList.active_items())
+                        elif message["type"] == "message":
+                            self.local_filter.add(message["data"].decode())
+                    if self.local_filter.needs_rebuild():
+                        self.local_filter.rebuild(TokenDenyList.active_items())
+            except Exception as e:
+                logger.warning(f"Revocation subscriber for {self.channel} failed: {str(e)}")
+            self.local_filter.reset()
+            time.sleep(self.reconnect_delay)
+
+
+@functools.lru_cache(maxsize=None)
+def _revocation_filter(capacity, error_rate, rebuild_interval):
+    local_filter = RevocationFilter(capacity, error_rate, rebuild_interval)
+    RevocationSubscriber(TokenDenyList.channel(), local_filter).start()
+    metrics.register("token_deny_list_local_filter", local_filter.stats)
+    return local_filter
+
+
+class TokenDenyList:
+    """
+    Redis deny list of token ids and token families.
+
+    Items expire together with the last token they can match. Lookups go
+    through a process-local RevocationFilter first, so the common "not
+    denied" answer costs no network round trip.
+    """
+    counters = {"revocations": 0, "redis_lookups": 0}
+
+    @staticmethod
+    def key(item):
+        return f"token_denied_{item}"
+
+    @staticmethod
+    def index_key():
+        return cache.make_key("token_denied_index")
+
+    @staticmethod
+    def channel():
+        return cache.make_key("token_denied")
+
+    @staticmethod
+    def local_filter():
+        options = settings.TOKEN_DENY_LIST
+        if not options["LOCAL_FILTER_ENABLED"]:
+            return None
+        return _revocation_filter(
+            options["LOCAL_FILTER_CAPACITY"],
+            options["LOCAL_FILTER_ERROR_RATE"],
+            options["LOCAL_FILTER_REBUILD_INTERVAL"]
+        )
+
+    @staticmethod
+    def revoke(item, ttl):
+        """
+        Deny ``item`` for ``ttl`` seconds. Returns False if it already was.
+        """
+        ttl = max(int(ttl), 1)
+        revoked = REVOKE_SCRIPT(
+            cache.client.get_client(),
+            keys=[cache.make_key(TokenDenyList.key(item)), TokenDenyList.index_key()],
+            args=[item, ttl, int(time.time()) + ttl, TokenDenyList.channel()]
+        )
+        local_filter = TokenDenyList.local_filter()
+        if local_filter is not None:
+            # Don't wait for our own announcement to come back
+            local_filter.add(item)
+        if revoked:
+            TokenDenyList.counters["revocations"] += 1
+        return bool(revoked)
+
+    @staticmethod
+    def is_revoked(item):
+        local_filter = TokenDenyList.local_filter()
+        if local_filter is not None and local_filter.might_contain(item) is False:
+            return False
+        TokenDenyList.counters["redis_lookups"] += 1
+        return cache.has_key(TokenDenyList.key(item))
+
+    @staticmethod
+    def active_items():
+        """
+        Items still denied, after dropping expired ones from the index.
+        """
+        redis_client = cache.client.get_client()
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.zremrangebyscore(TokenDenyList.index_key(), "-inf", int(time.time()))
+        pipe.zrange(TokenDenyList.index_key(), 0, -1)
+        _, items = pipe.execute()
+        return [item.decode() for item in items]
+
+    @staticmethod
+    def stats():
+        return dict(TokenDenyList.counters)
+
+
+metrics.register("token_deny_list", TokenDenyList.stats)
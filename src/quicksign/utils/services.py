@@ -1,14 +1,25 @@
+import functools
+import hashlib
+import hmac
 import logging
 import secrets
+import time
+from dataclasses import dataclass
 from datetime import timedelta
 
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.core.cache import cache
 
-from rest_framework_simplejwt.tokens import RefreshToken
-
-from redis.lock import Lock
-
 from quicksign.apps.users.tasks import send_verification_code
+from quicksign.apps.users.tokens import RefreshToken
+from quicksign.apps.users.validators import normalize_phone_number
+from quicksign.utils import metrics
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.bloom import RedisBloomFilter
+from quicksign.utils.dispatch import OTPDispatcher
+from quicksign.utils.localcache import InvalidationSubscriber, LocalTTLCache, publish_invalidation
+from quicksign.utils.redis_scripts import RedisScript
 
 logger = logging.getLogger(__name__)
 
@@ -22,21 +33,172 @@ def get_token_for_user(user):
         "access":str(refresh.access_token)
     }
 
+# Increments the failed attempts counter and, once the limit is reached, blocks
+# both the phone number and the IP address in the same server-side call.
+# Blocking also publishes an invalidation for process-local block caches.
+#   KEYS: failed attempts, phone block, ip block
+#   ARGV: max attempts, attempts window (s), block duration (s),
+#         invalidation channel, invalidation payload
+RECORD_FAILED_ATTEMPT_SCRIPT = RedisScript("""
+local attempts = redis.call('INCR', KEYS[1])
+if attempts < tonumber(ARGV[1]) then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+    return {attempts, 0, 0}
+end
+redis.call('SET', KEYS[2], 1, 'EX', ARGV[3])
+redis.call('SET', KEYS[3], 1, 'EX', ARGV[3])
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[3])
+redis.call('PUBLISH', ARGV[4], ARGV[5])
+return {attempts, 1, tonumber(ARGV[3])}
+""")
+
+
+# Compares the submitted code with the stored one and burns it on success.
+# Wrong guesses are counted per code; the code is dropped once they run out.
+#   KEYS: verification code, wrong guesses
+#   ARGV: encoded submitted code, max wrong guesses
+CONSUME_CODE_SCRIPT = RedisScript("""
+local stored = redis.call('GET', KEYS[1])
+if not stored then
+    return 0
+end
+if stored == ARGV[1] then
+    redis.call('DEL', KEYS[1], KEYS[2])
+    return 1
+end
+local guesses = redis.call('INCR', KEYS[2])
+if guesses == 1 then
+    local ttl = redis.call('PTTL', KEYS[1])
+    if ttl > 0 then
+        redis.call('PEXPIRE', KEYS[2], ttl)
+    end
+end
+if guesses >= tonumber(ARGV[2]) then
+    redis.call('DEL', KEYS[1], KEYS[2])
+end
+return 0
+""")
+
+
+# Validation for HMAC-derived codes, which are never stored. The caller
+# recomputes the code and passes the time step and send counter it matched
+# (or ""). A code is accepted once and only if newer than the last consumed
+# one; wrong guesses are counted per phone and lock validation out once
+# they run out.
+#   KEYS: wrong guesses, last consumed step and send
+#   ARGV: matched step or "", max wrong guesses, marker ttl (s), matched send
+CONSUME_HMAC_CODE_SCRIPT = RedisScript("""
+local guesses = tonumber(redis.call('GET', KEYS[1]) or '0')
+if guesses >= tonumber(ARGV[2]) then
+    return 0
+end
+if ARGV[1] ~= '' then
+    local step, send = tonumber(ARGV[1]), tonumber(ARGV[4])
+    local consumed = redis.call('HMGET', KEYS[2], 'step', 'send')
+    local consumed_step, consumed_send = tonumber(consumed[1] or '-1'), tonumber(consumed[2] or '-1')
+    if step < consumed_step or (step == consumed_step and send <= consumed_send) then
+        return 0
+    end
+    redis.call('HSET', KEYS[2], 'step', step, 'send', send)
+    redis.call('EXPIRE', KEYS[2], ARGV[3])
+    redis.call('DEL', KEYS[1])
+    return 1
+end
+guesses = redis.call('INCR', KEYS[1])
+if guesses == 1 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 0
+""")
+
+
+@dataclass(frozen=True)
+class AttemptResult:
+    """
+    Outcome of a failed attempt recorded by BlockService.
+    """
+    attempts: int
+    is_blocked: bool
+    block_time_left: int
+
+
+@dataclass(frozen=True)
+class BlockStatus:
+    """
+    Snapshot of the block state of a phone number and IP address.
+    """
+    is_blocked: bool
+    attempts: int
+    block_time_left: int
+
+    @property
+    def remaining_attempts(self):
+        return max(0, BlockService.max_attempts - self.attempts)
+
+    def as_dict(self):
+        return {
+            'is_blocked': self.is_blocked,
+            'remaining_attempts': self.remaining_attempts,
+            'block_time_left': self.block_time_left
+        }
+
+
+@functools.lru_cache(maxsize=None)
+def _block_status_cache(max_size, ttl):
+    local_cache = LocalTTLCache(max_size=max_size, ttl=ttl)
+    InvalidationSubscriber(BlockService.invalidation_channel(), local_cache).start()
+    metrics.register("block_status_local_cache", local_cache.stats)
+    return local_cache
+
+
 class BlockService:
     """
     Service for managing user blocking functionality using Django cache.
     """
+    max_attempts = 3
+    attempts_window = timedelta(hours=1)
+    block_duration = timedelta(hours=1)
+
+    @staticmethod
+    def local_cache():
+        """
+        Process-local cache of "not blocked" answers, or None when disabled.
+        """
+        options = settings.BLOCK_STATUS_LOCAL_CACHE
+        if not options["ENABLED"]:
+            return None
+        return _block_status_cache(options["MAX_SIZE"], options["TTL"])
+
+    @staticmethod
+    def invalidation_channel():
+        return cache.make_key("block_status_invalidation")
+
+    @staticmethod
+    def _subjects(phone_number, ip_address):
+        subjects = []
+        if phone_number:
+            subjects.append(f"phone:{phone_number}")
+        if ip_address:
+            subjects.append(f"ip:{ip_address}")
+        return subjects
+
+    @staticmethod
+    def invalidate(phone_number=None, ip_address=None):
+        """
+        Drop cached "not blocked" answers for the subjects in every process.
+        """
+        subjects = BlockService._subjects(phone_number, ip_address)
+        local_cache = BlockService.local_cache()
+        if local_cache is not None:
+            local_cache.delete(*subjects)
+        publish_invalidation(BlockService.invalidation_channel(), *subjects)
+
     @staticmethod
     def is_blocked(phone_number=None, ip_address=None):
         """
         Check if user is blocked by phone number or IP address.
         """
-        if not phone_number and not ip_address:
-            raise ValueError("Either phone_number or ip_address must be provided")
-
-        if cache.get(f"phone_blocked_{phone_number}") or cache.get(f"ip_blocked_{ip_address}"):
-            return True
-        return False
+        return BlockService.get_status(phone_number, ip_address).is_blocked
 
     @staticmethod
     def block_user(phone_number=None, ip_address=None):
@@ -46,10 +208,11 @@ class BlockService:
         if not phone_number and not ip_address:
             raise ValueError("Either phone_number or ip_address must be provided")
 
-        block_duration = timedelta(hours=1)
+        block_duration = BlockService.block_duration
         cache.set(f"phone_blocked_{phone_number}", True, timeout=block_duration.total_seconds())
         cache.set(f"ip_blocked_{ip_address}", True, timeout=block_duration.total_seconds())
-        cache.set(f"failed_attempts_{ip_address}", 3, timeout=block_duration.total_seconds())
+        cache.set(f"failed_attempts_{ip_address}", BlockService.max_attempts, timeout=block_duration.total_seconds())
+        BlockService.invalidate(phone_number, ip_address)
 
     @staticmethod
     def unblock_user(phone_number=None, ip_address=None):
@@ -62,20 +225,56 @@ class BlockService:
         cache.delete(f"phone_blocked_{phone_number}")
         cache.delete(f"ip_blocked_{ip_address}")
         cache.delete(f"failed_attempts_{ip_address}")
+        BlockService.invalidate(phone_number, ip_address)
 
     @staticmethod
-    def increment_attempts(phone_number, ip_address):
+    def _failed_attempt_script_call(phone_number, ip_address):
+        keys = [
+            cache.make_key(f"failed_attempts_{ip_address}"),
+            cache.make_key(f"phone_blocked_{phone_number}"),
+            cache.make_key(f"ip_blocked_{ip_address}"),
+        ]
+        args = [
+            BlockService.max_attempts,
+            int(BlockService.attempts_window.total_seconds()),
+            int(BlockService.block_duration.total_seconds()),
+            BlockService.invalidation_channel(),
+            "\n".join(BlockService._subjects(phone_number, ip_address)),
+        ]
+        return keys, args
+
+    @staticmethod
+    def _attempt_result(reply, phone_number, ip_address):
+        attempts, blocked, ttl = reply
+        local_cache = BlockService.local_cache()
+        if blocked and local_cache is not None:
+            local_cache.delete(*BlockService._subjects(phone_number, ip_address))
+        return AttemptResult(attempts=attempts, is_blocked=bool(blocked), block_time_left=ttl)
+
+    @staticmethod
+    def record_failed_attempt(phone_number, ip_address):
         """
-        Increment failed attempts counter and block if exceeds limit.
+        Atomically increment failed attempts and block once the limit is reached.
+
+        Runs as a single Lua script, so concurrent failures never lose an
+        increment and each failed attempt costs one Redis round trip.
         """
-        attempts = cache.get(f"failed_attempts_{ip_address}", 0)
-        attempts += 1
+        keys, args = BlockService._failed_attempt_script_call(phone_number, ip_address)
+        reply = RECORD_FAILED_ATTEMPT_SCRIPT(cache.client.get_client(), keys=keys, args=args)
+        return BlockService._attempt_result(reply, phone_number, ip_address)
 
-        cache.set(f"failed_attempts_{ip_address}", attempts, timeout=3600)
+    @staticmethod
+    async def arecord_failed_attempt(phone_number, ip_address):
+        keys, args = BlockService._failed_attempt_script_call(phone_number, ip_address)
+        reply = await RECORD_FAILED_ATTEMPT_SCRIPT.acall(get_async_redis(), keys=keys, args=args)
+        return BlockService._attempt_result(reply, phone_number, ip_address)
 
-        if attempts >= 3:
-            BlockService.block_user(phone_number, ip_address)
-        return attempts
+    @staticmethod
+    def increment_attempts(phone_number, ip_address):
+        """
+        Increment failed attempts counter and block if exceeds limit.
+        """
+        return BlockService.record_failed_attempt(phone_number, ip_address).attempts
 
     @staticmethod
     def reset_attempts(ip_address):
@@ -85,66 +284,360 @@ class BlockService:
         cache.delete(f"failed_attempts_{ip_address}")
 
     @staticmethod
-    def get_block_status(phone_number=None, ip_address=None):
+    async def areset_attempts(ip_address):
+        await get_async_redis().delete(cache.make_key(f"failed_attempts_{ip_address}"))
+
+    @staticmethod
+    def _local_status(phone_number, ip_address, use_local_cache):
         """
-        Get current block status including remaining attempts and block time.
+        Return the local cache to fill (or None) and a cached status when
+        every subject is known to be unblocked.
         """
-        is_blocked = BlockService.is_blocked(phone_number, ip_address)
-        attempts = cache.get(f"failed_attempts_{ip_address}", 0)
-        block_time_left = 0
+        if not phone_number and not ip_address:
+            raise ValueError("Either phone_number or ip_address must be provided")
+
+        local_cache = BlockService.local_cache() if use_local_cache else None
+        if local_cache is not None:
+            subjects = BlockService._subjects(phone_number, ip_address)
+            if all(local_cache.get(subject) for subject in subjects):
+                return local_cache, BlockStatus(is_blocked=False, attempts=0, block_time_left=0)
+        return local_cache, None
+
+    @staticmethod
+    def _queue_status_commands(pipe, phone_number, ip_address):
+        phone_key = cache.make_key(f"phone_blocked_{phone_number}")
+        ip_key = cache.make_key(f"ip_blocked_{ip_address}")
+        pipe.exists(phone_key)
+        pipe.exists(ip_key)
+        pipe.get(cache.make_key(f"failed_attempts_{ip_address}"))
+        pipe.ttl(phone_key)
+        pipe.ttl(ip_key)
 
+    @staticmethod
+    def _status_from_reply(reply, phone_number, ip_address, local_cache, generation):
+        phone_blocked, ip_blocked, attempts, phone_ttl, ip_ttl = reply
+
+        if local_cache is not None:
+            if phone_number and not phone_blocked:
+                local_cache.set(f"phone:{phone_number}", True, generation=generation)
+            if ip_address and not ip_blocked:
+                local_cache.set(f"ip:{ip_address}", True, generation=generation)
+
+        is_blocked = bool(phone_blocked or ip_blocked)
+        block_time_left = 0
         if is_blocked:
             if phone_number:
-                block_time_left = cache.ttl(f"phone_blocked_{phone_number}")
+                block_time_left = max(phone_ttl, 0)
             if ip_address:
-                ip_time_left = cache.ttl(f"ip_blocked_{ip_address}")
-                block_time_left = max(block_time_left, ip_time_left)
+                block_time_left = max(block_time_left, ip_ttl)
+
+        return BlockStatus(
+            is_blocked=is_blocked,
+            attempts=int(attempts or 0),
+            block_time_left=block_time_left
+        )
+
+    @staticmethod
+    def get_status(phone_number=None, ip_address=None, use_local_cache=True):
+        """
+        Fetch block flags, failed attempts and block TTLs in one pipelined call.
+
+        When the local cache is enabled and every subject is known to be
+        unblocked, Redis is skipped; such answers report zero attempts.
+        """
+        local_cache, cached_status = BlockService._local_status(phone_number, ip_address, use_local_cache)
+        if cached_status is not None:
+            return cached_status
+        generation = local_cache.generation if local_cache is not None else None
+
+        pipe = cache.client.get_client().pipeline(transaction=False)
+        BlockService._queue_status_commands(pipe, phone_number, ip_address)
+        return BlockService._status_from_reply(pipe.execute(), phone_number, ip_address, local_cache, generation)
+
+    @staticmethod
+    async def aget_status(phone_number=None, ip_address=None, use_local_cache=True):
+        local_cache, cached_status = BlockService._local_status(phone_number, ip_address, use_local_cache)
+        if cached_status is not None:
+            return cached_status
+        generation = local_cache.generation if local_cache is not None else None
+
+        pipe = get_async_redis().pipeline(transaction=False)
+        BlockService._queue_status_commands(pipe, phone_number, ip_address)
+        reply = await pipe.execute()
+        return BlockService._status_from_reply(reply, phone_number, ip_address, local_cache, generation)
+
+    @staticmethod
+    def blocked_phone_numbers(phone_numbers):
+        """
+        Return the subset of ``phone_numbers`` that is blocked, using one MGET.
+        """
+        if not phone_numbers:
+            return set()
+        keys = [cache.make_key(f"phone_blocked_{phone_number}") for phone_number in phone_numbers]
+        flags = cache.client.get_client().mget(keys)
+        return {phone_number for phone_number, flag in zip(phone_numbers, flags) if flag is not None}
+
+    @staticmethod
+    def get_block_status(phone_number=None, ip_address=None):
+        """
+        Get current block status including remaining attempts and block time.
+        """
+        return BlockService.get_status(phone_number, ip_address, use_local_cache=False).as_dict()
+
+
+class PhoneRegistry:
+    """
+    Bloom filter of registered phone numbers, shared by all workers in Redis.
+
+    A definite miss lets the phone check skip the database; anything else,
+    including an unbuilt filter or a Redis error, falls back to a query.
+    Members are canonical '+989...' numbers, whatever form callers pass.
+    """
+    counters = {"definite_misses": 0, "possible_hits": 0, "unavailable": 0}
+
+    @staticmethod
+    def bloom_filter():
+        options = settings.PHONE_BLOOM_FILTER
+        if not options["ENABLED"]:
+            return None
+        return RedisBloomFilter(
+            "registered_phones_bloom",
+            capacity=options["CAPACITY"],
+            error_rate=options["ERROR_RATE"]
+        )
+
+    @staticmethod
+    def canonical(phone_number):
+        return normalize_phone_number(phone_number) or phone_number
+
+    @staticmethod
+    def _count(found):
+        if found is None:
+            PhoneRegistry.counters["unavailable"] += 1
+        elif found:
+            PhoneRegistry.counters["possible_hits"] += 1
+        else:
+            PhoneRegistry.counters["definite_misses"] += 1
+        return found
+
+    @staticmethod
+    def might_be_registered(phone_number):
+        """
+        False if the number is definitely not registered, otherwise True or
+        None when the filter cannot answer.
+        """
+        bloom_filter = PhoneRegistry.bloom_filter()
+        if bloom_filter is None:
+            return None
+        try:
+            found = bloom_filter.might_contain(PhoneRegistry.canonical(phone_number))
+        except Exception as e:
+            logger.warning(f"Phone bloom filter lookup failed: {str(e)}")
+            found = None
+        return PhoneRegistry._count(found)
+
+    @staticmethod
+    async def amight_be_registered(phone_number):
+        bloom_filter = PhoneRegistry.bloom_filter()
+        if bloom_filter is None:
+            return None
+        try:
+            found = await bloom_filter.amight_contain(PhoneRegistry.canonical(phone_number))
+        except Exception as e:
+            logger.warning(f"Phone bloom filter lookup failed: {str(e)}")
+            found = None
+        return PhoneRegistry._count(found)
+
+    @staticmethod
+    def add(phone_number):
+        bloom_filter = PhoneRegistry.bloom_filter()
+        if bloom_filter is None:
+            return
+        try:
+            bloom_filter.add(PhoneRegistry.canonical(phone_number))
+        except Exception as e:
+            logger.warning(f"Phone bloom filter update failed: {str(e)}")
+
+    @staticmethod
+    def add_many(phone_numbers):
+        bloom_filter = PhoneRegistry.bloom_filter()
+        if bloom_filter is None or not phone_numbers:
+            return
+        try:
+            bloom_filter.add_many([PhoneRegistry.canonical(phone_number) for phone_number in phone_numbers])
+        except Exception as e:
+            logger.warning(f"Phone bloom filter update failed: {str(e)}")
 
+    @staticmethod
+    def stats():
+        bloom_filter = PhoneRegistry.bloom_filter()
+        if bloom_filter is None:
+            return {"enabled": False}
         return {
-            'is_blocked': is_blocked,
-            'remaining_attempts': max(0, (3 - attempts)),
-            'block_time_left': block_time_left
+            "enabled": True,
+            "capacity": bloom_filter.capacity,
+            "error_rate": bloom_filter.error_rate,
+            "num_bits": bloom_filter.num_bits,
+            "num_hashes": bloom_filter.num_hashes,
+            "size_bytes": bloom_filter.size_bytes,
+            **PhoneRegistry.counters,
         }
 
 
+metrics.register("phone_bloom_filter", PhoneRegistry.stats)
+
+
 class OTPService:
+    max_wrong_guesses = 5
+    resend_cooldown = timedelta(seconds=60)
+    # Lifetime of a stored code
+    code_ttl = 120
+
+    @staticmethod
+    def hmac_mode():
+        return settings.OTP_CODES["MODE"] == "hmac"
+
+    @staticmethod
+    def current_step():
+        return int(time.time()) // settings.OTP_CODES["STEP"]
+
+    @staticmethod
+    def min_code_ttl():
+        """
+        Seconds a code sent now is valid for, at least; a derived code lasts
+        for the rest of its step and the whole next one.
+        """
+        return settings.OTP_CODES["STEP"] if OTPService.hmac_mode() else OTPService.code_ttl
+
+    @staticmethod
+    def derive_code(phone_number, step, send=0):
+        """
+        Derive the 6-digit code of a phone number for a time step and send
+        counter, using HOTP-style dynamic truncation of an HMAC-SHA256 digest.
+        """
+        secret = (settings.OTP_CODES["SECRET"] or settings.SECRET_KEY).encode()
+        digest = hmac.new(secret, f"{phone_number}:{step}:{send}".encode(), hashlib.sha256).digest()
+        offset = digest[-1] & 0x0F
+        value = int.from_bytes(digest[offset:offset + 4], "big") & 0x7FFFFFFF
+        return str(value % 900000 + 100000)
+
+    @staticmethod
+    def sends_key(phone_number):
+        return cache.make_key(f"verification_sends_{phone_number}")
+
+    @staticmethod
+    def _count_send_commands(pipe, phone_number):
+        # Outlives every code derived from it
+        pipe.incr(OTPService.sends_key(phone_number))
+        pipe.expire(OTPService.sends_key(phone_number), 2 * settings.OTP_CODES["STEP"])
 
     @staticmethod
     def generate_code(phone_number):
         """
         Generate a random 6-digit verification code.
-        Replace this with your actual code generation logic.
+
+        In "hmac" mode the code is derived from the current time step and a
+        per-phone send counter, the only thing written; it stays valid for
+        the current and next step. The counter makes a resend within a step
+        a new code rather than one that may have been consumed already.
         """
+        if OTPService.hmac_mode():
+            pipe = cache.client.get_client().pipeline(transaction=False)
+            OTPService._count_send_commands(pipe, phone_number)
+            send, _ = pipe.execute()
+            return OTPService.derive_code(phone_number, OTPService.current_step(), send)
+
         code = str(secrets.randbelow(900000) + 100000)
         cache.set(
             key = f"verification_code_{phone_number}",
             value=code,
-            timeout=120
+            timeout=OTPService.code_ttl
         )
+        cache.delete(f"verification_guesses_{phone_number}")
         return code
 
+    @staticmethod
+    async def agenerate_code(phone_number):
+        if OTPService.hmac_mode():
+            pipe = get_async_redis().pipeline(transaction=False)
+            OTPService._count_send_commands(pipe, phone_number)
+            send, _ = await pipe.execute()
+            return OTPService.derive_code(phone_number, OTPService.current_step(), send)
+
+        code = str(secrets.randbelow(900000) + 100000)
+        pipe = get_async_redis().pipeline(transaction=False)
+        pipe.set(cache.make_key(f"verification_code_{phone_number}"), cache.client.encode(code), ex=OTPService.code_ttl)
+        pipe.delete(cache.make_key(f"verification_guesses_{phone_number}"))
+        await pipe.execute()
+        return code
+
+    @staticmethod
+    def _otp_response(message, retry_after):
+        return {
+            "data": {
+                "status": "success",
+                "message": message,
+                "retry_after": retry_after
+            }
+        }
+
     @staticmethod
     def send_otp_code(phone_number):
         """
         Sends OTP code to user.
+
+        Only one code is sent per phone number per ``resend_cooldown``: the
+        cooldown key is claimed with SET NX, and requests that lose the race
+        get the remaining cooldown back without a new code or SMS.
         """
+        cooldown_key = f"otp_cooldown_{phone_number}"
+        cooldown = int(OTPService.resend_cooldown.total_seconds())
+        if not cache.add(cooldown_key, 1, timeout=cooldown):
+            return OTPService._otp_response(
+                f"Verification code already sent to your {phone_number}",
+                max(cache.ttl(cooldown_key) or 0, 1)
+            )
+
         verification_code = OTPService.generate_code(phone_number)
-        send_verification_code.delay(phone_number=phone_number, verification_code=verification_code )
-        return {
-            "data": {
-                "status":"success",
-                "message": f"Verification code sent to your {phone_number}",
-                "retry_after": 60
-            }
-        }
+        if settings.OTP_DISPATCH["MODE"] == "batch":
+            OTPDispatcher.enqueue(phone_number, verification_code, ttl=OTPService.min_code_ttl())
+        else:
+            send_verification_code.delay(phone_number=phone_number, verification_code=verification_code )
+        return OTPService._otp_response(f"Verification code sent to your {phone_number}", cooldown)
+
+    @staticmethod
+    async def asend_otp_code(phone_number):
+        redis_client = get_async_redis()
+        cooldown_key = cache.make_key(f"otp_cooldown_{phone_number}")
+        cooldown = int(OTPService.resend_cooldown.total_seconds())
+        if not await redis_client.set(cooldown_key, cache.client.encode(1), nx=True, ex=cooldown):
+            return OTPService._otp_response(
+                f"Verification code already sent to your {phone_number}",
+                max(await redis_client.ttl(cooldown_key), 1)
+            )
+
+        verification_code = await OTPService.agenerate_code(phone_number)
+        if settings.OTP_DISPATCH["MODE"] == "batch":
+            await OTPDispatcher.aenqueue(phone_number, verification_code, ttl=OTPService.min_code_ttl())
+        else:
+            # Publishing to the broker blocks, so it runs off the event loop
+            await sync_to_async(send_verification_code.delay, thread_sensitive=False)(
+                phone_number=phone_number,
+                verification_code=verification_code
+            )
+        return OTPService._otp_response(f"Verification code sent to your {phone_number}", cooldown)
 
     @staticmethod
     def validate_code(phone_number, code):
         """
-        Validates a verification code for a user by checking Redis.
+        Validates and consumes a verification code in a single Redis script.
+
+        A matching code is deleted so it cannot be replayed; a wrong guess is
+        counted against the code, which is invalidated after
+        ``max_wrong_guesses`` misses.
 
         Args:
-            phone_number (str): The user's unique ID.
+            phone_number (str): The user's phone number.
             code (str): The code to validate.
 
         Returns:
@@ -154,20 +647,64 @@ class OTPService:
             Handles Redis errors and logs them.
         """
         try:
-            redis_client = cache.client.get_client()
+            if OTPService.hmac_mode():
+                return OTPService.validate_hmac_code(phone_number, code)
 
-            look = Lock(
-                redis_client,
-                name=f"otp_lock_{phone_number}",
-                timeout=5
-            )
+            keys, args = OTPService._consume_script_call(phone_number, code)
+            return bool(CONSUME_CODE_SCRIPT(cache.client.get_client(), keys=keys, args=args))
+
+        except Exception as e:
+            logger.info(f"Redis Error: {str(e)}")
+            return False
 
-            with look:
-                stored_code = cache.get(f"verification_code_{phone_number}")
-                if stored_code == code:
-                    return True
-                return False
+    @staticmethod
+    async def avalidate_code(phone_number, code):
+        try:
+            if OTPService.hmac_mode():
+                script = CONSUME_HMAC_CODE_SCRIPT
+                send = await get_async_redis().get(OTPService.sends_key(phone_number))
+                keys, args = OTPService._consume_hmac_script_call(phone_number, code, send)
+            else:
+                script = CONSUME_CODE_SCRIPT
+                keys, args = OTPService._consume_script_call(phone_number, code)
+            return bool(await script.acall(get_async_redis(), keys=keys, args=args))
 
         except Exception as e:
             logger.info(f"Redis Error: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+
+    @staticmethod
+    def _consume_script_call(phone_number, code):
+        keys = [
+            cache.make_key(f"verification_code_{phone_number}"),
+            cache.make_key(f"verification_guesses_{phone_number}"),
+        ]
+        return keys, [cache.client.encode(str(code)), OTPService.max_wrong_guesses]
+
+    @staticmethod
+    def _consume_hmac_script_call(phone_number, code, send):
+        # Only the code of the latest send is valid, as in "stored" mode
+        send = int(send or 0)
+        current_step = OTPService.current_step()
+        matched_step = ""
+        for step in (current_step, current_step - 1):
+            if hmac.compare_digest(str(code), OTPService.derive_code(phone_number, step, send)):
+                matched_step = step
+                break
+        keys = [
+            cache.make_key(f"verification_guesses_{phone_number}"),
+            cache.make_key(f"verification_last_used_{phone_number}"),
+        ]
+        return keys, [matched_step, OTPService.max_wrong_guesses, 2 * settings.OTP_CODES["STEP"], send]
+
+    @staticmethod
+    def validate_hmac_code(phone_number, code):
+        """
+        Validate a derived code of the latest send against the current and
+        previous time step and mark it as consumed.
+
+        A code is accepted once; a resend derives a new one right away.
+        """
+        send = cache.client.get_client().get(OTPService.sends_key(phone_number))
+        keys, args = OTPService._consume_hmac_script_call(phone_number, code, send)
+        return bool(CONSUME_HMAC_CODE_SCRIPT(cache.client.get_client(), keys=keys, args=args))
@@ -0,0 +1,206 @@
+import functools
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from datetime import datetime
+
+import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from jwt.algorithms import ECAlgorithm, OKPAlgorithm
+
+from rest_framework_simplejwt.backends import TokenBackend
+from rest_framework_simplejwt.exceptions import TokenBackendError
+from rest_framework_simplejwt.settings import api_settings
+
+ASYMMETRIC_ALGORITHMS = {"EdDSA", "ES256"}
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    """
+    A parsed key of the ring; ``private_key`` is None for verify-only keys.
+    """
+    kid: str
+    algorithm: str
+    private_key: object
+    public_key: object
+
+    def to_jwk(self):
+        algorithm = OKPAlgorithm if self.algorithm == "EdDSA" else ECAlgorithm
+        return {
+            **algorithm.to_jwk(self.public_key, as_dict=True),
+            "kid": self.kid,
+            "alg": self.algorithm,
+            "use": "sig",
+        }
+
+
+def key_algorithm(key):
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return "ES256"
+    raise ImproperlyConfigured(f"Unsupported JWT signing key type {key.__class__.__name__}")
+
+
+def generate_private_key(algorithm):
+    if algorithm == "EdDSA":
+        return ed25519.Ed25519PrivateKey.generate()
+    if algorithm == "ES256":
+        return ec.generate_private_key(ec.SECP256R1())
+    raise ImproperlyConfigured(f"Cannot generate keys for {algorithm}")
+
+
+class KeyRing:
+    """
+    Signing keys loaded once from ``keys_dir``.
+
+    ``<kid>.pem`` holds a private key, ``<kid>.pub.pem`` the public key of a
+    retired one. Only ``active_kid`` signs; every key verifies and is
+    published in the JWKS, so consumers can learn a key before it signs and
+    keep verifying tokens of a retired one until they expire.
+    """
+
+    def __init__(self, keys_dir, active_kid):
+        self.keys = {}
+        for name in sorted(os.listdir(keys_dir)) if os.path.isdir(keys_dir) else []:
+            path = os.path.join(keys_dir, name)
+            with open(path, "rb") as key_file:
+                data = key_file.read()
+            if name.endswith(".pub.pem"):
+                kid = name[:-len(".pub.pem")]
+                private_key, public_key = None, serialization.load_pem_public_key(data)
+            elif name.endswith(".pem"):
+                kid = name[:-len(".pem")]
+                private_key = serialization.load_pem_private_key(data, password=None)
+                public_key = private_key.public_key()
+            else:
+                continue
+            self.keys[kid] = SigningKey(kid, key_algorithm(public_key), private_key, public_key)
+
+        self.active = self.keys.get(active_kid)
+        if self.active is None or self.active.private_key is None:
+            raise ImproperlyConfigured(f"No private JWT signing key '{active_kid}' in {keys_dir}")
+
+        jwks = json.dumps({"keys": [key.to_jwk() for key in self.keys.values()]}, separators=(",", ":"))
+        self.jwks = jwks.encode()
+        self.jwks_etag = f'"{hashlib.sha256(self.jwks).hexdigest()[:32]}"'
+
+    def get(self, kid):
+        return self.keys.get(kid)
+
+
+class KeyRingTokenBackend(TokenBackend):
+    """
+    TokenBackend that signs with the active key of a KeyRing and picks the
+    verifying key by the ``kid`` header.
+
+    Tokens without a ``kid`` are HS256 tokens signed with SIGNING_KEY. They
+    are accepted only if issued before ``hs256_issued_before``, the time of
+    the switch, and only until every refresh token issued by then expired.
+    """
+
+    def __init__(self, key_ring, hs256_issued_before=None, **kwargs):
+        super().__init__("HS256", **kwargs)
+        self.key_ring = key_ring
+        self.hs256_issued_before = hs256_issued_before
+
+    def decode_hs256(self, token, verify=True):
+        issued_before = self.hs256_issued_before
+        if issued_before is None or timezone.now() >= issued_before + api_settings.REFRESH_TOKEN_LIFETIME:
+            raise TokenBackendError(_("Token is invalid or expired"))
+        payload = super().decode(token, verify=verify)
+        if payload.get("iat", float("inf")) >= issued_before.timestamp():
+            raise TokenBackendError(_("Token is invalid or expired"))
+        return payload
+
+    def encode(self, payload):
+        jwt_payload = payload.copy()
+        if self.audience is not None:
+            jwt_payload["aud"] = self.audience
+        if self.issuer is not None:
+            jwt_payload["iss"] = self.issuer
+
+        key = self.key_ring.active
+        return jwt.encode(
+            jwt_payload,
+            key.private_key,
+            algorithm=key.algorithm,
+            headers={"kid": key.kid},
+            json_encoder=self.json_encoder,
+        )
+
+    def decode(self, token, verify=True):
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except jwt.InvalidTokenError as ex:
+            raise TokenBackendError(_("Token is invalid or expired")) from ex
+
+        if kid is None:
+            return self.decode_hs256(token, verify=verify)
+
+        key = self.key_ring.get(kid)
+        if key is None:
+            raise TokenBackendError(_("Token is invalid or expired"))
+
+        try:
+            return jwt.decode(
+                token,
+                key.public_key,
+                algorithms=[key.algorithm],
+                audience=self.audience,
+                issuer=self.issuer,
+                leeway=self.get_leeway(),
+                options={
+                    "verify_aud": self.audience is not None,
+                    "verify_signature": verify,
+                },
+            )
+        except jwt.InvalidTokenError as ex:
+            raise TokenBackendError(_("Token is invalid or expired")) from ex
+
+
+@functools.lru_cache(maxsize=None)
+def _token_backend(algorithm, keys_dir, active_kid, hs256_issued_before):
+    backend_options = {
+        "signing_key": api_settings.SIGNING_KEY,
+        "audience": api_settings.AUDIENCE,
+        "issuer": api_settings.ISSUER,
+        "leeway": api_settings.LEEWAY,
+        "json_encoder": api_settings.JSON_ENCODER,
+    }
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        return TokenBackend(
+            api_settings.ALGORITHM,
+            verifying_key=api_settings.VERIFYING_KEY,
+            jwk_url=api_settings.JWK_URL,
+            **backend_options
+        )
+    if hs256_issued_before:
+        hs256_issued_before = datetime.fromisoformat(hs256_issued_before)
+        if timezone.is_naive(hs256_issued_before):
+            raise ImproperlyConfigured("JWT_SIGNING['HS256_ISSUED_BEFORE'] needs a UTC offset")
+    return KeyRingTokenBackend(
+        KeyRing(keys_dir, active_kid),
+        hs256_issued_before=hs256_issued_before or None,
+        **backend_options
+    )
+
+
+def get_token_backend():
+    """
+    The process-wide token backend; keys are parsed on first use only.
+    """
+    options = settings.JWT_SIGNING
+    return _token_backend(
+        options["ALGORITHM"],
+        options["KEYS_DIR"],
+        options["ACTIVE_KID"],
+        options["HS256_ISSUED_BEFORE"]
+    )
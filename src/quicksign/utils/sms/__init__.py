@@ -0,0 +1,46 @@
+import functools
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+from .base import (AsyncConsoleSMSProvider, BaseAsyncSMSProvider, BaseSMSProvider,
+                   CircuitBreaker, CircuitOpenError, ConsoleSMSProvider,
+                   SMSDeliveryError, SMSMessage, SMSOutcomeUnknownError, SMSRejectedError,
+                   SMSResult)
+from .providers import AsyncHTTPSMSProvider, HTTPSMSProvider
+
+__all__ = (
+    "AsyncConsoleSMSProvider",
+    "AsyncHTTPSMSProvider",
+    "BaseAsyncSMSProvider",
+    "BaseSMSProvider",
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "ConsoleSMSProvider",
+    "HTTPSMSProvider",
+    "SMSDeliveryError",
+    "SMSMessage",
+    "SMSOutcomeUnknownError",
+    "SMSRejectedError",
+    "SMSResult",
+    "get_async_sms_provider",
+    "get_sms_provider",
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_sms_provider():
+    """
+    Process-wide blocking provider configured by SMS_PROVIDER['BACKEND'].
+    """
+    config = settings.SMS_PROVIDER
+    return import_string(config["BACKEND"])(**config["OPTIONS"])
+
+
+@functools.lru_cache(maxsize=None)
+def get_async_sms_provider():
+    """
+    Process-wide asyncio provider configured by SMS_PROVIDER['ASYNC_BACKEND'].
+    """
+    config = settings.SMS_PROVIDER
+    return import_string(config["ASYNC_BACKEND"])(**config["OPTIONS"])
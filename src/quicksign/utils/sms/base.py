@@ -0,0 +1,182 @@
+import logging
+import random
+import threading
+import time
+from dataclasses import dataclass
+
+logger = logging.getLogger(__name__)
+
+
+class SMSDeliveryError(Exception):
+    """
+    Raised when a message could not be handed to the provider.
+
+    ``temporary`` errors (connection failures, 429 and 503 answers, an open
+    circuit) left the message unsent, so it can be sent again later.
+    """
+    temporary = True
+
+
+class SMSRejectedError(SMSDeliveryError):
+    """
+    Raised when the provider refused the request itself; resending it
+    unchanged fails the same way.
+    """
+    temporary = False
+
+
+class SMSOutcomeUnknownError(SMSDeliveryError):
+    """
+    Raised when the request failed after reaching the provider (a read
+    timeout, a 500); it may have accepted the message, so resending it
+    could deliver the message twice.
+    """
+    temporary = False
+
+
+class CircuitOpenError(SMSDeliveryError):
+    """
+    Raised without calling the provider while the circuit breaker is open.
+    """
+
+
+@dataclass(frozen=True)
+class SMSMessage:
+    phone_number: str
+    text: str
+
+
+@dataclass(frozen=True)
+class SMSResult:
+    """
+    Delivery outcome of one message as reported by the provider.
+    """
+    phone_number: str
+    success: bool
+    message_id: str = ""
+    error: str = ""
+
+
+class CircuitBreaker:
+    """
+    Stop calling a failing provider for ``reset_timeout`` seconds after
+    ``failure_threshold`` consecutive failures, then let one trial call through.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self):
+        with self._lock:
+            state = self.state
+            if state == "open":
+                raise CircuitOpenError("SMS provider circuit is open")
+            if state == "half_open":
+                # Only one trial call; others keep failing fast until it reports
+                self.opened_at = time.monotonic()
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+def backoff_delay(attempt, base=0.2, cap=5.0):
+    """
+    Exponential backoff with full jitter for the given retry attempt (0-based).
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class BaseSMSProvider:
+    """
+    Blocking SMS provider interface used by Celery tasks.
+
+    ``supports_bulk`` is True when ``send_bulk`` is a single provider call.
+    """
+    supports_bulk = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    def send(self, phone_number, text):
+        raise NotImplementedError
+
+    def send_bulk(self, messages):
+        """
+        Send several messages; providers with a bulk API override this with a
+        single call.
+        """
+        results = []
+        for message in messages:
+            try:
+                results.append(self.send(message.phone_number, message.text))
+            except SMSDeliveryError as e:
+                results.append(SMSResult(phone_number=message.phone_number, success=False, error=str(e)))
+        return results
+
+
+class BaseAsyncSMSProvider:
+    """
+    Asyncio SMS provider interface for sending many messages concurrently.
+    """
+    supports_bulk = False
+
+    def __init__(self, **options):
+        self.options = options
+
+    async def send(self, phone_number, text):
+        raise NotImplementedError
+
+    async def send_many(self, messages):
+        raise NotImplementedError
+
+    async def send_bulk(self, messages):
+        return await self.send_many(messages)
+
+    async def aclose(self):
+        pass
+
+
+class ConsoleSMSProvider(BaseSMSProvider):
+    """
+    Development provider that only logs outgoing messages.
+    """
+
+    def send(self, phone_number, text):
+        logger.info(f"Sending SMS to phone: {phone_number}: {text}")
+        return SMSResult(phone_number=phone_number, success=True)
+
+    def send_bulk(self, messages):
+        return [self.send(message.phone_number, message.text) for message in messages]
+
+
+class AsyncConsoleSMSProvider(BaseAsyncSMSProvider):
+    """
+    Asyncio counterpart of ConsoleSMSProvider.
+    """
+
+    async def send(self, phone_number, text):
+        logger.info(f"Sending SMS to phone: {phone_number}: {text}")
+        return SMSResult(phone_number=phone_number, success=True)
+
+    async def send_many(self, messages):
+        return [await self.send(message.phone_number, message.text) for message in messages]
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class FakeSMSRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        payload = json.loads(self.rfile.read(length) or b"{}")
+
+        with server.lock:
+            server.requests.append((self.path, payload))
+            failing = server.fail_next > 0
+            if failing:
+                server.fail_next -= 1
+
+        if server.latency:
+            time.sleep(server.latency)
+
+        if failing:
+            return self.reply(server.fail_status, {"error": "unavailable"})
+        if self.path == "/messages":
+            server.record(payload)
+            return self.reply(200, {"id": uuid.uuid4().hex, "status": "accepted"})
+        if self.path == "/messages/bulk":
+            results = []
+            for message in payload.get("messages", []):
+                if message.get("to") in server.rejected_numbers:
+                    results.append({"status": "rejected", "error": "invalid_number"})
+                else:
+                    server.record(message)
+                    results.append({"id": uuid.uuid4().hex, "status": "accepted"})
+            return self.reply(200, {"results": results})
+        return self.reply(404, {"error": "not_found"})
+
+    def reply(self, status, body):
+        content = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        try:
+            self.wfile.write(content)
+        except (BrokenPipeError, ConnectionResetError):
+            # The client timed out waiting for the answer
+            pass
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSMSProviderServer(ThreadingHTTPServer):
+    """
+    Local stand-in for an SMS provider API, for tests and offline development.
+
+    ``fail_next`` answers the next N requests with ``fail_status`` (503 by
+    default), ``latency`` delays
+    every response and numbers in ``rejected_numbers`` are refused by the
+    bulk endpoint. Accepted messages are collected in ``messages``.
+    """
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0):
+        super().__init__((host, port), FakeSMSRequestHandler)
+        self.latency = latency
+        self.fail_next = 0
+        self.fail_status = 503
+        self.rejected_numbers = set()
+        self.requests = []
+        self.messages = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def record(self, message):
+        with self.lock:
+            self.messages.append(message)
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever, daemon=True)
+        thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,202 @@
+import asyncio
+import time
+
+import httpx
+
+from .base import (BaseAsyncSMSProvider, BaseSMSProvider, CircuitBreaker, SMSDeliveryError,
+                   SMSOutcomeUnknownError, SMSRejectedError, SMSResult, backoff_delay)
+
+
+class HTTPProviderMixin:
+    """
+    Configuration and payload handling shared by the sync and async HTTP
+    providers.
+
+    The provider API accepts ``POST /messages`` with ``{"to", "text"}`` and
+    ``POST /messages/bulk`` with ``{"messages": [...]}``; both answer with the
+    provider message id (``id``) and, for bulk, a per-message ``status``.
+
+    Only requests the provider cannot have processed are retried: failures
+    to connect, and 429 or 503 answers. After any other failure it may have
+    accepted the messages, so resending could deliver them twice.
+    """
+
+    supports_bulk = True
+    # Raised before any byte of the request reached the provider
+    unsent_errors = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+    def setup(self, base_url, api_key="", timeout=5.0, connect_timeout=2.0,
+              max_retries=3, backoff_base=0.2, backoff_cap=5.0,
+              max_connections=20, failure_threshold=5, reset_timeout=30,
+              max_in_flight=200, **options):
+        if not base_url:
+            raise ValueError("base_url is required for HTTP SMS providers")
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+        self.max_in_flight = max_in_flight
+        self.breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+        self.client_options = {
+            "base_url": base_url,
+            "headers": {"Authorization": f"Bearer {api_key}"} if api_key else {},
+            "timeout": httpx.Timeout(timeout, connect=connect_timeout),
+            "limits": httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections
+            ),
+        }
+
+    @staticmethod
+    def is_retryable(response):
+        return response.status_code in (429, 503)
+
+    def handle_response(self, response):
+        if response.status_code >= 500:
+            self.breaker.record_failure()
+            raise SMSOutcomeUnknownError(f"HTTP {response.status_code}")
+        self.breaker.record_success()
+        if response.is_error:
+            raise SMSRejectedError(f"HTTP {response.status_code}")
+        return response.json()
+
+    def outcome_unknown(self, exc):
+        self.breaker.record_failure()
+        return SMSOutcomeUnknownError(str(exc) or exc.__class__.__name__)
+
+    @staticmethod
+    def bulk_payload(messages):
+        return {"messages": [{"to": message.phone_number, "text": message.text} for message in messages]}
+
+    @staticmethod
+    def bulk_results(messages, data):
+        # Results match messages by position; a message the provider did not
+        # answer for is reported as failed rather than dropped
+        items = data.get("results", [])
+        results = []
+        for index, message in enumerate(messages):
+            item = items[index] if index < len(items) else {"error": "missing_result"}
+            success = item.get("status") == "accepted"
+            results.append(SMSResult(
+                phone_number=message.phone_number,
+                success=success,
+                message_id=str(item.get("id", "")),
+                error="" if success else item.get("error", "rejected")
+            ))
+        return results
+
+
+class HTTPSMSProvider(HTTPProviderMixin, BaseSMSProvider):
+    """
+    Blocking provider over a keep-alive connection pool, with retries and a
+    circuit breaker.
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.setup(**options)
+        self.client = httpx.Client(**self.client_options)
+
+    def post(self, path, payload):
+        self.breaker.before_call()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.client.post(path, json=payload)
+            except self.unsent_errors as e:
+                error = str(e) or e.__class__.__name__
+            except httpx.TransportError as e:
+                raise self.outcome_unknown(e) from e
+            else:
+                if not self.is_retryable(response):
+                    return self.handle_response(response)
+                error = f"HTTP {response.status_code}"
+
+            if attempt < self.max_retries:
+                time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+
+        self.breaker.record_failure()
+        raise SMSDeliveryError(error)
+
+    def send(self, phone_number, text):
+        data = self.post("/messages", {"to": phone_number, "text": text})
+        return SMSResult(phone_number=phone_number, success=True, message_id=str(data.get("id", "")))
+
+    def send_bulk(self, messages):
+        if not messages:
+            return []
+        return self.bulk_results(messages, self.post("/messages/bulk", self.bulk_payload(messages)))
+
+    def close(self):
+        self.client.close()
+
+
+class AsyncHTTPSMSProvider(HTTPProviderMixin, BaseAsyncSMSProvider):
+    """
+    Asyncio provider keeping up to ``max_in_flight`` sends running at once
+    over a shared connection pool.
+
+    The underlying client is bound to the running event loop and recreated
+    when called from a different loop (e.g. one ``asyncio.run`` per task).
+    """
+
+    def __init__(self, **options):
+        super().__init__(**options)
+        self.setup(**options)
+        self._client = None
+        self._client_loop = None
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            self._client = httpx.AsyncClient(**self.client_options)
+            self._client_loop = loop
+        return self._client
+
+    async def post(self, path, payload):
+        self.breaker.before_call()
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = await self.client.post(path, json=payload)
+            except self.unsent_errors as e:
+                error = str(e) or e.__class__.__name__
+            except httpx.TransportError as e:
+                raise self.outcome_unknown(e) from e
+            else:
+                if not self.is_retryable(response):
+                    return self.handle_response(response)
+                error = f"HTTP {response.status_code}"
+
+            if attempt < self.max_retries:
+                await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_cap))
+
+        self.breaker.record_failure()
+        raise SMSDeliveryError(error)
+
+    async def send(self, phone_number, text):
+        data = await self.post("/messages", {"to": phone_number, "text": text})
+        return SMSResult(phone_number=phone_number, success=True, message_id=str(data.get("id", "")))
+
+    async def send_many(self, messages):
+        """
+        Send messages concurrently, one request each, bounded by ``max_in_flight``.
+        """
+        semaphore = asyncio.Semaphore(self.max_in_flight)
+
+        async def send_one(message):
+            async with semaphore:
+                try:
+                    return await self.send(message.phone_number, message.text)
+                except SMSDeliveryError as e:
+                    return SMSResult(phone_number=message.phone_number, success=False, error=str(e))
+
+        return await asyncio.gather(*(send_one(message) for message in messages))
+
+    async def send_bulk(self, messages):
+        if not messages:
+            return []
+        return self.bulk_results(messages, await self.post("/messages/bulk", self.bulk_payload(messages)))
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
@@ -0,0 +1,58 @@
+from django.test import TestCase, SimpleTestCase
+from django.core.cache import cache
+
+from quicksign.utils.bloom import BloomFilter, RedisBloomFilter
+
+
+class BloomFilterTestCase(SimpleTestCase):
+    def test_sizing(self):
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        self.assertEqual(bloom_filter.num_bits, 9586)
+        self.assertEqual(bloom_filter.num_hashes, 7)
+        self.assertEqual(bloom_filter.size_bytes, 1199)
+
+    def test_no_false_negatives(self):
+        bloom_filter = BloomFilter(capacity=1000, error_rate=0.01)
+        phones = [f"+98912{i:07d}" for i in range(1000)]
+        for phone in phones:
+            bloom_filter.add(phone)
+
+        self.assertTrue(all(phone in bloom_filter for phone in phones))
+        false_positives = sum(f"+98935{i:07d}" in bloom_filter for i in range(1000))
+        self.assertLess(false_positives, 30)
+        self.assertAlmostEqual(bloom_filter.false_positive_rate(), 0.01, delta=0.002)
+
+    def test_invalid_parameters(self):
+        with self.assertRaises(ValueError):
+            BloomFilter(capacity=0, error_rate=0.01)
+        with self.assertRaises(ValueError):
+            BloomFilter(capacity=10, error_rate=1)
+
+
+class RedisBloomFilterTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.bloom_filter = RedisBloomFilter("test_bloom", capacity=100, error_rate=0.01)
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_unbuilt_filter_cannot_answer(self):
+        self.assertIsNone(self.bloom_filter.might_contain("+989123456789"))
+        self.assertFalse(self.bloom_filter.add("+989123456789"))
+        self.assertFalse(self.bloom_filter.exists())
+
+    def test_replace_matches_local_bits(self):
+        local_filter = BloomFilter(capacity=100, error_rate=0.01)
+        local_filter.add("+989123456789")
+        self.bloom_filter.replace(local_filter)
+
+        self.assertTrue(self.bloom_filter.might_contain("+989123456789"))
+        self.assertFalse(self.bloom_filter.might_contain("+989111111111"))
+
+        self.assertTrue(self.bloom_filter.add("+989111111111"))
+        self.assertTrue(self.bloom_filter.might_contain("+989111111111"))
+
+    def test_geometry_is_part_of_key(self):
+        other = RedisBloomFilter("test_bloom", capacity=100, error_rate=0.001)
+        self.assertNotEqual(self.bloom_filter.key, other.key)
@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.test import SimpleTestCase
+
+from quicksign.utils.database import configure_database_pool
+
+
+class ConfigureDatabasePoolTestCase(SimpleTestCase):
+    def configure(self, **options):
+        database = {"ENGINE": "django.db.backends.postgresql", "OPTIONS": {}}
+        return configure_database_pool(database, {**settings.DATABASE_POOL, **options})
+
+    def test_native_pool_with_prepared_statements(self):
+        database = self.configure(MODE="native", MAX_SIZE=20, PREPARE_THRESHOLD=3)
+        self.assertEqual(database["OPTIONS"]["pool"]["max_size"], 20)
+        self.assertTrue(database["CONN_HEALTH_CHECKS"])
+        self.assertTrue(database["OPTIONS"]["server_side_binding"])
+        self.assertEqual(database["OPTIONS"]["prepare_threshold"], 3)
+
+    def test_pgbouncer_mode(self):
+        database = self.configure(MODE="pgbouncer", PREPARE_THRESHOLD=3)
+        self.assertEqual(database["OPTIONS"], {})
+        self.assertTrue(database["DISABLE_SERVER_SIDE_CURSORS"])
+        self.assertGreater(database["CONN_MAX_AGE"], 0)
+
+    def test_without_pool_or_prepared_statements(self):
+        self.assertEqual(self.configure(MODE="none", PREPARE_THRESHOLD=0)["OPTIONS"], {})
+
+    def test_other_engines_are_left_alone(self):
+        database = {"ENGINE": "django.db.backends.sqlite3"}
+        self.assertEqual(configure_database_pool(database, settings.DATABASE_POOL), database)
@@ -0,0 +1,144 @@
+from unittest.mock import patch
+
+from django.test import TestCase, override_settings
+from django.core.cache import cache
+
+from quicksign.utils.dispatch import OTPDispatcher
+from quicksign.utils.services import OTPService
+from quicksign.utils.sms import CircuitOpenError, HTTPSMSProvider, SMSRejectedError, SMSResult
+from quicksign.utils.sms.fake import FakeSMSProviderServer
+
+
+class OTPDispatcherTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.server = FakeSMSProviderServer().start()
+        self.provider = HTTPSMSProvider(base_url=self.server.url, max_retries=0)
+        self.dispatcher = OTPDispatcher(provider=self.provider, max_batch_size=100, max_latency=0.05)
+
+    def tearDown(self):
+        self.server.stop()
+        cache.clear()
+
+    def test_batch_flushed_in_one_provider_call(self):
+        message_ids = [OTPDispatcher.enqueue(f"+98912345678{i}", f"12345{i}") for i in range(5)]
+        self.assertEqual(OTPDispatcher.delivery_status(message_ids[0]), {"status": "queued"})
+
+        batch = self.dispatcher.collect(block_timeout=1)
+        self.assertEqual(len(batch), 5)
+        self.dispatcher.flush(batch)
+
+        self.assertEqual(len(self.server.requests), 1)
+        self.assertEqual(len(self.server.messages), 5)
+        for message_id in message_ids:
+            self.assertEqual(OTPDispatcher.delivery_status(message_id)["status"], "sent")
+
+        stats = OTPDispatcher.stats()
+        self.assertEqual(stats["batches"], 1)
+        self.assertEqual(stats["messages"], 5)
+        self.assertEqual(stats["provider_calls_saved"], 4)
+        self.assertEqual(stats["avg_batch_size"], 5)
+
+    def test_batch_size_is_capped(self):
+        dispatcher = OTPDispatcher(provider=self.provider, max_batch_size=3, max_latency=0.05)
+        for i in range(5):
+            OTPDispatcher.enqueue(f"+98912345678{i}", "123456")
+
+        self.assertEqual(len(dispatcher.collect(block_timeout=1)), 3)
+        self.assertEqual(len(dispatcher.collect(block_timeout=1)), 2)
+        self.assertEqual(dispatcher.collect(block_timeout=0.01), [])
+
+    def test_rejected_message_recorded_as_failed(self):
+        self.server.rejected_numbers = {"+989000000000"}
+        ok_id = OTPDispatcher.enqueue("+989123456789", "123456")
+        rejected_id = OTPDispatcher.enqueue("+989000000000", "123456")
+
+        self.dispatcher.flush(self.dispatcher.collect(block_timeout=1))
+
+        self.assertEqual(OTPDispatcher.delivery_status(ok_id)["status"], "sent")
+        self.assertEqual(OTPDispatcher.delivery_status(rejected_id)["status"], "failed")
+        self.assertEqual(OTPDispatcher.stats()["failed"], 1)
+
+    def test_unacknowledged_batch_is_requeued(self):
+        message_ids = [OTPDispatcher.enqueue(f"+98912345678{i}", "123456") for i in range(3)]
+        self.assertEqual(len(self.dispatcher.collect(block_timeout=1)), 3)
+
+        # The dispatcher dies before flushing; its next start sends the batch
+        restarted = OTPDispatcher(provider=self.provider, max_batch_size=100, max_latency=0.05,
+                                  worker_id=self.dispatcher.worker_id)
+        self.assertEqual(restarted.requeue(), 3)
+        batch = restarted.collect(block_timeout=1)
+        self.assertEqual([item["id"] for item in batch], message_ids)
+
+        restarted.flush(batch)
+        self.assertEqual(cache.client.get_client().llen(restarted.processing_key()), 0)
+        self.assertEqual(restarted.requeue(), 0)
+
+    def test_failed_flush_keeps_batch(self):
+        OTPDispatcher.enqueue("+989123456789", "123456")
+        batch = self.dispatcher.collect(block_timeout=1)
+        with patch.object(self.provider, "send_bulk", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.dispatcher.flush(batch)
+
+        self.assertEqual(self.dispatcher.requeue(), 1)
+        self.dispatcher.flush(self.dispatcher.collect(block_timeout=1))
+        self.assertEqual(len(self.server.messages), 1)
+
+    def test_temporary_failure_requeues_batch(self):
+        message_id = OTPDispatcher.enqueue("+989123456789", "123456")
+        batch = self.dispatcher.collect(block_timeout=1)
+        with patch.object(self.provider, "send_bulk", side_effect=CircuitOpenError("open")):
+            with self.assertRaises(CircuitOpenError):
+                self.dispatcher.flush(batch)
+        self.assertEqual(OTPDispatcher.delivery_status(message_id), {"status": "queued"})
+
+        self.assertEqual(self.dispatcher.requeue(), 1)
+        self.dispatcher.flush(self.dispatcher.collect(block_timeout=1))
+        self.assertEqual(OTPDispatcher.delivery_status(message_id)["status"], "sent")
+
+    def test_permanent_failure_is_not_retried(self):
+        message_id = OTPDispatcher.enqueue("+989123456789", "123456")
+        with patch.object(self.provider, "send_bulk", side_effect=SMSRejectedError("HTTP 400")):
+            self.dispatcher.flush(self.dispatcher.collect(block_timeout=1))
+
+        self.assertEqual(OTPDispatcher.delivery_status(message_id)["status"], "failed")
+        self.assertEqual(self.dispatcher.requeue(), 0)
+
+    def test_expired_codes_are_not_sent(self):
+        expired_id = OTPDispatcher.enqueue("+989123456789", "123456", ttl=120)
+        fresh_id = OTPDispatcher.enqueue("+989123456788", "123456", ttl=120)
+        batch = self.dispatcher.collect(block_timeout=1)
+        batch[0]["expires_at"] = batch[0]["enqueued_at"] - 1
+        self.dispatcher.flush(batch)
+
+        self.assertEqual([message["to"] for message in self.server.messages], ["+989123456788"])
+        self.assertEqual(OTPDispatcher.delivery_status(expired_id)["status"], "expired")
+        self.assertEqual(OTPDispatcher.delivery_status(fresh_id)["status"], "sent")
+        self.assertEqual(cache.client.get_client().llen(self.dispatcher.processing_key()), 0)
+
+    def test_missing_provider_results_recorded_as_failed(self):
+        ok_id = OTPDispatcher.enqueue("+989123456789", "123456")
+        missing_id = OTPDispatcher.enqueue("+989123456788", "123456")
+        batch = self.dispatcher.collect(block_timeout=1)
+        answered = [SMSResult(phone_number="+989123456789", success=True, message_id="1")]
+        with patch.object(self.provider, "send_bulk", return_value=answered):
+            self.dispatcher.flush(batch)
+
+        self.assertEqual(OTPDispatcher.delivery_status(ok_id)["status"], "sent")
+        self.assertEqual(OTPDispatcher.delivery_status(missing_id), {
+            "status": "failed", "provider_message_id": "", "error": "missing_result"
+        })
+
+    @override_settings(OTP_DISPATCH={'MODE': 'batch', 'MAX_BATCH_SIZE': 100, 'MAX_LATENCY_MS': 50, 'RESULT_TTL': 60})
+    @patch("quicksign.apps.users.tasks.send_verification_code.delay")
+    def test_send_otp_code_enqueues_in_batch_mode(self, mock_delay):
+        OTPService.send_otp_code("+989123456789")
+
+        mock_delay.assert_not_called()
+        batch = self.dispatcher.collect(block_timeout=1)
+        self.assertEqual(batch[0]["code"], cache.get("verification_code_+989123456789"))
+        self.assertEqual(batch[0]["expires_at"], batch[0]["enqueued_at"] + OTPService.code_ttl)
+
+        self.dispatcher.flush(batch)
+        self.assertEqual(OTPDispatcher.latest_delivery_status("+989123456789")["status"], "sent")
@@ -0,0 +1,56 @@
+import threading
+
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.test import SimpleTestCase, override_settings
+
+from quicksign.utils import hashing
+from quicksign.utils.hashing import HashingPool, HashingPoolSaturated
+
+
+class HashingPoolTestCase(SimpleTestCase):
+    def test_rejects_beyond_queue_limit(self):
+        pool = HashingPool(max_workers=1, max_queue=1, retry_after=3)
+        release = threading.Event()
+        threads = [threading.Thread(target=pool.run, args=(release.wait,)) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        while pool.stats()["in_flight"] < 2:
+            pass
+
+        with self.assertRaises(HashingPoolSaturated) as cm:
+            pool.run(lambda: None)
+        self.assertEqual(cm.exception.retry_after, 3)
+
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(pool.run(lambda: 42), 42)
+
+        stats = pool.stats()
+        self.assertEqual(stats["rejected"], 1)
+        self.assertEqual(stats["completed"], 3)
+        self.assertEqual(stats["in_flight"], 0)
+
+    def test_exceptions_propagate(self):
+        pool = HashingPool(max_workers=1, max_queue=0)
+        with self.assertRaises(ZeroDivisionError):
+            pool.run(lambda: 1 / 0)
+        self.assertEqual(pool.stats()["in_flight"], 0)
+
+
+class PooledHashersTestCase(SimpleTestCase):
+    def test_make_and_check_password(self):
+        encoded = hashing.make_password("secret-pass")
+
+        self.assertEqual(hashing.check_password("secret-pass", encoded), (True, False))
+        self.assertEqual(hashing.check_password("wrong-pass", encoded), (False, False))
+
+    def test_outdated_hash_must_update(self):
+        hasher = PBKDF2PasswordHasher()
+        encoded = hasher.encode("secret-pass", hasher.salt(), iterations=1000)
+
+        self.assertEqual(hashing.check_password("secret-pass", encoded), (True, True))
+
+    @override_settings(PASSWORD_HASHING_POOL={'ENABLED': False, 'MAX_WORKERS': 1, 'MAX_QUEUE': 0, 'RETRY_AFTER': 1})
+    def test_disabled_pool_runs_inline(self):
+        self.assertEqual(hashing.run_hashing(threading.current_thread), threading.current_thread())
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from django.test import SimpleTestCase
+
+from quicksign.utils.localcache import LocalTTLCache
+
+
+class LocalTTLCacheTestCase(SimpleTestCase):
+    def setUp(self):
+        self.cache = LocalTTLCache(max_size=2, ttl=5)
+
+    def test_hit_and_miss_counters(self):
+        self.assertIsNone(self.cache.get("a"))
+        self.cache.set("a", True)
+        self.assertTrue(self.cache.get("a"))
+
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["hit_ratio"], 0.5)
+
+    def test_evicts_least_recently_used(self):
+        self.cache.set("a", True)
+        self.cache.set("b", True)
+        self.cache.get("a")
+        self.cache.set("c", True)
+
+        self.assertIsNone(self.cache.get("b"))
+        self.assertTrue(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_entries_expire(self):
+        with patch("quicksign.utils.localcache.time.monotonic", return_value=100):
+            self.cache.set("a", True)
+        with patch("quicksign.utils.localcache.time.monotonic", return_value=106):
+            self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(self.cache.stats()["size"], 0)
+
+    def test_stale_generation_is_not_cached(self):
+        """A value read before an invalidation must not be cached"""
+        generation = self.cache.generation
+        self.cache.delete("a")
+        self.cache.set("a", True, generation=generation)
+        self.assertIsNone(self.cache.get("a"))
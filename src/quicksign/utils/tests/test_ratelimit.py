@@ -0,0 +1,52 @@
+from django.test import TestCase
+from django.core.cache import cache
+
+from quicksign.utils.ratelimit import GCRARateLimiter, RateLimitResult
+
+
+class GCRARateLimiterTestCase(TestCase):
+    def setUp(self):
+        self.key = "throttle_test_127.0.0.1"
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_allows_burst_up_to_limit(self):
+        """The full limit can be used at once, the next request is denied"""
+        limiter = GCRARateLimiter(limit=3, period=60)
+        for _ in range(3):
+            self.assertTrue(limiter.hit(self.key).allowed)
+
+        result = limiter.hit(self.key)
+        self.assertFalse(result.allowed)
+        self.assertGreater(result.retry_after, 0)
+        self.assertLessEqual(result.retry_after, 20)
+
+    def test_cost_consumes_multiple_units(self):
+        """A weighted hit consumes as many units as its cost"""
+        limiter = GCRARateLimiter(limit=10, period=60)
+        self.assertTrue(limiter.hit(self.key, cost=8).allowed)
+        self.assertFalse(limiter.hit(self.key, cost=3).allowed)
+        self.assertTrue(limiter.hit(self.key, cost=2).allowed)
+
+    def test_cost_over_limit_is_never_allowed(self):
+        """A hit costing more than the burst is refused without a retry time"""
+        limiter = GCRARateLimiter(limit=10, period=60)
+        self.assertEqual(limiter.hit(self.key, cost=11), RateLimitResult(allowed=False, retry_after=None))
+        self.assertTrue(limiter.hit(self.key, cost=10).allowed)
+
+    def test_constant_memory_per_key(self):
+        """Only a single expiring scalar is stored per key"""
+        limiter = GCRARateLimiter(limit=100, period=60)
+        for _ in range(50):
+            limiter.hit(self.key)
+
+        redis_client = cache.client.get_client()
+        redis_key = cache.make_key(self.key)
+        self.assertEqual(redis_client.type(redis_key), b"string")
+        self.assertGreater(redis_client.pttl(redis_key), 0)
+
+    def test_invalid_rate(self):
+        with self.assertRaises(ValueError):
+            GCRARateLimiter(limit=0, period=60)
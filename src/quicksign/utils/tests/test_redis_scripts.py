@@ -0,0 +1,30 @@
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import SimpleTestCase
+
+from quicksign.utils.async_redis import get_async_redis
+from quicksign.utils.redis_scripts import RedisScript
+
+ECHO_SCRIPT = RedisScript("return {KEYS[1], ARGV[1]}")
+
+
+class RedisScriptTestCase(SimpleTestCase):
+    def setUp(self):
+        self.client = cache.client.get_client()
+        self.client.script_flush()
+
+    def test_loads_missing_script(self):
+        self.assertEqual(ECHO_SCRIPT(self.client, keys=["key"], args=["value"]), [b"key", b"value"])
+        self.assertEqual(self.client.script_exists(ECHO_SCRIPT.sha), [True])
+
+    def test_pipeline(self):
+        pipe = self.client.pipeline(transaction=False)
+        ECHO_SCRIPT(pipe, keys=["a"], args=[1])
+        ECHO_SCRIPT(pipe, keys=["b"], args=[2])
+        self.assertEqual(pipe.execute(), [[b"a", b"1"], [b"b", b"2"]])
+
+    def test_async(self):
+        async def call():
+            return await ECHO_SCRIPT.acall(get_async_redis(), keys=["key"], args=["value"])
+
+        self.assertEqual(async_to_sync(call)(), [b"key", b"value"])
@@ -0,0 +1,115 @@
+import contextvars
+import time
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.db import DatabaseError
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from quicksign.apps.users.models import CustomUser
+from quicksign.utils import replicas
+from quicksign.utils.replicas import ReplicaMonitor, ReplicaRouter, StickyReads, use_primary
+
+REPLICATION = {'REPLICAS': ['replica_0'], 'MAX_LAG': 2.0, 'LAG_CHECK_INTERVAL': 1.0, 'STICKY_TTL': 10}
+
+
+def in_fresh_context(test):
+    # Writes by other tests pin their thread to the primary
+    def wrapper(*args, **kwargs):
+        return contextvars.Context().run(test, *args, **kwargs)
+    return wrapper
+
+
+@override_settings(DATABASE_REPLICATION=REPLICATION)
+class ReplicaRouterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.router = ReplicaRouter()
+        self.monitor = ReplicaMonitor(['replica_0'], max_lag=2.0, interval=1.0)
+        self.monitor.lags = {'replica_0': (0.1, time.monotonic())}
+        patcher = patch.object(replicas, 'get_replica_monitor', return_value=self.monitor)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @in_fresh_context
+    def test_reads_go_to_healthy_replica(self):
+        self.assertEqual(self.router.db_for_read(CustomUser), 'replica_0')
+        with use_primary():
+            self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+        with use_primary(False):
+            self.assertEqual(self.router.db_for_read(CustomUser), 'replica_0')
+
+    @in_fresh_context
+    def test_lagging_replica_falls_back_to_primary(self):
+        self.monitor.lags = {'replica_0': (5.0, time.monotonic())}
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+        self.assertEqual(self.monitor.stats()['fallbacks'], 1)
+
+    @in_fresh_context
+    def test_reads_after_write_go_to_primary(self):
+        self.assertEqual(self.router.db_for_write(CustomUser), 'default')
+        self.assertEqual(self.router.db_for_read(CustomUser), 'default')
+
+    def test_middleware_resets_per_request(self):
+        seen = []
+        middleware = replicas.replica_routing_middleware(lambda request: seen.append(replicas._use_primary.get()))
+
+        def handle_after_write():
+            self.router.db_for_write(CustomUser)
+            middleware(None)
+            return replicas._use_primary.get()
+
+        self.assertTrue(contextvars.Context().run(handle_after_write))
+        self.assertEqual(seen, [False])
+
+    def test_replicas_are_not_migrated(self):
+        self.assertFalse(self.router.allow_migrate('replica_0', 'users'))
+        self.assertIsNone(self.router.allow_migrate('default', 'users'))
+
+
+class ReplicaMonitorTestCase(TestCase):
+    def setUp(self):
+        self.monitor = ReplicaMonitor(['default'], max_lag=2.0, interval=1.0)
+
+    def test_measures_lag(self):
+        self.monitor.check()
+        self.assertEqual(self.monitor.lags['default'][0], 0)
+        self.assertEqual(self.monitor.healthy(), ['default'])
+
+    def test_unhealthy_replicas(self):
+        with patch.object(self.monitor, 'measure', return_value=5.0):
+            self.monitor.check()
+        self.assertEqual(self.monitor.healthy(), [])
+
+        with patch.object(self.monitor, 'measure', side_effect=DatabaseError('down')):
+            self.monitor.check()
+        self.assertEqual(self.monitor.healthy(), [])
+
+        # Not streaming from the primary
+        with patch.object(self.monitor, 'measure', return_value=None):
+            self.monitor.check()
+        self.assertEqual(self.monitor.healthy(), [])
+
+        # Checks that stopped reporting don't count
+        self.monitor.lags = {'default': (0.0, time.monotonic() - 10)}
+        self.assertEqual(self.monitor.healthy(), [])
+
+
+class StickyReadsTestCase(TestCase):
+    def tearDown(self):
+        cache.clear()
+
+    @override_settings(DATABASE_REPLICATION=REPLICATION)
+    def test_marked_phone_is_sticky(self):
+        self.assertFalse(StickyReads.is_sticky('+989123456789'))
+        StickyReads.mark('+989123456789')
+        self.assertTrue(StickyReads.is_sticky('+989111111111', '+989123456789'))
+        self.assertFalse(StickyReads.is_sticky('+989111111111'))
+
+    def test_disabled_without_replicas(self):
+        StickyReads.mark('+989123456789')
+        self.assertFalse(StickyReads.is_sticky('+989123456789'))
+
+    @override_settings(DATABASE_REPLICATION=REPLICATION)
+    def test_new_user_is_sticky(self):
+        CustomUser.objects.create_user(phone_number='09123450001', email='sticky@example.com', password='testPass123')
+        self.assertTrue(StickyReads.is_sticky('+989123450001'))
@@ -0,0 +1,72 @@
+from unittest.mock import patch
+
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+
+from quicksign.utils.revocation import RevocationFilter, TokenDenyList
+
+
+class RevocationFilterTestCase(SimpleTestCase):
+    def setUp(self):
+        self.filter = RevocationFilter(capacity=100, error_rate=0.01, rebuild_interval=60)
+
+    def test_cannot_answer_until_built(self):
+        self.filter.add("jti:a")
+        self.assertIsNone(self.filter.might_contain("jti:b"))
+
+        self.filter.rebuild(["jti:a"])
+        self.assertTrue(self.filter.might_contain("jti:a"))
+        self.assertFalse(self.filter.might_contain("jti:b"))
+
+        self.filter.reset()
+        self.assertIsNone(self.filter.might_contain("jti:b"))
+        self.assertEqual(self.filter.stats()["fallbacks"], 2)
+
+    def test_rebuild_drops_expired_items(self):
+        self.filter.rebuild(["jti:a", "jti:b"])
+        self.filter.rebuild(["jti:b"])
+        self.assertFalse(self.filter.might_contain("jti:a"))
+        self.assertEqual(self.filter.stats()["items"], 1)
+
+    def test_needs_rebuild(self):
+        with patch("quicksign.utils.revocation.time.monotonic", return_value=100):
+            self.filter.rebuild([])
+        with patch("quicksign.utils.revocation.time.monotonic", return_value=150):
+            self.assertFalse(self.filter.needs_rebuild())
+            self.filter.add(*[f"jti:{i}" for i in range(101)])
+            self.assertTrue(self.filter.needs_rebuild())
+        self.filter.rebuild([])
+        with patch("quicksign.utils.revocation.time.monotonic", return_value=self.filter.built_at + 61):
+            self.assertTrue(self.filter.needs_rebuild())
+
+
+class TokenDenyListTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_revoke_once(self):
+        self.assertFalse(TokenDenyList.is_revoked("jti:a"))
+        self.assertTrue(TokenDenyList.revoke("jti:a", ttl=60))
+        self.assertFalse(TokenDenyList.revoke("jti:a", ttl=60))
+        self.assertTrue(TokenDenyList.is_revoked("jti:a"))
+        self.assertLessEqual(cache.ttl(TokenDenyList.key("jti:a")), 60)
+
+    def test_active_items(self):
+        TokenDenyList.revoke("jti:a", ttl=60)
+        redis_client = cache.client.get_client()
+        redis_client.zadd(TokenDenyList.index_key(), {"jti:expired": 1})
+
+        self.assertEqual(TokenDenyList.active_items(), ["jti:a"])
+
+    def test_local_filter_answers_without_redis(self):
+        local_filter = RevocationFilter(capacity=100, error_rate=0.001, rebuild_interval=60)
+        local_filter.rebuild([])
+        with patch.object(TokenDenyList, "local_filter", return_value=local_filter):
+            TokenDenyList.revoke("jti:a", ttl=60)
+            with patch.object(cache, "has_key") as has_key:
+                self.assertFalse(TokenDenyList.is_revoked("jti:b"))
+            has_key.assert_not_called()
+            self.assertTrue(TokenDenyList.is_revoked("jti:a"))
@@ -1,9 +1,15 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import FrozenInstanceError
 from unittest.mock import patch
 
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
 from django.core.cache import cache
 
-from quicksign.utils.services import BlockService, OTPService
+from quicksign.utils import metrics
+from quicksign.utils.localcache import publish_invalidation
+from quicksign.utils.services import AttemptResult, BlockService, BlockStatus, OTPService
 
 
 
@@ -61,6 +67,29 @@ class BlockServiceTestCase(TestCase):
         BlockService.increment_attempts(self.phone_number, self.ip_address)
         self.assertTrue(BlockService.is_blocked(phone_number=self.phone_number))
 
+    def test_record_failed_attempt(self):
+        """Test failed attempt result carries attempts, block flag and TTL"""
+        result = BlockService.record_failed_attempt(self.phone_number, self.ip_address)
+        self.assertEqual(result, AttemptResult(attempts=1, is_blocked=False, block_time_left=0))
+
+        BlockService.record_failed_attempt(self.phone_number, self.ip_address)
+        result = BlockService.record_failed_attempt(self.phone_number, self.ip_address)
+        self.assertEqual(result.attempts, 3)
+        self.assertTrue(result.is_blocked)
+        self.assertEqual(result.block_time_left, 3600)
+        self.assertTrue(BlockService.is_blocked(phone_number=self.phone_number))
+        self.assertTrue(BlockService.is_blocked(ip_address=self.ip_address))
+        self.assertEqual(cache.get(f"failed_attempts_{self.ip_address}"), 3)
+
+    def test_record_failed_attempt_concurrent(self):
+        """Test concurrent failures never lose an increment"""
+        with patch.object(BlockService, 'max_attempts', 1000), ThreadPoolExecutor(max_workers=8) as executor:
+            list(executor.map(
+                lambda _: BlockService.record_failed_attempt(self.phone_number, self.ip_address),
+                range(50)
+            ))
+        self.assertEqual(cache.get(f"failed_attempts_{self.ip_address}"), 50)
+
     def test_reset_attempts(self):
         """Test resetting failed attempts"""
         BlockService.increment_attempts(self.phone_number, self.ip_address)
@@ -81,6 +110,22 @@ class BlockServiceTestCase(TestCase):
         self.assertTrue(status['is_blocked'])
         self.assertGreater(status['block_time_left'], 0)
 
+    def test_get_status(self):
+        """Test status snapshot combines phone block, IP block and attempts"""
+        BlockService.increment_attempts(self.phone_number, self.ip_address)
+        status = BlockService.get_status(self.phone_number, self.ip_address)
+        self.assertEqual(status, BlockStatus(is_blocked=False, attempts=1, block_time_left=0))
+        self.assertEqual(status.remaining_attempts, 2)
+
+        BlockService.block_user(ip_address=self.ip_address)
+        status = BlockService.get_status(self.phone_number, self.ip_address)
+        self.assertTrue(status.is_blocked)
+        self.assertEqual(status.remaining_attempts, 0)
+        self.assertGreater(status.block_time_left, 0)
+
+        with self.assertRaises(FrozenInstanceError):
+            status.is_blocked = False
+
     def test_validation_errors(self):
         """Test validation for required phone or IP"""
         with self.assertRaises(ValueError):
@@ -92,10 +137,64 @@ class BlockServiceTestCase(TestCase):
         with self.assertRaises(ValueError):
             BlockService.unblock_user()
 
+        with self.assertRaises(ValueError):
+            BlockService.get_status()
+
     def tearDown(self):
         cache.clear()
 
 
+@override_settings(BLOCK_STATUS_LOCAL_CACHE={'ENABLED': True, 'MAX_SIZE': 100, 'TTL': 60})
+class BlockServiceLocalCacheTestCase(TestCase):
+    def setUp(self):
+        self.phone_number = '+989123456789'
+        self.ip_address = '192.168.1.1'
+        cache.clear()
+        self.local_cache = BlockService.local_cache()
+        self.local_cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_not_blocked_answer_is_cached(self):
+        """Second lookup for an unblocked subject skips Redis"""
+        BlockService.get_status(self.phone_number, self.ip_address)
+        with patch.object(cache.client, "get_client", side_effect=AssertionError("Redis hit")):
+            status = BlockService.get_status(self.phone_number, self.ip_address)
+        self.assertFalse(status.is_blocked)
+        self.assertGreaterEqual(metrics.snapshot()["block_status_local_cache"]["hits"], 2)
+
+    def test_block_user_invalidates(self):
+        BlockService.get_status(self.phone_number, self.ip_address)
+        BlockService.block_user(phone_number=self.phone_number, ip_address=self.ip_address)
+        self.assertTrue(BlockService.get_status(self.phone_number, self.ip_address).is_blocked)
+
+    def test_auto_block_invalidates(self):
+        BlockService.get_status(self.phone_number, self.ip_address)
+        for _ in range(BlockService.max_attempts):
+            BlockService.record_failed_attempt(self.phone_number, self.ip_address)
+        self.assertTrue(BlockService.get_status(self.phone_number, self.ip_address).is_blocked)
+
+    def test_invalidation_from_other_process(self):
+        """A block published by another worker drops the local entry"""
+        BlockService.get_status(ip_address=self.ip_address)
+        self.assertTrue(self.local_cache.get(f"ip:{self.ip_address}"))
+
+        channel = BlockService.invalidation_channel()
+        deadline = time.monotonic() + 2
+        while not cache.client.get_client().pubsub_numsub(channel)[0][1] and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        # Simulate another worker blocking the IP without touching this cache
+        cache.set(f"ip_blocked_{self.ip_address}", True, timeout=60)
+        publish_invalidation(channel, f"ip:{self.ip_address}")
+
+        deadline = time.monotonic() + 2
+        while self.local_cache.get(f"ip:{self.ip_address}") and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(BlockService.is_blocked(ip_address=self.ip_address))
+
+
 class OTPServiceTestCase(TestCase):
     def setUp(self):
         self.phone_number = "+989123456789"
@@ -127,6 +226,35 @@ class OTPServiceTestCase(TestCase):
             verification_code=cache.get(f"verification_code_{self.phone_number}")
         )
 
+    @patch("quicksign.apps.users.tasks.send_verification_code.delay")
+    def test_send_otp_code_cooldown(self, mock_send_verification):
+        """تست جلوگیری از ارسال مجدد کد در بازه انتظار"""
+        first = OTPService.send_otp_code(self.phone_number)
+        code = cache.get(f"verification_code_{self.phone_number}")
+        second = OTPService.send_otp_code(self.phone_number)
+
+        mock_send_verification.assert_called_once()
+        self.assertEqual(cache.get(f"verification_code_{self.phone_number}"), code)
+        self.assertEqual(first["data"]["retry_after"], 60)
+        self.assertGreater(second["data"]["retry_after"], 0)
+        self.assertLessEqual(second["data"]["retry_after"], 60)
+
+    @patch("quicksign.apps.users.tasks.send_verification_code.delay")
+    def test_send_otp_code_concurrent(self, mock_send_verification):
+        with ThreadPoolExecutor(max_workers=10) as executor:
+            list(executor.map(lambda _: OTPService.send_otp_code(self.phone_number), range(20)))
+
+        mock_send_verification.assert_called_once()
+
+    async def test_async_generate_and_validate(self):
+        """Codes written by the async client are readable through the cache"""
+        code = await OTPService.agenerate_code(self.phone_number)
+        self.assertEqual(cache.get(f"verification_code_{self.phone_number}"), code)
+
+        self.assertFalse(await OTPService.avalidate_code(self.phone_number, "000000"))
+        self.assertTrue(await OTPService.avalidate_code(self.phone_number, code))
+        self.assertFalse(await OTPService.avalidate_code(self.phone_number, code))
+
     def test_validate_code_correct(self):
         """تست صحت سنجی کد صحیح"""
         cache.set(f"verification_code_{self.phone_number}", self.valid_code, timeout=120)
@@ -142,13 +270,111 @@ class OTPServiceTestCase(TestCase):
 
         self.assertFalse(is_valid)
 
+    def test_validate_code_consumed(self):
+        """A correct code can only be used once"""
+        cache.set(f"verification_code_{self.phone_number}", self.valid_code, timeout=120)
+
+        self.assertTrue(OTPService.validate_code(self.phone_number, self.valid_code))
+        self.assertFalse(OTPService.validate_code(self.phone_number, self.valid_code))
+        self.assertIsNone(cache.get(f"verification_code_{self.phone_number}"))
+
+    def test_validate_code_invalidated_after_wrong_guesses(self):
+        """The code is burned once wrong guesses run out"""
+        cache.set(f"verification_code_{self.phone_number}", self.valid_code, timeout=120)
+
+        for _ in range(OTPService.max_wrong_guesses):
+            self.assertFalse(OTPService.validate_code(self.phone_number, "654321"))
+
+        self.assertFalse(OTPService.validate_code(self.phone_number, self.valid_code))
+        self.assertIsNone(cache.get(f"verification_guesses_{self.phone_number}"))
+
     @patch("quicksign.utils.services.logger.info")
     def test_validate_code_redis_error(self, mock_logger):
         """تست خطای ردیس در هنگام صحت سنجی"""
-        with patch("django.core.cache.cache.get", side_effect=Exception("Redis Error")):
+        with patch.object(cache.client, "get_client", side_effect=Exception("Redis Error")):
             is_valid = OTPService.validate_code(self.phone_number, self.valid_code)
 
             self.assertFalse(is_valid)
             mock_logger.assert_called_once_with("Redis Error: Redis Error")
 
 
+
+
+@override_settings(OTP_CODES={'MODE': 'hmac', 'SECRET': 'test-secret', 'STEP': 120})
+class HMACOTPServiceTestCase(TestCase):
+    def setUp(self):
+        self.phone_number = "+989123456789"
+        cache.clear()
+
+    def tearDown(self):
+        cache.clear()
+
+    def test_generate_code_writes_only_send_counter(self):
+        code = OTPService.generate_code(self.phone_number)
+
+        self.assertRegex(code, r"^[1-9]\d{5}$")
+        self.assertEqual(code, OTPService.derive_code(self.phone_number, OTPService.current_step(), 1))
+        self.assertEqual(cache.keys("*"), [f"verification_sends_{self.phone_number}"])
+
+    def test_resend_in_same_step_gets_new_code(self):
+        """A code consumed in this step is not sent again"""
+        code = OTPService.generate_code(self.phone_number)
+        self.assertTrue(OTPService.validate_code(self.phone_number, code))
+
+        resent_code = OTPService.generate_code(self.phone_number)
+        self.assertNotEqual(resent_code, code)
+        self.assertTrue(OTPService.validate_code(self.phone_number, resent_code))
+        self.assertFalse(OTPService.validate_code(self.phone_number, resent_code))
+
+    def test_resend_replaces_previous_code(self):
+        code = OTPService.generate_code(self.phone_number)
+        resent_code = OTPService.generate_code(self.phone_number)
+
+        self.assertFalse(OTPService.validate_code(self.phone_number, code))
+        self.assertTrue(OTPService.validate_code(self.phone_number, resent_code))
+
+    def test_async_resend_in_same_step_gets_new_code(self):
+        async def send_and_validate():
+            code = await OTPService.agenerate_code(self.phone_number)
+            valid = await OTPService.avalidate_code(self.phone_number, code)
+            resent_code = await OTPService.agenerate_code(self.phone_number)
+            return code, valid, resent_code, await OTPService.avalidate_code(self.phone_number, resent_code)
+
+        code, valid, resent_code, resent_valid = async_to_sync(send_and_validate)()
+        self.assertTrue(valid)
+        self.assertNotEqual(resent_code, code)
+        self.assertTrue(resent_valid)
+
+    def test_codes_differ_per_phone_and_step(self):
+        step = OTPService.current_step()
+        code = OTPService.derive_code(self.phone_number, step)
+
+        self.assertNotEqual(code, OTPService.derive_code("+989111111111", step))
+        self.assertNotEqual(code, OTPService.derive_code(self.phone_number, step + 1))
+
+    def test_validate_code_consumed_once(self):
+        code = OTPService.generate_code(self.phone_number)
+
+        self.assertTrue(OTPService.validate_code(self.phone_number, code))
+        self.assertFalse(OTPService.validate_code(self.phone_number, code))
+
+    def test_previous_step_accepted(self):
+        step = OTPService.current_step()
+        previous_code = OTPService.derive_code(self.phone_number, step - 1)
+        expired_code = OTPService.derive_code(self.phone_number, step - 2)
+
+        self.assertFalse(OTPService.validate_code(self.phone_number, expired_code))
+        self.assertTrue(OTPService.validate_code(self.phone_number, previous_code))
+
+    def test_older_step_rejected_after_newer_consumed(self):
+        step = OTPService.current_step()
+        self.assertTrue(OTPService.validate_code(self.phone_number, OTPService.derive_code(self.phone_number, step)))
+        self.assertFalse(OTPService.validate_code(self.phone_number, OTPService.derive_code(self.phone_number, step - 1)))
+
+    def test_locked_out_after_wrong_guesses(self):
+        code = OTPService.generate_code(self.phone_number)
+        wrong_code = "100000" if code != "100000" else "100001"
+        for _ in range(OTPService.max_wrong_guesses):
+            self.assertFalse(OTPService.validate_code(self.phone_number, wrong_code))
+
+        self.assertFalse(OTPService.validate_code(self.phone_number, code))
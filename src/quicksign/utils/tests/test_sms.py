@@ -0,0 +1,165 @@
+import asyncio
+import time
+
+from django.test import SimpleTestCase, override_settings
+
+from quicksign.apps.users.tasks import send_verification_code
+from quicksign.utils.sms import (AsyncHTTPSMSProvider, CircuitBreaker, CircuitOpenError,
+                                 HTTPSMSProvider, SMSDeliveryError, SMSMessage, SMSOutcomeUnknownError,
+                                 SMSRejectedError, get_sms_provider)
+from quicksign.utils.sms.fake import FakeSMSProviderServer
+
+
+class SMSProviderTestCase(SimpleTestCase):
+    def setUp(self):
+        self.server = FakeSMSProviderServer().start()
+        self.options = {
+            "base_url": self.server.url,
+            "api_key": "test-key",
+            "max_retries": 2,
+            "backoff_base": 0.001,
+            "failure_threshold": 2,
+            "reset_timeout": 60,
+        }
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_send(self):
+        provider = HTTPSMSProvider(**self.options)
+        result = provider.send("+989123456789", "code 123456")
+
+        self.assertTrue(result.success)
+        self.assertTrue(result.message_id)
+        self.assertEqual(self.server.messages, [{"to": "+989123456789", "text": "code 123456"}])
+
+    def test_retries_transient_errors(self):
+        self.server.fail_next = 2
+        provider = HTTPSMSProvider(**self.options)
+
+        self.assertTrue(provider.send("+989123456789", "code").success)
+        self.assertEqual(len(self.server.requests), 3)
+
+    def test_connection_failures_are_retried(self):
+        provider = HTTPSMSProvider(**{**self.options, "base_url": "http://127.0.0.1:1"})
+        with self.assertRaises(SMSDeliveryError) as raised:
+            provider.send("+989123456789", "code")
+        self.assertTrue(raised.exception.temporary)
+
+    def test_possibly_accepted_requests_are_not_resent(self):
+        """A timeout or 500 after the request reached the provider is not retried"""
+        self.server.latency = 0.2
+        provider = HTTPSMSProvider(**{**self.options, "timeout": 0.05})
+        with self.assertRaises(SMSOutcomeUnknownError) as raised:
+            provider.send("+989123456789", "code")
+        self.assertFalse(raised.exception.temporary)
+        self.assertEqual(len(self.server.requests), 1)
+
+        self.server.latency = 0
+        self.server.fail_next = 1
+        self.server.fail_status = 500
+        with self.assertRaises(SMSOutcomeUnknownError):
+            HTTPSMSProvider(**self.options).send("+989123456789", "code")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_circuit_opens_after_repeated_failures(self):
+        self.server.fail_next = 100
+        provider = HTTPSMSProvider(**self.options)
+
+        for _ in range(2):
+            with self.assertRaises(SMSDeliveryError):
+                provider.send("+989123456789", "code")
+        requests_made = len(self.server.requests)
+
+        with self.assertRaises(CircuitOpenError):
+            provider.send("+989123456789", "code")
+        self.assertEqual(len(self.server.requests), requests_made)
+
+    def test_bulk_reports_per_message_results(self):
+        self.server.rejected_numbers = {"+989000000000"}
+        provider = HTTPSMSProvider(**self.options)
+        results = provider.send_bulk([
+            SMSMessage("+989123456789", "a"),
+            SMSMessage("+989000000000", "b"),
+        ])
+
+        self.assertEqual([result.success for result in results], [True, False])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_bulk_reports_unanswered_messages_as_failed(self):
+        messages = [SMSMessage("+989123456789", "a"), SMSMessage("+989123456788", "b")]
+        results = HTTPSMSProvider.bulk_results(messages, {"results": [{"id": 1, "status": "accepted"}]})
+
+        self.assertEqual([(result.phone_number, result.success) for result in results],
+                         [("+989123456789", True), ("+989123456788", False)])
+        self.assertEqual(results[1].error, "missing_result")
+
+    def test_client_errors_are_not_temporary(self):
+        provider = HTTPSMSProvider(**{**self.options, "base_url": f"{self.server.url}/missing"})
+        with self.assertRaises(SMSRejectedError) as raised:
+            provider.send("+989123456789", "code")
+        self.assertFalse(raised.exception.temporary)
+
+    def test_async_sends_concurrently(self):
+        self.server.latency = 0.2
+        provider = AsyncHTTPSMSProvider(max_in_flight=50, **self.options)
+        messages = [SMSMessage(f"+98912345{i:04d}", "code") for i in range(50)]
+
+        async def send_all():
+            try:
+                return await provider.send_many(messages)
+            finally:
+                await provider.aclose()
+
+        start = time.monotonic()
+        results = asyncio.run(send_all())
+
+        self.assertTrue(all(result.success for result in results))
+        self.assertLess(time.monotonic() - start, 2)
+
+    def test_verification_task_uses_configured_provider(self):
+        sms_provider = {
+            "BACKEND": "quicksign.utils.sms.HTTPSMSProvider",
+            "ASYNC_BACKEND": "quicksign.utils.sms.AsyncHTTPSMSProvider",
+            "OPTIONS": self.options,
+        }
+        get_sms_provider.cache_clear()
+        try:
+            with override_settings(SMS_PROVIDER=sms_provider):
+                message_id = send_verification_code(phone_number="+989123456789", verification_code="123456")
+        finally:
+            get_sms_provider.cache_clear()
+
+        self.assertTrue(message_id)
+        self.assertIn("123456", self.server.messages[0]["text"])
+
+    def test_verification_task_leaves_retries_to_the_provider(self):
+        sms_provider = {
+            "BACKEND": "quicksign.utils.sms.HTTPSMSProvider",
+            "ASYNC_BACKEND": "quicksign.utils.sms.AsyncHTTPSMSProvider",
+            "OPTIONS": {**self.options, "failure_threshold": 10},
+        }
+        self.server.fail_next = 100
+        get_sms_provider.cache_clear()
+        try:
+            with override_settings(SMS_PROVIDER=sms_provider):
+                result = send_verification_code.apply(
+                    kwargs={"phone_number": "+989123456789", "verification_code": "123456"}
+                )
+        finally:
+            get_sms_provider.cache_clear()
+
+        self.assertIsNone(result.get())
+        # One try and max_retries retries, all by the provider
+        self.assertEqual(len(self.server.requests), 3)
+
+
+class CircuitBreakerTestCase(SimpleTestCase):
+    def test_half_open_after_reset_timeout(self):
+        breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "half_open")
+
+        breaker.before_call()
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")